@@ -0,0 +1,89 @@
+"""
+Service Dependencies
+====================
+Application-scoped service instances. They are created once per worker in the
+lifespan hook, stored on app.state, and injected into route handlers with
+Depends so caches, pools and clients outlive a single request.
+"""
+
+import inspect
+import logging
+
+from fastapi import FastAPI, Request
+
+from services.forecast_service import ForecastService
+from services.anomaly_service import AnomalyService
+from services.budget_service import BudgetService
+from services.insight_service import InsightService
+from services.batch_engine import BatchPredictEngine
+from services.streaming_anomaly import StreamingAnomalyDetector
+from services.job_queue import JobQueue
+from services.job_handlers import register_job_handlers
+
+logger = logging.getLogger(__name__)
+
+# app.state attribute -> factory; closed in reverse order on shutdown
+SERVICE_FACTORIES = {
+    "forecast_service": ForecastService,
+    "batch_engine": BatchPredictEngine,
+    "anomaly_service": AnomalyService,
+    "stream_detector": StreamingAnomalyDetector,
+    "budget_service": BudgetService,
+    "insight_service": InsightService,
+    "job_queue": JobQueue,
+}
+
+
+def create_services(app: FastAPI) -> None:
+    for name, factory in SERVICE_FACTORIES.items():
+        setattr(app.state, name, factory())
+    app.state.stream_detector.restore()
+    register_job_handlers(
+        app.state.job_queue,
+        forecast_service=app.state.forecast_service,
+        batch_engine=app.state.batch_engine,
+        anomaly_service=app.state.anomaly_service,
+        budget_service=app.state.budget_service,
+    )
+
+
+async def close_services(app: FastAPI) -> None:
+    for name in reversed(list(SERVICE_FACTORIES)):
+        service = getattr(app.state, name, None)
+        close = getattr(service, "close", None)
+        if close is None:
+            continue
+        try:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"Error shutting down {name}: {e}")
+
+
+def get_forecast_service(request: Request) -> ForecastService:
+    return request.app.state.forecast_service
+
+
+def get_batch_engine(request: Request) -> BatchPredictEngine:
+    return request.app.state.batch_engine
+
+
+def get_anomaly_service(request: Request) -> AnomalyService:
+    return request.app.state.anomaly_service
+
+
+def get_stream_detector(request: Request) -> StreamingAnomalyDetector:
+    return request.app.state.stream_detector
+
+
+def get_budget_service(request: Request) -> BudgetService:
+    return request.app.state.budget_service
+
+
+def get_insight_service(request: Request) -> InsightService:
+    return request.app.state.insight_service
+
+
+def get_job_queue(request: Request) -> JobQueue:
+    return request.app.state.job_queue
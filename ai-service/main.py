@@ -5,16 +5,62 @@ FastAPI-based AI service for predictive analytics, anomaly detection,
 budget optimization, and natural language insights.
 """
 
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Depends, Security
 from fastapi.security import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import logging
+
+from dependencies import create_services, close_services
+from services.fast_json import FastJSONResponse, FastJSONRoute
+
+logger = logging.getLogger(__name__)
+
+# Optional backends imported during startup (comma-separated, or "none")
+PRELOAD_BACKENDS = os.getenv("AI_PRELOAD_BACKENDS", "pandas,prophet,xgboost,sklearn")
+
+startup_report = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the worker before it accepts traffic, then create the shared services."""
+    from services import backends
+
+    started = time.perf_counter()
+    names = [] if PRELOAD_BACKENDS.strip().lower() == "none" else [
+        name.strip() for name in PRELOAD_BACKENDS.split(",") if name.strip()
+    ]
+    backends.preload(names)
+
+    startup_report.update({
+        "app_import_seconds": round(_app_imported - _import_started, 4),
+        "preload_seconds": round(time.perf_counter() - started, 4),
+        "preloaded_backends": names,
+    })
+    logger.info(f"AI service warm in {startup_report['app_import_seconds'] + startup_report['preload_seconds']:.2f}s")
+
+    create_services(app)
+    try:
+        yield
+    finally:
+        await close_services(app)
+
 
 app = FastAPI(
     title="ParamAds AI Service",
     description="Predictive AI layer for ParamAds performance marketing platform",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
+# Encode endpoint results with orjson instead of jsonable_encoder
+app.router.route_class = FastJSONRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,13 +85,28 @@ async def health_check():
     return {"status": "healthy", "service": "paramads-ai"}
 
 
+@app.get("/health/startup")
+async def startup_timings():
+    """Cold-start breakdown for this worker: app and service imports, then backend preloads."""
+    from services import backends
+
+    return {
+        "pid": os.getpid(),
+        **startup_report,
+        "backends": backends.import_report(),
+    }
+
+
 # Import routers
-from routers import forecast, anomaly, budget, insights
+from routers import forecast, anomaly, budget, insights, jobs
 
 app.include_router(forecast.router, prefix="/api/v1/forecast", tags=["Forecasting"])
 app.include_router(anomaly.router, prefix="/api/v1/anomaly", tags=["Anomaly Detection"])
 app.include_router(budget.router, prefix="/api/v1/budget", tags=["Budget Optimization"])
 app.include_router(insights.router, prefix="/api/v1/insights", tags=["NL Insights"])
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["Jobs"])
+
+_app_imported = time.perf_counter()
 
 if __name__ == "__main__":
     import uvicorn
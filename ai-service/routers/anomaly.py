@@ -5,19 +5,44 @@ Detect sudden CPC spikes, ROAS drops, CTR crashes.
 Supports single-metric, multi-metric, and batch detection.
 """
 
-from fastapi import APIRouter
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 
-router = APIRouter()
+from dependencies import get_anomaly_service, get_stream_detector
+from services.anomaly_service import AnomalyService
+from services.streaming_anomaly import StreamingAnomalyDetector
+from services.series import Series, resolve_series
+from services.bulk_io import NDJSON_MEDIA_TYPE, DuplexStreamingResponse, iter_records, ndjson_line, error_line, parse_series_record
+from services.fast_json import FastJSONRoute
+
+router = APIRouter(route_class=FastJSONRoute)
+
+# Series detected together per vectorized detect_batch call in bulk-detect
+BULK_DETECT_BATCH = int(os.getenv("ANOMALY_BULK_BATCH", "256"))
 
 
 class AnomalyRequest(BaseModel):
     campaign_id: int
     metric: str
-    data_points: List[dict]  # [{date, value}, ...]
+    data_points: Optional[List[dict]] = None  # [{date, value}, ...]
+    # Columnar alternative to data_points: dense values from start_date
+    values: Optional[List[float]] = None
+    start_date: Optional[str] = None  # YYYY-MM-DD
+    freq: str = "D"  # D, W
     sensitivity: float = 2.0
     method: str = "ensemble"  # zscore, rolling, isolation_forest, ensemble
+    window: Optional[int] = None  # rolling window size, defaults to min(7, n // 2)
+    rolling_stat: str = "mean"  # mean (mean/std), median (robust median/MAD)
+    platform: Optional[str] = None  # meta, google; selects the pooled Isolation Forest
+
+    def series(self):
+        try:
+            return resolve_series(self.data_points, self.values, self.start_date, self.freq)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
 
 
 class MultiMetricAnomalyRequest(BaseModel):
@@ -27,26 +52,62 @@ class MultiMetricAnomalyRequest(BaseModel):
 
 
 @router.post("/detect")
-async def detect_anomalies(request: AnomalyRequest):
+async def detect_anomalies(request: AnomalyRequest, service: AnomalyService = Depends(get_anomaly_service)):
     """Detect anomalies in campaign metric data."""
-    from services.anomaly_service import AnomalyService
-
-    service = AnomalyService()
     return service.detect(
         campaign_id=request.campaign_id,
         metric=request.metric,
-        data_points=request.data_points,
+        data_points=request.series(),
         sensitivity=request.sensitivity,
         method=request.method,
+        window=request.window,
+        rolling_stat=request.rolling_stat,
+        platform=request.platform,
+    )
+
+
+@router.post("/detect-binary")
+async def detect_anomalies_binary(
+    request: Request,
+    campaign_id: int,
+    metric: str,
+    start_date: str,
+    freq: str = "D",
+    sensitivity: float = 2.0,
+    method: str = "ensemble",
+    window: Optional[int] = None,
+    rolling_stat: str = "mean",
+    platform: Optional[str] = None,
+    service: AnomalyService = Depends(get_anomaly_service),
+):
+    """
+    Detect anomalies in a binary body: raw little-endian float64 values
+    (application/octet-stream) or an Arrow IPC stream with a "value" column.
+    """
+    try:
+        series = Series.from_bytes(await request.body(), start_date, freq, request.headers.get("content-type"))
+    except ImportError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return service.detect(
+        campaign_id=campaign_id,
+        metric=metric,
+        data_points=series,
+        sensitivity=sensitivity,
+        method=method,
+        window=window,
+        rolling_stat=rolling_stat,
+        platform=platform,
     )
 
 
 @router.post("/detect-multi")
-async def detect_multi_metric(request: MultiMetricAnomalyRequest):
+async def detect_multi_metric(
+    request: MultiMetricAnomalyRequest,
+    service: AnomalyService = Depends(get_anomaly_service),
+):
     """Detect anomalies across multiple metrics with correlation analysis."""
-    from services.anomaly_service import AnomalyService
-
-    service = AnomalyService()
     return service.detect_multi_metric(
         campaign_id=request.campaign_id,
         metrics_data=request.metrics_data,
@@ -55,19 +116,114 @@ async def detect_multi_metric(request: MultiMetricAnomalyRequest):
 
 
 @router.post("/batch-detect")
-async def batch_detect(requests: List[AnomalyRequest]):
+async def batch_detect(requests: List[AnomalyRequest], service: AnomalyService = Depends(get_anomaly_service)):
     """Detect anomalies across multiple campaigns."""
-    from services.anomaly_service import AnomalyService
-
-    service = AnomalyService()
-    results = []
-    for req in requests:
-        result = service.detect(
-            campaign_id=req.campaign_id,
-            metric=req.metric,
-            data_points=req.data_points,
-            sensitivity=req.sensitivity,
-            method=req.method,
-        )
-        results.append(result)
+    results = service.detect_batch([
+        {
+            "campaign_id": req.campaign_id,
+            "metric": req.metric,
+            "data_points": req.series(),
+            "sensitivity": req.sensitivity,
+            "method": req.method,
+            "window": req.window,
+            "rolling_stat": req.rolling_stat,
+            "platform": req.platform,
+        }
+        for req in requests
+    ])
     return {"results": results}
+
+
+@router.post("/bulk-detect")
+async def bulk_detect(request: Request, service: AnomalyService = Depends(get_anomaly_service)):
+    """
+    Streaming batch detection. The body is NDJSON (one AnomalyRequest per line)
+    or an Arrow IPC stream; series are detected in vectorized groups of
+    ANOMALY_BULK_BATCH and each result is written as an NDJSON line tagged
+    with its input index.
+    """
+    async def run(batch):
+        results = await run_in_threadpool(service.detect_batch, [item for _, item in batch])
+        return b"".join(ndjson_line({"index": index, **result}) for (index, _), result in zip(batch, results))
+
+    async def results():
+        batch = []
+        async for index, record, error in iter_records(request.stream(), request.headers.get("content-type")):
+            if error is None:
+                try:
+                    req, series = parse_series_record(record, AnomalyRequest, "data_points")
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                yield error_line(index, record, error)
+                continue
+            batch.append((index, {
+                "campaign_id": req.campaign_id,
+                "metric": req.metric,
+                "data_points": series,
+                "sensitivity": req.sensitivity,
+                "method": req.method,
+                "window": req.window,
+                "rolling_stat": req.rolling_stat,
+                "platform": req.platform,
+            }))
+            if len(batch) >= BULK_DETECT_BATCH:
+                yield await run(batch)
+                batch = []
+        if batch:
+            yield await run(batch)
+
+    return DuplexStreamingResponse(results(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.get("/isolation-pool/stats")
+async def isolation_pool_stats(service: AnomalyService = Depends(get_anomaly_service)):
+    """Report pooled Isolation Forests, their training size and anomaly rates."""
+    if service.isolation_pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **service.isolation_pool.stats()}
+
+
+class StreamRequest(BaseModel):
+    campaign_id: int
+    metric: str
+    points: List[dict]  # only the new [{date, value}, ...] since the last push
+    sensitivity: float = 2.0
+
+
+@router.post("/stream")
+async def stream_detect(
+    request: StreamRequest,
+    detector: StreamingAnomalyDetector = Depends(get_stream_detector),
+):
+    """Score newly arrived points against the stored per-series online state."""
+    # The shared state store may wait on another worker's write
+    return await run_in_threadpool(
+        detector.push,
+        campaign_id=request.campaign_id,
+        metric=request.metric,
+        points=request.points,
+        sensitivity=request.sensitivity,
+    )
+
+
+@router.delete("/stream/{campaign_id}/{metric}")
+async def stream_evict(
+    campaign_id: int,
+    metric: str,
+    detector: StreamingAnomalyDetector = Depends(get_stream_detector),
+):
+    """Drop the online state for one series."""
+    return {"evicted": detector.evict(campaign_id, metric)}
+
+
+@router.post("/stream/snapshot")
+async def stream_snapshot(detector: StreamingAnomalyDetector = Depends(get_stream_detector)):
+    """Export all streaming state to a JSON file on local disk."""
+    return detector.snapshot()
+
+
+@router.get("/stream/stats")
+async def stream_stats(detector: StreamingAnomalyDetector = Depends(get_stream_detector)):
+    """Report how many series are tracked and eviction counters."""
+    return detector.stats()
@@ -1,14 +1,21 @@
 """
 Budget Optimization Router
 ==========================
-Cross-platform budget allocation and redistribution recommendations.
+Cross-platform budget allocation and redistribution recommendations, plus
+what-if sessions that re-optimize a kept portfolio from small deltas.
 """
 
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, confloat, conint
+from typing import Dict, List, Optional
 
-router = APIRouter()
+from dependencies import get_budget_service
+from services.budget_service import BudgetService
+from services.fast_json import FastJSONRoute
+from services.budget_simulation import SIM_MAX_DRAWS
+
+router = APIRouter(route_class=FastJSONRoute)
 
 
 class CampaignPerformance(BaseModel):
@@ -20,6 +27,8 @@ class CampaignPerformance(BaseModel):
     roas: float
     cpa: float
     conversions: int
+    min_budget: Optional[float] = None  # floor for the recommendation
+    max_budget: Optional[float] = None  # ceiling; defaults to a multiple of current budget
 
 
 class BudgetRequest(BaseModel):
@@ -27,6 +36,11 @@ class BudgetRequest(BaseModel):
     total_budget: float
     campaigns: List[CampaignPerformance]
     optimization_goal: str = "roas"  # roas, cpa, conversions
+    platform_caps: Optional[Dict[str, float]] = None  # max total budget per platform
+    budget_step: confloat(gt=0) = 0.01  # recommendations are multiples of this
+    simulation_draws: conint(ge=0, le=SIM_MAX_DRAWS) = 0  # Monte Carlo draws; 0 = no simulation
+    seed: Optional[conint(ge=0)] = None  # fixes the draws; reported back when omitted
+    target_roas: Optional[float] = None  # simulated probability of reaching it (roas goal)
 
 
 class BudgetRecommendation(BaseModel):
@@ -35,6 +49,7 @@ class BudgetRecommendation(BaseModel):
     current_budget: float
     recommended_budget: float
     change_percent: float
+    marginal_return: Optional[float] = None  # return on the next dollar at the recommended budget
     reason: str
 
 
@@ -43,19 +58,138 @@ class BudgetResponse(BaseModel):
     total_budget: float
     recommendations: List[BudgetRecommendation]
     expected_improvement: dict
+    unallocated_budget: float = 0.0  # left over when ceilings and caps cannot absorb the budget
     summary: str
+    simulation: Optional[dict] = None  # percentile bands for the current and recommended allocations
+
+
+class BudgetSessionResponse(BudgetResponse):
+    session_id: str
+    version: int
+
+
+class CampaignDelta(BaseModel):
+    campaign_id: int
+    # Refreshed performance; omitted fields keep their session values
+    current_budget: Optional[float] = None
+    spend: Optional[float] = None
+    revenue: Optional[float] = None
+    roas: Optional[float] = None
+    cpa: Optional[float] = None
+    conversions: Optional[int] = None
+    # Constraints; an explicit null clears them
+    min_budget: Optional[float] = None
+    max_budget: Optional[float] = None
+    locked_budget: Optional[float] = None  # pin the recommendation to this amount
+
+
+class BudgetDelta(BaseModel):
+    total_budget: Optional[float] = None
+    campaigns: List[CampaignDelta] = []
+    platform_caps: Optional[Dict[str, Optional[float]]] = None  # null removes a platform's cap
+    # Report campaigns whose recommendation moved at least this much since last returned
+    min_change_percent: Optional[confloat(ge=0)] = None
+
+
+class BudgetChange(BaseModel):
+    campaign_id: int
+    platform: str
+    current_budget: float
+    previous_recommended_budget: float
+    recommended_budget: float
+    change_percent: float
+    marginal_return: float
+    reason: str
+
+
+class BudgetDeltaResponse(BaseModel):
+    session_id: str
+    version: int
+    total_budget: float
+    changes: List[BudgetChange]  # campaigns the delta edited or moved materially, largest moves first
+    unchanged_count: int
+    expected_improvement: dict
+    unallocated_budget: float
 
 
 @router.post("/optimize", response_model=BudgetResponse)
-async def optimize_budget(request: BudgetRequest):
+async def optimize_budget(request: BudgetRequest, service: BudgetService = Depends(get_budget_service)):
     """Generate budget allocation recommendations."""
-    from services.budget_service import BudgetService
-
-    service = BudgetService()
-    result = service.optimize(
-        organization_id=request.organization_id,
-        total_budget=request.total_budget,
-        campaigns=request.campaigns,
-        optimization_goal=request.optimization_goal,
-    )
+    try:
+        result = await run_in_threadpool(
+            service.optimize,
+            organization_id=request.organization_id,
+            total_budget=request.total_budget,
+            campaigns=request.campaigns,
+            optimization_goal=request.optimization_goal,
+            platform_caps=request.platform_caps,
+            budget_step=request.budget_step,
+            simulation_draws=request.simulation_draws,
+            seed=request.seed,
+            target_roas=request.target_roas,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return result
+
+
+@router.post("/sessions", response_model=BudgetSessionResponse, status_code=201)
+async def create_budget_session(request: BudgetRequest, service: BudgetService = Depends(get_budget_service)):
+    """Optimize a portfolio and keep it for what-if deltas on any worker."""
+    try:
+        return await run_in_threadpool(
+            service.create_session,
+            organization_id=request.organization_id,
+            total_budget=request.total_budget,
+            campaigns=request.campaigns,
+            optimization_goal=request.optimization_goal,
+            platform_caps=request.platform_caps,
+            budget_step=request.budget_step,
+            simulation_draws=request.simulation_draws,
+            seed=request.seed,
+            target_roas=request.target_roas,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/sessions/stats")
+async def budget_session_stats(service: BudgetService = Depends(get_budget_service)):
+    """Stored what-if sessions and this worker's decoded-session cache counters."""
+    return service.session_stats()
+
+
+@router.get("/sessions/{session_id}", response_model=BudgetSessionResponse)
+async def get_budget_session(session_id: str, service: BudgetService = Depends(get_budget_service)):
+    """Full recommendations of a session at its latest version."""
+    result = await run_in_threadpool(service.get_session, session_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Budget session not found or expired")
+    return result
+
+
+@router.post("/sessions/{session_id}/delta", response_model=BudgetDeltaResponse)
+async def apply_budget_delta(session_id: str, delta: BudgetDelta, service: BudgetService = Depends(get_budget_service)):
+    """Apply a what-if change and return only the recommendations it moved."""
+    try:
+        result = await run_in_threadpool(
+            service.apply_delta,
+            session_id,
+            total_budget=delta.total_budget,
+            campaigns=[c.dict(exclude_unset=True) for c in delta.campaigns],
+            platform_caps=delta.platform_caps,
+            min_change_percent=delta.min_change_percent,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Budget session not found or expired")
     return result
+
+
+@router.delete("/sessions/{session_id}", status_code=204)
+async def close_budget_session(session_id: str, service: BudgetService = Depends(get_budget_service)):
+    """Drop a what-if session."""
+    if not await run_in_threadpool(service.close_session, session_id):
+        raise HTTPException(status_code=404, detail="Budget session not found or expired")
+    return Response(status_code=204)
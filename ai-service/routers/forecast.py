@@ -4,18 +4,40 @@ Forecast Router
 Time-series forecasting for spend, conversions, ROAS, and budget optimization.
 """
 
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, confloat, conint
 from typing import List, Dict, Optional
 
-router = APIRouter()
+from dependencies import get_batch_engine, get_forecast_service
+from services.batch_engine import BatchPredictEngine
+from services.forecast_service import ForecastService
+from services.series import Series, resolve_series
+from services.bulk_io import NDJSON_MEDIA_TYPE, DuplexStreamingResponse, iter_records, ndjson_line, error_line, parse_series_record
+from services.fast_json import FastJSONRoute
+from services.budget_simulation import SIM_MAX_DRAWS
+
+router = APIRouter(route_class=FastJSONRoute)
 
 
 class ForecastRequest(BaseModel):
     campaign_id: int
     metric: str  # spend, conversions, roas, cpc, ctr
-    historical_data: List[dict]  # [{date, value}, ...]
+    historical_data: Optional[List[dict]] = None  # [{date, value}, ...]
+    # Columnar alternative to historical_data: dense values from start_date
+    values: Optional[List[float]] = None
+    start_date: Optional[str] = None  # YYYY-MM-DD
+    freq: str = "D"  # D, W
     forecast_days: int = 7
+    max_latency_ms: Optional[float] = None  # fit budget; cheaper models are picked to stay within it
+    model: Optional[str] = None  # prophet, xgboost, ets, statistical; automatic when unset
+    interval_levels: Optional[List[confloat(gt=0, lt=1)]] = None  # extra central intervals, e.g. [0.8, 0.95]
+
+    def series(self):
+        try:
+            return resolve_series(self.historical_data, self.values, self.start_date, self.freq)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
 
 
 class BudgetForecastRequest(BaseModel):
@@ -23,49 +45,213 @@ class BudgetForecastRequest(BaseModel):
     revenue_data: List[Dict]
     target_roas: float
     budget_range: Dict
+    simulation_draws: conint(ge=0, le=SIM_MAX_DRAWS) = 0  # Monte Carlo draws; 0 = point estimates only
+    seed: Optional[conint(ge=0)] = None  # fixes the draws; reported back when omitted
+
+
+class BudgetBatchCampaign(BaseModel):
+    campaign_id: int
+    spend: List[float]  # daily spend, paired with revenue by position
+    revenue: List[float]
+    budget_range: Optional[Dict] = None  # {min, max}; defaults to 0.5x-2x current spend
+    target_roas: Optional[float] = None  # overrides the request-level target
+
+
+class BudgetBatchRequest(BaseModel):
+    campaigns: List[BudgetBatchCampaign]
+    target_roas: float
+    scenario_multipliers: Optional[List[confloat(gt=0)]] = None  # x current spend
+    curve: str = "auto"  # log_linear, hill, auto
+    simulation_draws: conint(ge=0, le=SIM_MAX_DRAWS) = 0
+    seed: Optional[conint(ge=0)] = None
 
 
 @router.post("/predict")
-async def predict_metric(request: ForecastRequest):
+async def predict_metric(request: ForecastRequest, service: ForecastService = Depends(get_forecast_service)):
     """Generate time-series forecast for a given metric."""
-    from services.forecast_service import ForecastService
-
-    service = ForecastService()
     return service.predict(
         campaign_id=request.campaign_id,
         metric=request.metric,
-        historical_data=request.historical_data,
+        historical_data=request.series(),
         forecast_days=request.forecast_days,
+        max_latency_ms=request.max_latency_ms,
+        model=request.model,
+        interval_levels=request.interval_levels,
     )
 
 
+@router.post("/predict-binary")
+async def predict_metric_binary(
+    request: Request,
+    campaign_id: int,
+    metric: str,
+    start_date: str,
+    freq: str = "D",
+    forecast_days: int = 7,
+    max_latency_ms: Optional[float] = None,
+    model: Optional[str] = None,
+    interval_levels: Optional[List[float]] = Query(None),
+    service: ForecastService = Depends(get_forecast_service),
+):
+    """
+    Forecast from a binary body: raw little-endian float64 values
+    (application/octet-stream) or an Arrow IPC stream with a "value" column.
+    """
+    try:
+        series = Series.from_bytes(await request.body(), start_date, freq, request.headers.get("content-type"))
+    except ImportError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        return service.predict(
+            campaign_id=campaign_id,
+            metric=metric,
+            historical_data=series,
+            forecast_days=forecast_days,
+            max_latency_ms=max_latency_ms,
+            model=model,
+            interval_levels=interval_levels,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 @router.post("/batch-predict")
-async def batch_predict(requests: List[ForecastRequest]):
+async def batch_predict(
+    requests: List[ForecastRequest],
+    engine: BatchPredictEngine = Depends(get_batch_engine),
+    service: ForecastService = Depends(get_forecast_service),
+):
     """Generate forecasts for multiple campaigns/metrics."""
-    from services.forecast_service import ForecastService
-
-    service = ForecastService()
-    results = []
-    for req in requests:
-        result = service.predict(
-            campaign_id=req.campaign_id,
-            metric=req.metric,
-            historical_data=req.historical_data,
-            forecast_days=req.forecast_days,
-        )
-        results.append(result)
+    items = [
+        {
+            "campaign_id": req.campaign_id,
+            "metric": req.metric,
+            "historical_data": req.series(),
+            "forecast_days": req.forecast_days,
+            "max_latency_ms": req.max_latency_ms,
+            "model": req.model,
+            "interval_levels": req.interval_levels,
+        }
+        for req in requests
+    ]
+    # Exponential smoothing and global XGBoost requests are forecast together in
+    # vectorized passes; the rest fan out to the process pool. Both run off the event loop.
+    results = await run_in_threadpool(service.predict_batch_vectorized, items)
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        for i, result in zip(pending, await run_in_threadpool(engine.predict_batch, [items[i] for i in pending])):
+            results[i] = result
     return {"predictions": results}
 
 
+@router.post("/bulk-predict")
+async def bulk_predict(request: Request, engine: BatchPredictEngine = Depends(get_batch_engine)):
+    """
+    Streaming batch forecast. The body is NDJSON (one ForecastRequest per line)
+    or an Arrow IPC stream; each result is written as an NDJSON line tagged
+    with its input index as soon as it is ready, in completion order.
+    """
+    rejected = []
+
+    async def items():
+        async for index, record, error in iter_records(request.stream(), request.headers.get("content-type")):
+            if error is None:
+                try:
+                    req, series = parse_series_record(record, ForecastRequest, "historical_data")
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                rejected.append(error_line(index, record, error))
+                continue
+            yield index, {
+                "campaign_id": req.campaign_id,
+                "metric": req.metric,
+                "historical_data": series,
+                "forecast_days": req.forecast_days,
+                "max_latency_ms": req.max_latency_ms,
+                "model": req.model,
+                "interval_levels": req.interval_levels,
+            }
+
+    async def results():
+        async for index, result in engine.predict_stream(items()):
+            while rejected:
+                yield rejected.pop(0)
+            yield ndjson_line({"index": index, **result})
+        while rejected:
+            yield rejected.pop(0)
+
+    return DuplexStreamingResponse(results(), media_type=NDJSON_MEDIA_TYPE)
+
+
 @router.post("/budget")
-async def forecast_budget(request: BudgetForecastRequest):
+async def forecast_budget(
+    request: BudgetForecastRequest,
+    service: ForecastService = Depends(get_forecast_service),
+):
     """Generate budget optimization forecast."""
-    from services.forecast_service import ForecastService
-
-    service = ForecastService()
-    return service.forecast_budget(
+    return await run_in_threadpool(
+        service.forecast_budget,
         spend_data=request.spend_data,
         revenue_data=request.revenue_data,
         target_roas=request.target_roas,
         budget_range=request.budget_range,
+        simulation_draws=request.simulation_draws,
+        seed=request.seed,
     )
+
+
+@router.post("/budget-batch")
+async def forecast_budget_batch(
+    request: BudgetBatchRequest,
+    service: ForecastService = Depends(get_forecast_service),
+):
+    """Fit response curves and budget scenarios for many campaigns in one pass."""
+    try:
+        return await run_in_threadpool(
+            service.forecast_budget_batch,
+            [c.dict() for c in request.campaigns],
+            request.target_roas,
+            request.scenario_multipliers,
+            request.curve,
+            request.simulation_draws,
+            request.seed,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/cache/stats")
+async def forecast_cache_stats(service: ForecastService = Depends(get_forecast_service)):
+    """Report fitted-model cache occupancy and hit/miss counters."""
+    return service.cache_stats()
+
+
+@router.post("/global-models/train")
+async def train_global_models(requests: List[ForecastRequest], service: ForecastService = Depends(get_forecast_service)):
+    """
+    Train one cross-series XGBoost model per metric from the given campaign
+    series. Once trained, XGBoost forecasts for that metric use it instead of
+    fitting a model per series.
+    """
+    items = [{"metric": req.metric, "historical_data": req.series()} for req in requests]
+    try:
+        return await run_in_threadpool(service.train_global_xgboost, items)
+    except ImportError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/global-models")
+async def global_model_stats(service: ForecastService = Depends(get_forecast_service)):
+    """Trained global XGBoost models with their training size and predict throughput."""
+    return service.global_xgboost.stats()
+
+
+@router.get("/models/stats")
+async def forecast_model_stats(service: ForecastService = Depends(get_forecast_service)):
+    """Learned per-model fit times and backends remembered as failing for a series shape."""
+    return service.model_stats()
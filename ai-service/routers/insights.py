@@ -2,25 +2,40 @@
 Natural Language Insights Router
 =================================
 Generate human-readable performance insights, action suggestions, and Q&A.
+Campaign data may be sent as records (campaign_data) or as columns
+(campaign_columns: one list per field), which skips per-record parsing for
+large portfolios.
 """
 
-from fastapi import APIRouter
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 
-router = APIRouter()
+from dependencies import get_insight_service
+from services.insight_service import InsightService
+from services.fast_json import FastJSONRoute
+
+router = APIRouter(route_class=FastJSONRoute)
 
 
 class InsightRequest(BaseModel):
     organization_id: int
-    campaign_data: List[dict]
+    campaign_data: List[dict] = []
+    campaign_columns: Optional[Dict[str, list]] = None
     time_range: str = "7d"
     include_recommendations: bool = True
+    use_cache: bool = True
+
+
+class BatchInsightRequest(BaseModel):
+    requests: List[InsightRequest]
 
 
 class AskRequest(BaseModel):
     question: str
     context_data: Dict
+    use_cache: bool = True
 
 
 class DeepDiveRequest(BaseModel):
@@ -29,38 +44,67 @@ class DeepDiveRequest(BaseModel):
 
 
 @router.post("/generate")
-async def generate_insights(request: InsightRequest):
+async def generate_insights(request: InsightRequest, service: InsightService = Depends(get_insight_service)):
     """Generate natural language insights from campaign data."""
-    from services.insight_service import InsightService
-
-    service = InsightService()
-    return service.generate(
-        organization_id=request.organization_id,
-        campaign_data=request.campaign_data,
-        time_range=request.time_range,
-        include_recommendations=request.include_recommendations,
-    )
+    try:
+        return await service.generate(
+            organization_id=request.organization_id,
+            campaign_data=request.campaign_data,
+            time_range=request.time_range,
+            include_recommendations=request.include_recommendations,
+            use_cache=request.use_cache,
+            campaign_columns=request.campaign_columns,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.post("/generate-batch")
+async def generate_insights_batch(request: BatchInsightRequest, service: InsightService = Depends(get_insight_service)):
+    """Generate insights for many organizations; their AI summaries are micro-batched."""
+    try:
+        results = await asyncio.gather(*(
+            service.generate(
+                organization_id=req.organization_id,
+                campaign_data=req.campaign_data,
+                time_range=req.time_range,
+                include_recommendations=req.include_recommendations,
+                use_cache=req.use_cache,
+                campaign_columns=req.campaign_columns,
+            )
+            for req in request.requests
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"results": results, "total": len(results)}
 
 
 @router.post("/ask")
-async def ask_question(request: AskRequest):
+async def ask_question(request: AskRequest, service: InsightService = Depends(get_insight_service)):
     """Answer a natural language question about ad performance."""
-    from services.insight_service import InsightService
-
-    service = InsightService()
-    return service.ask_question(
+    return await service.ask_question(
         question=request.question,
         context_data=request.context_data,
+        use_cache=request.use_cache,
     )
 
 
 @router.post("/deep-dive")
-async def campaign_deep_dive(request: DeepDiveRequest):
+async def campaign_deep_dive(request: DeepDiveRequest, service: InsightService = Depends(get_insight_service)):
     """Generate deep-dive analysis for a single campaign."""
-    from services.insight_service import InsightService
-
-    service = InsightService()
     return service.generate_campaign_deep_dive(
         campaign=request.campaign,
         metrics_history=request.metrics_history,
     )
+
+
+@router.get("/cache/stats")
+async def response_cache_stats(service: InsightService = Depends(get_insight_service)):
+    """Hit ratio and LLM latency saved by the response cache."""
+    return service.cache_stats()
+
+
+@router.get("/llm/stats")
+async def llm_stats(service: InsightService = Depends(get_insight_service)):
+    """Provider calls made versus requests coalesced and prompts batched."""
+    return service.llm_stats()
@@ -0,0 +1,146 @@
+"""
+Jobs Router
+===========
+Submit long-running batch forecasts, detection and budget runs as background
+jobs, then poll their status and progress and fetch or cancel them.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import List
+
+from dependencies import get_job_queue
+from services.job_queue import JobQueue, QueueFull
+from services.fast_json import FastJSONRoute
+from routers.forecast import ForecastRequest, BudgetForecastRequest, BudgetBatchRequest
+from routers.anomaly import AnomalyRequest
+from routers.budget import BudgetRequest
+
+router = APIRouter(route_class=FastJSONRoute)
+
+
+class BatchPredictJob(BaseModel):
+    requests: List[ForecastRequest]
+    priority: int = 0  # higher runs first
+
+
+class BatchDetectJob(BaseModel):
+    requests: List[AnomalyRequest]
+    priority: int = 0
+
+
+class BudgetForecastJob(BaseModel):
+    request: BudgetForecastRequest
+    priority: int = 0
+
+
+class BudgetBatchJob(BaseModel):
+    request: BudgetBatchRequest
+    priority: int = 0
+
+
+class BudgetOptimizeJob(BaseModel):
+    request: BudgetRequest
+    priority: int = 0
+
+
+async def _submit(queue: JobQueue, kind: str, payload, priority: int) -> dict:
+    try:
+        return await queue.submit(kind, payload, priority=priority)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.post("/forecast/batch-predict", status_code=202)
+async def submit_batch_predict(job: BatchPredictJob, queue: JobQueue = Depends(get_job_queue)):
+    """Queue a batch forecast; poll GET /jobs/{job_id} for progress."""
+    requests = [
+        {
+            "campaign_id": req.campaign_id,
+            "metric": req.metric,
+            "historical_data": req.series(),
+            "forecast_days": req.forecast_days,
+            "max_latency_ms": req.max_latency_ms,
+            "model": req.model,
+            "interval_levels": req.interval_levels,
+        }
+        for req in job.requests
+    ]
+    return await _submit(queue, "forecast.batch_predict", {"requests": requests}, job.priority)
+
+
+@router.post("/forecast/train-global", status_code=202)
+async def submit_train_global(job: BatchPredictJob, queue: JobQueue = Depends(get_job_queue)):
+    """Queue training of the global XGBoost models (one per metric in the requests)."""
+    requests = [{"metric": req.metric, "historical_data": req.series()} for req in job.requests]
+    return await _submit(queue, "forecast.train_global", {"requests": requests}, job.priority)
+
+
+@router.post("/anomaly/batch-detect", status_code=202)
+async def submit_batch_detect(job: BatchDetectJob, queue: JobQueue = Depends(get_job_queue)):
+    """Queue batch anomaly detection."""
+    requests = [
+        {
+            "campaign_id": req.campaign_id,
+            "metric": req.metric,
+            "data_points": req.series(),
+            "sensitivity": req.sensitivity,
+            "method": req.method,
+            "window": req.window,
+            "rolling_stat": req.rolling_stat,
+            "platform": req.platform,
+        }
+        for req in job.requests
+    ]
+    return await _submit(queue, "anomaly.batch_detect", {"requests": requests}, job.priority)
+
+
+@router.post("/forecast/budget", status_code=202)
+async def submit_budget_forecast(job: BudgetForecastJob, queue: JobQueue = Depends(get_job_queue)):
+    """Queue a budget forecast."""
+    return await _submit(queue, "forecast.budget", job.request.dict(), job.priority)
+
+
+@router.post("/forecast/budget-batch", status_code=202)
+async def submit_budget_forecast_batch(job: BudgetBatchJob, queue: JobQueue = Depends(get_job_queue)):
+    """Queue a portfolio-wide budget forecast."""
+    return await _submit(queue, "forecast.budget_batch", job.request.dict(), job.priority)
+
+
+@router.post("/budget/optimize", status_code=202)
+async def submit_budget_optimize(job: BudgetOptimizeJob, queue: JobQueue = Depends(get_job_queue)):
+    """Queue a budget optimization."""
+    return await _submit(queue, "budget.optimize", job.request.dict(), job.priority)
+
+
+@router.get("/stats")
+async def job_stats(queue: JobQueue = Depends(get_job_queue)):
+    """Job counts by status and queue limits."""
+    return queue.stats()
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    """Status and progress of a job."""
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    """Status plus the result once the job has succeeded."""
+    job = queue.result(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    """Cancel a queued or running job."""
+    job = queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
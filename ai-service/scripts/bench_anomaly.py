@@ -0,0 +1,58 @@
+"""
+Batch Anomaly Detection Benchmark
+=================================
+Times AnomalyService.detect_batch on many equal-length series of i.i.d.
+N(100, 10) noise, per method, with the classic [{date, value}, ...] input
+and with columnar Series input. The gap between the two is the cost of
+reading the dict points; the rest is detection plus building the anomaly
+dicts of the response.
+
+    python -m scripts.bench_anomaly
+    BENCH_SERIES=50000 BENCH_METHODS=rolling python -m scripts.bench_anomaly
+"""
+
+import os
+import time
+
+import numpy as np
+
+from services.anomaly_service import AnomalyService
+from services.series import Series
+
+BENCH_SERIES = int(os.getenv("BENCH_SERIES", "10000"))
+BENCH_POINTS = int(os.getenv("BENCH_POINTS", "90"))
+BENCH_METHODS = os.getenv("BENCH_METHODS", "zscore,rolling").split(",")
+BENCH_REPEATS = int(os.getenv("BENCH_REPEATS", "3"))
+
+
+def requests(values: np.ndarray, method: str, as_points: bool):
+    start = np.datetime64("2026-01-01")
+    dates = np.datetime_as_string(start + np.arange(values.shape[1]), unit="D").tolist()
+    out = []
+    for i, row in enumerate(values):
+        if as_points:
+            data = [{"date": date, "value": value} for date, value in zip(dates, row.tolist())]
+        else:
+            data = Series.from_values(row, str(start))
+        out.append({"campaign_id": i, "metric": "cpc", "data_points": data, "method": method})
+    return out
+
+
+def main():
+    values = np.random.default_rng(0).normal(100, 10, (BENCH_SERIES, BENCH_POINTS))
+    service = AnomalyService(isolation_pool=None)
+    print(f"{BENCH_SERIES} series x {BENCH_POINTS} points")
+    for method in BENCH_METHODS:
+        for as_points in (True, False):
+            batch = requests(values, method, as_points)
+            best, results = float("inf"), None
+            for _ in range(BENCH_REPEATS):
+                started = time.perf_counter()
+                results = service.detect_batch(batch)
+                best = min(best, time.perf_counter() - started)
+            found = sum(r.get("anomaly_count", 0) for r in results)
+            print(f"{method:>8}  {'points' if as_points else 'series':>6} input  {best * 1000:8.0f} ms  {found} anomalies")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Rolling Median/MAD Benchmark
+============================
+Times services.rolling.rolling_median_mad against the per-window baseline
+(np.median over every trailing window, then the median of absolute
+deviations) as the window grows. Small windows take the same partitioning
+path as the baseline; larger ones use the sorted window, whose update is
+O(log w) comparisons plus an O(w) memmove per step, so per-step cost stays
+nearly flat while the memmove is cheap and grows linearly at very large
+windows.
+
+    python -m scripts.bench_rolling
+    BENCH_WINDOWS=1000,100000 BENCH_STEPS=5000 python -m scripts.bench_rolling
+"""
+
+import os
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from services.rolling import rolling_median_mad
+
+BENCH_WINDOWS = [int(w) for w in os.getenv("BENCH_WINDOWS", "7,90,1000,10000,50000,200000").split(",")]
+BENCH_STEPS = int(os.getenv("BENCH_STEPS", "10000"))
+BENCH_REPEATS = int(os.getenv("BENCH_REPEATS", "3"))
+# Baseline work cap (window x steps); larger cases are timed on fewer steps and scaled
+BENCH_BASELINE_ELEMENTS = int(os.getenv("BENCH_BASELINE_ELEMENTS", "200000000"))
+# Elements per baseline block, bounding its memory
+BENCH_BLOCK_ELEMENTS = 20_000_000
+
+
+def baseline(values: np.ndarray, window: int):
+    windows = sliding_window_view(values, window)
+    step = max(1, BENCH_BLOCK_ELEMENTS // window)
+    medians, mads = [], []
+    for start in range(0, len(windows), step):
+        block = windows[start:start + step]
+        median = np.median(block, axis=-1)
+        medians.append(median)
+        mads.append(np.median(np.abs(block - median[:, None]), axis=-1))
+    return np.concatenate(medians), np.concatenate(mads)
+
+
+def per_step_us(fn, values: np.ndarray, window: int) -> float:
+    times = []
+    for _ in range(BENCH_REPEATS):
+        started = time.perf_counter()
+        fn(values, window)
+        times.append(time.perf_counter() - started)
+    return min(times) / (len(values) - window + 1) * 1e6
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'window':>8} {'baseline us/step':>17} {'rolling us/step':>16} {'speedup':>8}")
+    for window in BENCH_WINDOWS:
+        values = rng.gamma(2.0, 50.0, window + BENCH_STEPS - 1)
+        rolling_us = per_step_us(rolling_median_mad, values, window)
+        steps = max(1, min(BENCH_STEPS, BENCH_BASELINE_ELEMENTS // window))
+        short = values[:window + steps - 1]
+        got, expected = rolling_median_mad(short, window), baseline(short, window)
+        assert np.allclose(got[0], expected[0]) and np.allclose(got[1], expected[1])
+        baseline_us = per_step_us(baseline, short, window)
+        print(f"{window:>8} {baseline_us:>17.1f} {rolling_us:>16.1f} {baseline_us / rolling_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Serialization Benchmark
+=======================
+Times JSON encoding of typical batch payloads the old way (FastAPI's
+jsonable_encoder + json.dumps; response_model routes also validate and dump
+the model first) against services.fast_json.
+
+    python -m scripts.bench_serialization
+    BENCH_SERIES=2000 BENCH_DAYS=90 python -m scripts.bench_serialization
+"""
+
+import os
+import json
+import time
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from routers.budget import BudgetResponse
+from services.fast_json import dumps
+
+BENCH_SERIES = int(os.getenv("BENCH_SERIES", "1000"))
+BENCH_DAYS = int(os.getenv("BENCH_DAYS", "100"))
+BENCH_CAMPAIGNS = int(os.getenv("BENCH_CAMPAIGNS", "5000"))
+BENCH_REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+
+
+def batch_forecast_payload(rng) -> dict:
+    dates = np.datetime_as_string(np.datetime64("2026-01-01") + np.arange(BENCH_DAYS), unit="D").tolist()
+    predictions = []
+    for i in range(BENCH_SERIES):
+        values = np.round(rng.gamma(2.0, 50.0, BENCH_DAYS), 4).tolist()
+        predictions.append({
+            "campaign_id": i,
+            "metric": "spend",
+            "predictions": [
+                {"date": d, "predicted_value": v, "lower_bound": round(v * 0.8, 4), "upper_bound": round(v * 1.2, 4)}
+                for d, v in zip(dates, values)
+            ],
+            "confidence": 0.95,
+            "model_used": "ets",
+            "summary": {"current_avg": 100.0, "forecasted_avg": 101.5, "trend_direction": "stable"},
+        })
+    return {"predictions": predictions}
+
+
+def columnar_numpy_payload(rng) -> dict:
+    return {
+        "campaign_ids": np.arange(BENCH_SERIES),
+        "predicted_value": rng.gamma(2.0, 50.0, (BENCH_SERIES, BENCH_DAYS)),
+        "lower_bound": rng.gamma(2.0, 40.0, (BENCH_SERIES, BENCH_DAYS)),
+        "upper_bound": rng.gamma(2.0, 60.0, (BENCH_SERIES, BENCH_DAYS)),
+    }
+
+
+def budget_payload(rng) -> dict:
+    return {
+        "organization_id": 1,
+        "total_budget": 1_000_000.0,
+        "recommendations": [
+            {
+                "campaign_id": i,
+                "platform": "meta" if i % 2 else "google",
+                "current_budget": float(rng.uniform(100, 1000)),
+                "recommended_budget": float(rng.uniform(100, 1000)),
+                "change_percent": float(rng.uniform(-50, 50)),
+                "reason": "Strong ROAS performance, increase budget",
+            }
+            for i in range(BENCH_CAMPAIGNS)
+        ],
+        "expected_improvement": {"roas_change": 4.2, "estimated_additional_revenue": 12000.0},
+        "summary": "Reallocate budget toward the best performing campaigns.",
+    }
+
+
+def best_of(fn) -> float:
+    times = []
+    for _ in range(BENCH_REPEATS):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+
+def numpy_to_lists(payload: dict) -> dict:
+    return {key: value.tolist() for key, value in payload.items()}
+
+
+def main():
+    rng = np.random.default_rng(0)
+    forecasts = batch_forecast_payload(rng)
+    columnar = columnar_numpy_payload(rng)
+    budget = budget_payload(rng)
+    adapter = TypeAdapter(BudgetResponse)
+
+    cases = [
+        (
+            f"batch forecast ({BENCH_SERIES * BENCH_DAYS} rows)",
+            lambda: json.dumps(jsonable_encoder(forecasts)).encode(),
+            lambda: dumps(forecasts),
+        ),
+        (
+            f"columnar NumPy ({BENCH_SERIES}x{BENCH_DAYS}x3)",
+            lambda: json.dumps(jsonable_encoder(numpy_to_lists(columnar))).encode(),
+            lambda: dumps(columnar),
+        ),
+        (
+            f"BudgetResponse ({BENCH_CAMPAIGNS} recommendations)",
+            lambda: json.dumps(jsonable_encoder(adapter.dump_python(adapter.validate_python(budget), mode="json"))).encode(),
+            lambda: adapter.dump_json(adapter.validate_python(budget)),
+        ),
+    ]
+
+    print(f"{'payload':<42} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, before, after in cases:
+        before_ms, after_ms = best_of(before), best_of(after)
+        print(f"{name:<42} {before_ms:>10.1f} {after_ms:>10.1f} {before_ms / after_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Fake LLM Endpoint
+=================
+Minimal OpenAI-compatible /chat/completions server for exercising the
+insight service without the real provider. Answers batched summary prompts
+with a JSON object keyed by portfolio id, adds a fixed latency, and returns
+429 with Retry-After once the requests-per-minute budget is spent.
+
+    uvicorn scripts.fake_llm:app --port 9100
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_LLM_RPM = int(os.getenv("FAKE_LLM_RPM", "0"))  # 0 = unlimited
+
+app = FastAPI(title="Fake LLM")
+_recent = deque()
+stats = {"requests": 0, "rate_limited": 0}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    stats["requests"] += 1
+    now = time.monotonic()
+    while _recent and now - _recent[0] > 60:
+        _recent.popleft()
+    if FAKE_LLM_RPM and len(_recent) >= FAKE_LLM_RPM:
+        stats["rate_limited"] += 1
+        return JSONResponse({"error": "rate limited"}, status_code=429, headers={"retry-after": "1"})
+    _recent.append(now)
+
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    await asyncio.sleep(FAKE_LLM_LATENCY_MS / 1000)
+
+    ids = re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)
+    if ids:
+        content = json.dumps({i: f"Portfolio {i} summary." for i in ids})
+    else:
+        content = f"Fake answer for a {len(prompt)}-character prompt."
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
@@ -6,159 +6,259 @@ Supports Z-score, rolling window, Isolation Forest, and multi-metric correlation
 """
 
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional, Union
 from datetime import datetime
+import os
 import logging
 
+from services import backends
+from services.rolling import rolling_mean, rolling_mean_std, rolling_median_mad, MAD_SCALE
+from services.isolation_pool import IsolationForestPool
+from services.series import Series, as_series
+
 logger = logging.getLogger(__name__)
 
+# Set ANOMALY_IF_POOL=0 to fit one Isolation Forest per series instead of pooled forests
+ISOLATION_POOL_ENABLED = os.getenv("ANOMALY_IF_POOL", "1") == "1"
+
+# Detection methods, in the order their hits are compared per date
+ZSCORE, ROLLING, ISOLATION_FOREST, TREND = range(4)
+METHOD_NAMES = ("zscore", "rolling_window", "isolation_forest", "trend_detection")
+# detected_by for each bitmask of methods
+DETECTED_BY = [
+    tuple(name for bit, name in enumerate(METHOD_NAMES) if mask >> bit & 1) for mask in range(1 << len(METHOD_NAMES))
+]
+# Indexed by (trend hit) * 2 + (value above expected)
+DIRECTIONS = ("drop", "spike", "trend_decreasing", "trend_increasing")
+
 
 class AnomalyService:
+    def __init__(self, isolation_pool: Optional[IsolationForestPool] = None):
+        if isolation_pool is None and ISOLATION_POOL_ENABLED:
+            isolation_pool = IsolationForestPool()
+        self.isolation_pool = isolation_pool
+
     def detect(
         self,
         campaign_id: int,
         metric: str,
-        data_points: List[dict],
+        data_points: Union[List[dict], Series],
         sensitivity: float = 2.0,
         method: str = "ensemble",
+        window: Optional[int] = None,
+        rolling_stat: str = "mean",
+        platform: Optional[str] = None,
     ) -> dict:
-        """Detect anomalies using multiple methods."""
-        if len(data_points) < 5:
-            return {
-                "campaign_id": campaign_id,
-                "metric": metric,
-                "anomalies": [],
-                "is_anomalous": False,
-                "summary": "Insufficient data for anomaly detection (minimum 5 data points required).",
-            }
+        """
+        Detect anomalies using multiple methods.
+        rolling_stat selects the rolling-window estimator: "mean" (mean/std) or
+        the outlier-robust "median" (median/MAD).
+        """
+        return self.detect_batch([{
+            "campaign_id": campaign_id,
+            "metric": metric,
+            "data_points": data_points,
+            "sensitivity": sensitivity,
+            "method": method,
+            "window": window,
+            "rolling_stat": rolling_stat,
+            "platform": platform,
+        }])[0]
+
+    def detect_batch(self, requests: List[dict]) -> List[dict]:
+        """
+        Detect anomalies for many series at once.
+        Series of equal length are packed into a 2D array and every statistical
+        method runs vectorized across the whole group; output order and shape
+        match calling detect() per request.
+        """
+        results = [None] * len(requests)
+        groups = {}
+        for i, req in enumerate(requests):
+            if len(req["data_points"]) < 5:
+                results[i] = {
+                    "campaign_id": req["campaign_id"],
+                    "metric": req["metric"],
+                    "anomalies": [],
+                    "is_anomalous": False,
+                    "summary": "Insufficient data for anomaly detection (minimum 5 data points required).",
+                }
+            else:
+                key = (len(req["data_points"]), req.get("window"), req.get("rolling_stat", "mean"))
+                groups.setdefault(key, []).append(i)
+
+        for (_, window, rolling_stat), indices in groups.items():
+            group = [requests[i] for i in indices]
+            for i, result in zip(indices, self._detect_group(group, window, rolling_stat)):
+                results[i] = result
+
+        return results
+
+    def _detect_group(self, requests: List[dict], window: Optional[int], rolling_stat: str) -> List[dict]:
+        """
+        Run detection over equal-length series packed into a (series x points)
+        array. Each method's hits are gathered as arrays, deduplicated per date
+        with one sort across the group, and only the kept hits become dicts.
+        """
+        robust = rolling_stat == "median"
+        series = [as_series(req["data_points"]) for req in requests]
+        values = np.stack([s.values for s in series])
+        sensitivity = np.array([float(req.get("sensitivity", 2.0)) for req in requests])
+        methods = [req.get("method", "ensemble") for req in requests]
+        n = values.shape[1]
+
+        mean = values.mean(axis=1)
+        std = values.std(axis=1)
+        has_variance = std != 0
+        safe_std = np.where(has_variance, std, 1.0)
+
+        hits = []
+
+        # Method 1: Z-score
+        use_zscore = np.array([m in ("zscore", "ensemble") for m in methods]) & has_variance
+        z_scores = np.abs(values - mean[:, None]) / safe_std[:, None]
+        z_mask = (z_scores > sensitivity[:, None]) & use_zscore[:, None]
+        rows, cols = np.nonzero(z_mask)
+        deviation = z_scores[rows, cols]
+        hits.append(self._point_hits(
+            ZSCORE, rows, cols, values[rows, cols], mean[rows], deviation, deviation > sensitivity[rows] * 1.5
+        ))
 
-        values = np.array([float(d["value"]) for d in data_points])
-        dates = [d["date"] for d in data_points]
+        # Method 2: Rolling window detection (window of points preceding each index)
+        use_rolling = np.array([m in ("rolling", "ensemble") for m in methods]) & has_variance
+        if n >= 7 and use_rolling.any():
+            window = min(window or min(7, n // 2), n - 1)
+            if robust:
+                ma, ma_mad = rolling_median_mad(values, window)
+                ma, ma_std = ma[:, :-1], ma_mad[:, :-1] * MAD_SCALE
+            else:
+                ma, ma_std = rolling_mean_std(values, window)
+                ma, ma_std = ma[:, :-1], ma_std[:, :-1]
+            current = values[:, window:]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rolling_dev = np.abs(current - ma) / ma_std
+            rolling_mask = (ma_std > 0) & (rolling_dev > sensitivity[:, None]) & use_rolling[:, None]
+            rows, js = np.nonzero(rolling_mask)
+            deviation = rolling_dev[rows, js]
+            hits.append(self._point_hits(
+                ROLLING, rows, js + window, current[rows, js], ma[rows, js], deviation,
+                deviation > sensitivity[rows] * 1.5,
+            ))
 
-        anomalies = []
+        # Method 3: Isolation Forest (pooled per metric/platform, per-series until the pool is warm)
+        if n >= 10:
+            pools = {}
+            for row, m in enumerate(methods):
+                if m in ("isolation_forest", "ensemble") and has_variance[row]:
+                    key = (requests[row]["metric"], requests[row].get("platform"))
+                    pools.setdefault(key, []).append(row)
+            for key, rows in pools.items():
+                hits.extend(self._isolation_forest_group(key, rows, values, mean, safe_std))
 
-        # Z-score based detection
-        mean = np.mean(values)
-        std = np.std(values)
+        # Recent trend change detection
+        if n >= 7:
+            if robust:
+                recent_mean = np.median(values[:, -3:], axis=1)
+                hist_mean, hist_mad = rolling_median_mad(values[:, :-3], n - 3)
+                hist_mean, hist_std = hist_mean[:, 0], hist_mad[:, 0] * MAD_SCALE
+            else:
+                recent_mean = rolling_mean(values, 3)[:, -1]
+                hist_mean, hist_std = rolling_mean_std(values[:, :-3], n - 3)
+                hist_mean, hist_std = hist_mean[:, 0], hist_std[:, 0]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change_z = np.abs(recent_mean - hist_mean) / hist_std
+                pct_change = ((recent_mean - hist_mean) / hist_mean) * 100
+            rows = np.flatnonzero(has_variance & (hist_std > 0) & (change_z > sensitivity))
+            hits.append((
+                np.full(len(rows), TREND), rows, np.full(len(rows), n - 1), recent_mean[rows], hist_mean[rows],
+                change_z[rows], pct_change[rows], np.zeros(len(rows), dtype=bool), recent_mean[rows] > hist_mean[rows],
+            ))
+
+        anomalies = self._deduplicate_hits(hits, series, n, len(requests))
+
+        v_min, v_max, v_median = values.min(axis=1), values.max(axis=1), np.median(values, axis=1)
+        statistics = np.round(np.column_stack([mean, std, v_min, v_max, v_median]), 4).tolist()
+        results = []
+        for row, req in enumerate(requests):
+            campaign_id, metric = req["campaign_id"], req["metric"]
+            if not has_variance[row]:
+                results.append({
+                    "campaign_id": campaign_id,
+                    "metric": metric,
+                    "anomalies": [],
+                    "is_anomalous": False,
+                    "summary": f"No variance detected in {metric} data.",
+                })
+                continue
 
-        if std == 0:
-            return {
+            row_anomalies = anomalies[row]
+            row_mean, row_std, row_min, row_max, row_median = statistics[row]
+            results.append({
                 "campaign_id": campaign_id,
                 "metric": metric,
-                "anomalies": [],
-                "is_anomalous": False,
-                "summary": f"No variance detected in {metric} data.",
-            }
+                "anomalies": row_anomalies,
+                "is_anomalous": len(row_anomalies) > 0,
+                "anomaly_count": len(row_anomalies),
+                "summary": self._generate_summary(campaign_id, metric, row_anomalies, values[row]),
+                "statistics": {
+                    "mean": row_mean,
+                    "std": row_std,
+                    "min": row_min,
+                    "max": row_max,
+                    "median": row_median,
+                },
+            })
 
-        # Method 1: Z-score
-        if method in ("zscore", "ensemble"):
-            for i, (date, value) in enumerate(zip(dates, values)):
-                z_score = abs(value - mean) / std
-                if z_score > sensitivity:
-                    severity = "critical" if z_score > sensitivity * 1.5 else "warning"
-                    direction = "spike" if value > mean else "drop"
-                    anomalies.append({
-                        "date": date,
-                        "value": round(float(value), 4),
-                        "expected_value": round(float(mean), 4),
-                        "deviation": round(float(z_score), 2),
-                        "deviation_percent": round(float((value - mean) / max(1, abs(mean)) * 100), 1),
-                        "severity": severity,
-                        "direction": direction,
-                        "method": "zscore",
-                    })
-
-        # Method 2: Rolling window detection
-        if method in ("rolling", "ensemble") and len(values) >= 7:
-            window = min(7, len(values) // 2)
-            for i in range(window, len(values)):
-                window_values = values[max(0, i - window):i]
-                ma = np.mean(window_values)
-                ma_std = np.std(window_values)
-                if ma_std > 0:
-                    deviation = abs(values[i] - ma) / ma_std
-                    if deviation > sensitivity:
-                        anomalies.append({
-                            "date": dates[i],
-                            "value": round(float(values[i]), 4),
-                            "expected_value": round(float(ma), 4),
-                            "deviation": round(float(deviation), 2),
-                            "deviation_percent": round(float((values[i] - ma) / max(1, abs(ma)) * 100), 1),
-                            "severity": "critical" if deviation > sensitivity * 1.5 else "warning",
-                            "direction": "spike" if values[i] > ma else "drop",
-                            "method": "rolling_window",
-                        })
-
-        # Method 3: Isolation Forest
-        if method in ("isolation_forest", "ensemble") and len(values) >= 10:
+        return results
+
+    def _point_hits(self, method, rows, cols, value, expected, deviation, critical) -> tuple:
+        """Hit arrays for a point method, deviation_percent relative to the expected value."""
+        return (
+            np.full(len(rows), method), rows, cols, value, expected, deviation,
+            (value - expected) / np.maximum(1, np.abs(expected)) * 100, critical, value > expected,
+        )
+
+    def _isolation_forest_group(self, key, rows, values, mean, std) -> List[tuple]:
+        """Score rows against the pooled forest for their metric/platform; returns hit arrays."""
+        scores = None
+        if self.isolation_pool is not None:
+            normalized = (values[rows] - mean[rows, None]) / std[rows, None]
+            self.isolation_pool.observe(key, normalized)
             try:
-                from sklearn.ensemble import IsolationForest
-                contamination = max(0.01, min(0.2, 1.0 / len(values) * 3))
-                X = values.reshape(-1, 1)
-                model = IsolationForest(contamination=contamination, random_state=42)
-                predictions = model.fit_predict(X)
-                scores = model.decision_function(X)
-
-                for i, (pred, score) in enumerate(zip(predictions, scores)):
-                    if pred == -1:
-                        anomalies.append({
-                            "date": dates[i],
-                            "value": round(float(values[i]), 4),
-                            "expected_value": round(float(mean), 4),
-                            "deviation": round(float(abs(score)), 2),
-                            "deviation_percent": round(float((values[i] - mean) / max(1, abs(mean)) * 100), 1),
-                            "severity": "warning",
-                            "direction": "spike" if values[i] > mean else "drop",
-                            "method": "isolation_forest",
-                        })
+                scores = self.isolation_pool.score(key, normalized)
             except Exception as e:
-                logger.warning(f"Isolation Forest failed: {e}")
+                logger.warning(f"Pooled Isolation Forest failed: {e}")
 
-        # Recent trend change detection
-        if len(values) >= 7:
-            recent = values[-3:]
-            historical = values[:-3]
-            recent_mean = np.mean(recent)
-            hist_mean = np.mean(historical)
-            hist_std = np.std(historical)
-
-            if hist_std > 0:
-                change_z = abs(recent_mean - hist_mean) / hist_std
-                if change_z > sensitivity:
-                    pct_change = ((recent_mean - hist_mean) / hist_mean) * 100
-                    direction = "increasing" if recent_mean > hist_mean else "decreasing"
-                    anomalies.append({
-                        "date": dates[-1],
-                        "value": round(float(recent_mean), 4),
-                        "expected_value": round(float(hist_mean), 4),
-                        "deviation": round(float(change_z), 2),
-                        "deviation_percent": round(float(pct_change), 1),
-                        "severity": "warning",
-                        "direction": f"trend_{direction}",
-                        "method": "trend_detection",
-                    })
-
-        # Deduplicate by date, keeping highest deviation
-        anomalies = self._deduplicate_anomalies(anomalies)
-
-        is_anomalous = len(anomalies) > 0
-        summary = self._generate_summary(campaign_id, metric, anomalies, values)
+        if scores is None:
+            hits = []
+            for row in rows:
+                cols, deviation = self._isolation_forest_outliers(values[row])
+                row_index = np.full(len(cols), row)
+                hits.append(self._point_hits(
+                    ISOLATION_FOREST, row_index, cols, values[row, cols], mean[row_index], deviation,
+                    np.zeros(len(cols), dtype=bool),
+                ))
+            return hits
 
-        return {
-            "campaign_id": campaign_id,
-            "metric": metric,
-            "anomalies": anomalies,
-            "is_anomalous": is_anomalous,
-            "anomaly_count": len(anomalies),
-            "summary": summary,
-            "statistics": {
-                "mean": round(float(mean), 4),
-                "std": round(float(std), 4),
-                "min": round(float(np.min(values)), 4),
-                "max": round(float(np.max(values)), 4),
-                "median": round(float(np.median(values)), 4),
-            },
-        }
+        r, cols = np.nonzero(scores < 0)
+        rows = np.asarray(rows)[r]
+        return [self._point_hits(
+            ISOLATION_FOREST, rows, cols, values[rows, cols], mean[rows], np.abs(scores[r, cols]),
+            np.zeros(len(rows), dtype=bool),
+        )]
+
+    def _isolation_forest_outliers(self, values: np.ndarray):
+        """Indices and |decision score| of outliers from an Isolation Forest fitted on a single series."""
+        try:
+            IsolationForest = backends.load("sklearn").IsolationForest
+            contamination = max(0.01, min(0.2, 1.0 / len(values) * 3))
+            X = values.reshape(-1, 1)
+            model = IsolationForest(contamination=contamination, random_state=42)
+            outliers = np.flatnonzero(model.fit_predict(X) == -1)
+            return outliers, np.abs(model.decision_function(X)[outliers])
+        except Exception as e:
+            logger.warning(f"Isolation Forest failed: {e}")
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
 
     def detect_multi_metric(
         self,
@@ -172,8 +272,11 @@ class AnomalyService:
         results = {}
         all_anomaly_dates = {}
 
-        for metric_name, data in metrics_data.items():
-            result = self.detect(campaign_id, metric_name, data, sensitivity)
+        batch = self.detect_batch([
+            {"campaign_id": campaign_id, "metric": metric_name, "data_points": data, "sensitivity": sensitivity}
+            for metric_name, data in metrics_data.items()
+        ])
+        for metric_name, result in zip(metrics_data, batch):
             results[metric_name] = result
 
             for anomaly in result.get("anomalies", []):
@@ -208,21 +311,77 @@ class AnomalyService:
             "total_anomalies": sum(r["anomaly_count"] for r in results.values()),
         }
 
-    def _deduplicate_anomalies(self, anomalies: List[Dict]) -> List[Dict]:
-        """Keep highest deviation anomaly per date."""
-        by_date = {}
-        for a in anomalies:
-            date = a["date"]
-            if date not in by_date or a["deviation"] > by_date[date]["deviation"]:
-                # Preserve detected methods
-                methods = [a["method"]]
-                if date in by_date:
-                    existing_method = by_date[date].get("detected_by", [by_date[date].get("method", "")])
-                    methods = list(set(existing_method + methods))
-                a["detected_by"] = methods
-                by_date[date] = a
-
-        return list(by_date.values())
+    def _deduplicate_hits(self, hits: List[tuple], series: List[Series], n: int, n_series: int) -> List[List[Dict]]:
+        """
+        Keep the highest-deviation hit per series and date and build the
+        anomaly dicts, listed per series. Hits on a date are compared in
+        method order and a later one replaces the kept one only with a
+        strictly higher (rounded) deviation; detected_by lists the methods
+        that did. Dates are listed in the order they were first hit.
+        """
+        method, rows, cols, value, expected, deviation, percent, critical, up = (
+            np.concatenate(column) for column in zip(*hits)
+        )
+        if not len(rows):
+            return [[] for _ in range(n_series)]
+        rounded = np.round(deviation, 2)
+
+        # Group each (series, date)'s hits together, in method order
+        order = np.lexsort((method, cols, rows))
+        method, rows, cols, rounded = method[order], rows[order], cols[order], rounded[order]
+        new_group = np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]
+        group = np.cumsum(new_group) - 1
+        starts = np.flatnonzero(new_group)
+
+        # A hit is taken when it beats every earlier hit of its group; at most
+        # one hit per method, so looking back len(METHOD_NAMES) - 1 places is enough
+        best_before = np.full(len(rows), -np.inf)
+        for shift in range(1, len(METHOD_NAMES)):
+            same = group[shift:] == group[:-shift]
+            best_before[shift:] = np.where(same, np.maximum(best_before[shift:], rounded[:-shift]), best_before[shift:])
+        taken = rounded > best_before
+        taken_later = np.zeros(len(rows), dtype=bool)
+        for shift in range(1, len(METHOD_NAMES)):
+            taken_later[:-shift] |= (group[:-shift] == group[shift:]) & taken[shift:]
+        kept = np.flatnonzero(taken & ~taken_later)
+        detected_by = np.add.reduceat(np.where(taken, 1 << method, 0), starts)
+
+        # One kept hit per group; list each series' dates by first hit (method, then date)
+        first_seen = method[starts] * (n + 1) + cols[starts]
+        listing = np.lexsort((first_seen, rows[starts]))
+        kept, detected_by, rows = kept[listing], detected_by[listing], rows[starts][listing]
+        source = order[kept]
+
+        directions = np.where(method[kept] == TREND, 2, 0) + up[source]
+        # Shared immutable detected_by tuples keep the dicts atomic, so the
+        # garbage collector does not track (and rescan) every anomaly
+        anomalies = [
+            {
+                "date": series[row].dates[col],
+                "value": v,
+                "expected_value": e,
+                "deviation": d,
+                "deviation_percent": p,
+                "severity": s,
+                "direction": DIRECTIONS[direction],
+                "method": METHOD_NAMES[m],
+                "detected_by": DETECTED_BY[mask],
+            }
+            for row, col, v, e, d, p, s, direction, m, mask in zip(
+                rows.tolist(),
+                cols[kept].tolist(),
+                np.round(value[source], 4).tolist(),
+                np.round(expected[source], 4).tolist(),
+                rounded[kept].tolist(),
+                np.round(percent[source], 1).tolist(),
+                np.where(critical[source], "critical", "warning").tolist(),
+                directions.tolist(),
+                method[kept].tolist(),
+                detected_by.tolist(),
+            )
+        ]
+        bounds = np.r_[0, np.cumsum(np.bincount(rows, minlength=n_series))].tolist()
+        return [anomalies[bounds[row]:bounds[row + 1]] for row in range(n_series)]
 
     def _generate_summary(self, campaign_id, metric, anomalies, values):
         if not anomalies:
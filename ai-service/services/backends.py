@@ -0,0 +1,87 @@
+"""
+Optional Backends
+=================
+Timed, cached imports for the heavy optional dependencies (Prophet, pandas,
+XGBoost, scikit-learn, pyarrow). Each backend is imported at most once per
+process: later lookups return the module or re-raise the cached failure
+without touching the import system again.
+"""
+
+import time
+import importlib
+import threading
+import logging
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Backend name -> module to import
+BACKENDS = {
+    "pandas": "pandas",
+    "prophet": "prophet",
+    "xgboost": "xgboost",
+    "sklearn": "sklearn.ensemble",
+    "pyarrow": "pyarrow",
+}
+
+
+class BackendUnavailable(ImportError):
+    pass
+
+
+_modules = {}
+_status: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def load(name: str):
+    """Return the backend module, importing it on first use."""
+    module = _modules.get(name)
+    if module is not None:
+        return module
+    status = _status.get(name)
+    if status is not None and not status["available"]:
+        raise BackendUnavailable(f"{name} unavailable: {status['error']}")
+
+    with _lock:
+        if name not in _status:
+            started = time.perf_counter()
+            try:
+                _modules[name] = importlib.import_module(BACKENDS.get(name, name))
+                _status[name] = {"available": True, "import_seconds": time.perf_counter() - started, "error": None}
+            except Exception as e:
+                # Prophet can fail with non-ImportErrors (e.g. a missing Stan backend)
+                _status[name] = {
+                    "available": False,
+                    "import_seconds": time.perf_counter() - started,
+                    "error": f"{type(e).__name__}: {e}",
+                }
+                logger.warning(f"Optional backend {name} unavailable: {e}")
+    return load(name)
+
+
+def is_available(name: str) -> bool:
+    try:
+        load(name)
+        return True
+    except BackendUnavailable:
+        return False
+
+
+def preload(names: Iterable[str]) -> Dict[str, dict]:
+    """Import the given backends now so the first request does not pay for it."""
+    for name in names:
+        is_available(name)
+    return import_report()
+
+
+def import_report() -> Dict[str, dict]:
+    """Per-backend availability and import time for everything touched so far."""
+    return {
+        name: {
+            "available": status["available"],
+            "import_seconds": round(status["import_seconds"], 4),
+            "error": status["error"],
+        }
+        for name, status in _status.items()
+    }
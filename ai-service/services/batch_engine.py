@@ -0,0 +1,247 @@
+"""
+Batch Prediction Engine
+=======================
+Fans ForecastService.predict out over a set of persistent worker processes.
+Each campaign is routed to a fixed worker (by campaign_id), so repeated
+batches reuse that worker's fitted-model cache. Requests are chunked per
+worker, every item runs under its own timeout, and results come back in
+request order with per-item errors instead of failing the whole batch.
+A chunk stuck past its deadline restarts only its own worker and is retried
+there; chunks on other workers are unaffected. predict_stream feeds the same
+workers from an async source and yields results as chunks finish, with a
+bounded number of chunks queued per worker.
+
+Every service worker (uvicorn --workers / WEB_CONCURRENCY) has its own
+engine, so the default size splits the host's CPUs between them.
+"""
+
+import os
+import zlib
+import signal
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SERVICE_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+BATCH_WORKERS = int(os.getenv("FORECAST_BATCH_WORKERS", str(max(1, (os.cpu_count() or 1) // SERVICE_WORKERS))))
+BATCH_CHUNK_SIZE = int(os.getenv("FORECAST_BATCH_CHUNK_SIZE", "4"))
+BATCH_ITEM_TIMEOUT = float(os.getenv("FORECAST_BATCH_ITEM_TIMEOUT", "30"))
+BATCH_CHUNK_RETRIES = int(os.getenv("FORECAST_BATCH_CHUNK_RETRIES", "1"))
+BATCH_START_METHOD = os.getenv("FORECAST_BATCH_START_METHOD", "spawn")
+# Chunks waiting per worker in predict_stream before reading pauses
+STREAM_QUEUED_CHUNKS = 2
+# Extra time allowed on top of the item timeouts for worker start-up and IPC
+BATCH_GRACE_SECONDS = 10.0
+
+# Per-process ForecastService, created once by the process initializer so each
+# worker keeps its own fitted-model cache across chunks.
+_worker_service = None
+
+
+class ItemTimeout(Exception):
+    pass
+
+
+def _init_worker():
+    global _worker_service
+    from services.forecast_service import ForecastService
+
+    _worker_service = ForecastService()
+
+    # Import model backends up front so a per-item timeout never interrupts an import
+    from services import backends
+
+    backends.preload(("pandas", "prophet", "xgboost"))
+
+
+def _raise_item_timeout(signum, frame):
+    raise ItemTimeout()
+
+
+def _predict_chunk(items: List[tuple], item_timeout: float) -> List[tuple]:
+    """Run one chunk inside a worker process; returns (index, result, error) tuples."""
+    results = []
+    previous_handler = signal.signal(signal.SIGALRM, _raise_item_timeout)
+    try:
+        for index, kwargs in items:
+            try:
+                signal.setitimer(signal.ITIMER_REAL, item_timeout)
+                results.append((index, _worker_service.predict(**kwargs), None))
+            except ItemTimeout:
+                results.append((index, None, f"Timed out after {item_timeout:g}s"))
+            except Exception as e:
+                results.append((index, None, f"{type(e).__name__}: {e}"))
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+    return results
+
+
+class BatchPredictEngine:
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        item_timeout: Optional[float] = None,
+    ):
+        self.max_workers = max(1, max_workers or BATCH_WORKERS)
+        self.chunk_size = max(1, chunk_size or BATCH_CHUNK_SIZE)
+        self.item_timeout = item_timeout or BATCH_ITEM_TIMEOUT
+        # One single-process executor per worker so chunks can be routed to, and
+        # a stuck worker restarted without, the others
+        self._executors: List[Optional[ProcessPoolExecutor]] = [None] * self.max_workers
+        self._lock = threading.Lock()
+
+    @property
+    def chunk_deadline(self) -> float:
+        # Items time out inside the workers; this only catches a worker stuck
+        # in native code that cannot be interrupted
+        return self.chunk_size * self.item_timeout + BATCH_GRACE_SECONDS
+
+    def worker_for(self, request: Dict) -> int:
+        """Worker a request is routed to; stable per campaign_id."""
+        return zlib.crc32(str(request.get("campaign_id")).encode()) % self.max_workers
+
+    def predict_batch(self, requests: List[Dict]) -> List[Dict]:
+        """Forecast every request in parallel; output order matches input order."""
+        if not requests:
+            return []
+
+        chunks = [[] for _ in range(self.max_workers)]
+        for index, request in enumerate(requests):
+            chunks[self.worker_for(request)].append((index, request))
+        results: List[Optional[Dict]] = [None] * len(requests)
+
+        def run_worker(worker: int, items: List[tuple]) -> None:
+            for start in range(0, len(items), self.chunk_size):
+                chunk = items[start:start + self.chunk_size]
+                for index, result, error in self._run_chunk(worker, chunk):
+                    results[index] = result if error is None else self._error_result(requests[index], error)
+
+        busy = [(worker, items) for worker, items in enumerate(chunks) if items]
+        with ThreadPoolExecutor(max_workers=len(busy)) as threads:
+            for future in [threads.submit(run_worker, worker, items) for worker, items in busy]:
+                future.result()
+        return results
+
+    async def predict_stream(self, items: AsyncIterator[Tuple[int, Dict]]) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Forecast (index, request) pairs as they arrive and yield (index, result)
+        in completion order. Reading pauses while a worker has
+        STREAM_QUEUED_CHUNKS chunks waiting, so memory stays bounded however
+        long the input is.
+        """
+        inboxes = [asyncio.Queue(maxsize=STREAM_QUEUED_CHUNKS) for _ in range(self.max_workers)]
+        outbox = asyncio.Queue()
+
+        async def read():
+            buffers = [[] for _ in range(self.max_workers)]
+            try:
+                async for index, request in items:
+                    worker = self.worker_for(request)
+                    buffers[worker].append((index, request))
+                    if len(buffers[worker]) >= self.chunk_size:
+                        await inboxes[worker].put(buffers[worker])
+                        buffers[worker] = []
+                for worker, chunk in enumerate(buffers):
+                    if chunk:
+                        await inboxes[worker].put(chunk)
+            except Exception as e:
+                # Raised to the consumer, which cancels the workers
+                await outbox.put(e)
+                return
+            for inbox in inboxes:
+                await inbox.put(None)
+
+        async def work(worker: int):
+            while True:
+                chunk = await inboxes[worker].get()
+                if chunk is None:
+                    break
+                outcomes = await asyncio.get_running_loop().run_in_executor(None, self._run_chunk, worker, chunk)
+                await outbox.put((chunk, outcomes))
+            await outbox.put(None)
+
+        tasks = [asyncio.ensure_future(read())] + [asyncio.ensure_future(work(w)) for w in range(self.max_workers)]
+        try:
+            finished = 0
+            while finished < self.max_workers:
+                entry = await outbox.get()
+                if entry is None:
+                    finished += 1
+                    continue
+                if isinstance(entry, Exception):
+                    raise entry
+                chunk, outcomes = entry
+                requests = dict(chunk)
+                for index, result, error in outcomes:
+                    yield index, result if error is None else self._error_result(requests[index], error)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self) -> None:
+        with self._lock:
+            executors, self._executors = self._executors, [None] * self.max_workers
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run_chunk(self, worker: int, chunk: List[tuple]) -> List[tuple]:
+        """
+        Run a chunk on its worker and wait for it. A chunk past its deadline
+        restarts that worker and is retried up to BATCH_CHUNK_RETRIES times.
+        """
+        for attempt in range(BATCH_CHUNK_RETRIES + 1):
+            executor = self._get_executor(worker)
+            try:
+                return executor.submit(_predict_chunk, chunk, self.item_timeout).result(timeout=self.chunk_deadline)
+            except FutureTimeout:
+                logger.warning(
+                    f"Batch predict: chunk on worker {worker} exceeded {self.chunk_deadline:g}s "
+                    f"(attempt {attempt + 1}), restarting that worker"
+                )
+                self._reset_executor(worker, executor, terminate=True)
+            except BrokenProcessPool as e:
+                self._reset_executor(worker, executor)
+                return [(index, None, f"Worker crashed: {e}") for index, _ in chunk]
+        return [(index, None, f"Timed out after {self.item_timeout:g}s") for index, _ in chunk]
+
+    def _get_executor(self, worker: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executors[worker] is None:
+                self._executors[worker] = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context(BATCH_START_METHOD),
+                    initializer=_init_worker,
+                )
+            return self._executors[worker]
+
+    def _reset_executor(self, worker: int, executor: ProcessPoolExecutor, terminate: bool = False) -> None:
+        with self._lock:
+            # Another caller may already have replaced it
+            if self._executors[worker] is not executor:
+                return
+            self._executors[worker] = None
+        if terminate:
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _error_result(self, request: Dict, error: str) -> Dict:
+        return {
+            "campaign_id": request.get("campaign_id"),
+            "metric": request.get("metric"),
+            "predictions": [],
+            "confidence": 0.0,
+            "model_used": "none",
+            "error": error,
+        }
@@ -0,0 +1,190 @@
+"""
+Budget Allocator
+================
+Marginal-return budget allocation over per-campaign response curves.
+
+Each campaign's return (revenue or conversions) as a function of budget s is
+modelled with diminishing returns:
+    r(s) = a * ln(1 + s / s0)
+calibrated so the curve passes through the campaign's observed (spend,
+return) point, with s0 = BUDGET_CURVE_SATURATION * spend. Maximizing total
+return under a budget is concave, so the optimum equalizes marginal return
+a / (s0 + s) across campaigns that are not pinned at a floor or ceiling.
+That common marginal return (lambda) is found by bisection for all
+campaigns at once; platform caps that bind are solved the same way within
+the platform.
+"""
+
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Saturation spend as a multiple of current spend: lower = sharper diminishing returns
+BUDGET_CURVE_SATURATION = float(os.getenv("BUDGET_CURVE_SATURATION", "1.0"))
+BISECTION_ITERATIONS = 64
+REPARTITION_EVERY = 2
+
+
+def fit_response_curves(spend: np.ndarray, value: np.ndarray, saturation: float = BUDGET_CURVE_SATURATION):
+    """Curve parameters (a, s0) through each campaign's observed (spend, value) point."""
+    spend = np.maximum(np.asarray(spend, dtype=np.float64), 0)
+    value = np.maximum(np.asarray(value, dtype=np.float64), 0)
+    s0 = np.where(spend > 0, saturation * spend, 1.0)
+    a = np.where(spend > 0, value / np.log1p(1 / saturation), 0.0)
+    return a, s0
+
+
+def curve_value(a: np.ndarray, s0: np.ndarray, budget: np.ndarray) -> np.ndarray:
+    return a * np.log1p(np.maximum(budget, 0) / s0)
+
+
+def marginal_return(a: np.ndarray, s0: np.ndarray, budget: np.ndarray) -> np.ndarray:
+    return a / (s0 + np.maximum(budget, 0))
+
+
+def allocate(
+    a: np.ndarray,
+    s0: np.ndarray,
+    total_budget: float,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    group_caps: Optional[np.ndarray] = None,
+    step: float = 0.01,
+) -> Tuple[np.ndarray, float]:
+    """
+    Allocate total_budget to maximize the summed curve value subject to
+    per-campaign [lower, upper] bounds, optional per-group caps (groups holds
+    each campaign's group index into group_caps, np.inf = uncapped) and a
+    budget step. Returns (allocation, unallocated budget). Raises ValueError
+    when the floors alone exceed the budget or a group cap.
+    """
+    n = len(a)
+    step = max(step, 1e-9)
+    lower = np.ceil(np.asarray(lower, dtype=np.float64) / step - 1e-9) * step
+    upper = np.maximum(np.floor(np.asarray(upper, dtype=np.float64) / step + 1e-9) * step, lower)
+    if groups is None:
+        groups, group_caps = np.zeros(n, dtype=np.int64), np.array([np.inf])
+    n_groups = len(group_caps)
+
+    floors = np.bincount(groups, lower, n_groups)
+    if lower.sum() > total_budget + 1e-6:
+        raise ValueError(f"Budget floors ({lower.sum():,.2f}) exceed the total budget ({total_budget:,.2f})")
+    if np.any(floors > group_caps + 1e-6):
+        raise ValueError("Budget floors exceed a platform cap")
+
+    allocation = lower.copy()
+    active = np.ones(n, dtype=bool)
+    budget_left = float(total_budget)
+    # Solve without group caps; groups over their cap are fixed at the cap
+    # (solved within the group) and the rest re-solved until none is over.
+    while active.any():
+        idx = np.flatnonzero(active)
+        s = _water_fill(a[idx], s0[idx], lower[idx], upper[idx], np.zeros(len(idx), dtype=np.int64), np.array([budget_left]))
+        totals = np.bincount(groups[idx], s, n_groups)
+        over = np.flatnonzero(totals > group_caps + 1e-6)
+        if len(over) == 0:
+            allocation[idx] = s
+            break
+        capped = active & np.isin(groups, over)
+        cidx = np.flatnonzero(capped)
+        remap = np.full(n_groups, -1)
+        remap[over] = np.arange(len(over))
+        allocation[cidx] = _water_fill(a[cidx], s0[cidx], lower[cidx], upper[cidx], remap[groups[cidx]], group_caps[over])
+        budget_left -= float(allocation[cidx].sum())
+        active &= ~capped
+
+    allocation = _round_to_step(a, s0, allocation, total_budget, upper, groups, group_caps, step)
+    return allocation, max(0.0, float(total_budget - allocation.sum()))
+
+
+def _water_fill(a, s0, lower, upper, group, budgets) -> np.ndarray:
+    """
+    Per group, the allocation clip(a / lambda - s0, lower, upper) whose sum
+    meets the group budget, with lambda found by geometric bisection (vectorized
+    across groups). Groups whose ceilings sum below their budget get the ceilings.
+    """
+    n_groups = len(budgets)
+    positive = a > 0
+    # lambda at or below which a campaign sits at its ceiling / at or above which at its floor
+    at_ceiling = np.where(positive, a / (s0 + upper), 0.0)
+    at_floor = np.where(positive, a / (s0 + lower), 0.0)
+    lam_lo = np.full(n_groups, np.inf)
+    lam_hi = np.zeros(n_groups)
+    np.minimum.at(lam_lo, group[positive], at_ceiling[positive])
+    np.maximum.at(lam_hi, group[positive], at_floor[positive])
+    has_curve = np.isfinite(lam_lo)
+    lam_lo = np.where(has_curve, lam_lo, 1.0)
+    lam_hi = np.where(has_curve, np.maximum(lam_hi, lam_lo), 1.0)
+
+    def fill(lam):
+        with np.errstate(divide="ignore"):
+            return np.clip(a / lam[group] - s0, lower, upper)
+
+    # Inside the bracket most campaigns are settled at their floor, their ceiling
+    # or on the curve. The bracket only narrows, so settled campaigns are folded
+    # into per-group constants once and only the still-open ones are evaluated.
+    open_ = np.arange(len(a))
+    o_a, o_s0, o_lower, o_upper, o_group = a, s0, lower, upper, group
+    constant = np.zeros(n_groups)
+    slope = np.zeros(n_groups)
+    for i in range(1, BISECTION_ITERATIONS + 1):
+        # The first bracket spans every campaign's breakpoints: nothing settles yet
+        if i % REPARTITION_EVERY == 0 and len(open_):
+            o_group = group[open_]
+            o_at_floor, o_at_ceiling = at_floor[open_], at_ceiling[open_]
+            lo, hi = lam_lo[o_group], lam_hi[o_group]
+            floor = ~positive[open_] | (o_at_floor <= lo)
+            ceiling = ~floor & (o_at_ceiling >= hi)
+            free = ~floor & ~ceiling & (o_at_ceiling <= lo) & (o_at_floor >= hi)
+            constant += (
+                np.bincount(o_group[floor], lower[open_[floor]], n_groups)
+                + np.bincount(o_group[ceiling], upper[open_[ceiling]], n_groups)
+                - np.bincount(o_group[free], s0[open_[free]], n_groups)
+            )
+            slope += np.bincount(o_group[free], a[open_[free]], n_groups)
+            open_ = open_[~(floor | ceiling | free)]
+            o_a, o_s0, o_lower, o_upper, o_group = a[open_], s0[open_], lower[open_], upper[open_], group[open_]
+        mid = np.sqrt(lam_lo * lam_hi)
+        total = constant + slope / mid + np.bincount(o_group, np.clip(o_a / mid[o_group] - o_s0, o_lower, o_upper), n_groups)
+        over = total > budgets
+        lam_lo = np.where(over, mid, lam_lo)
+        lam_hi = np.where(over, lam_hi, mid)
+    # lam_hi never overspends; lam_lo is the all-at-ceiling point when budgets allow it
+    ceilings_fit = np.bincount(group, upper, n_groups) <= budgets
+    return fill(np.where(ceilings_fit, lam_lo, lam_hi))
+
+
+def _round_to_step(a, s0, allocation, budget, upper, groups, group_caps, step) -> np.ndarray:
+    """Floor allocations to the step, then hand the freed steps to the best marginal gains."""
+    units = np.floor(allocation / step + 1e-9)
+    rounded = units * step
+    leftover = int(np.floor((budget - rounded.sum()) / step + 1e-9))
+    if leftover <= 0:
+        return rounded
+
+    gain = curve_value(a, s0, rounded + step) - curve_value(a, s0, rounded)
+    eligible = (rounded + step <= upper + 1e-9) & (a > 0)
+    room = np.floor((group_caps - np.bincount(groups, rounded, len(group_caps))) / step + 1e-9)
+
+    # Best gains first; at most `room` extra steps per group
+    order = np.flatnonzero(eligible)[np.argsort(-gain[eligible], kind="stable")]
+    perm = np.argsort(groups[order], kind="stable")
+    sorted_groups = groups[order][perm]
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[perm] = np.arange(len(order)) - np.searchsorted(sorted_groups, sorted_groups)
+    allowed = order[rank < room[groups[order]]]
+    rounded[allowed[:leftover]] += step
+    return rounded
+
+
+def group_index(labels):
+    """Distinct labels (e.g. platforms) and each item's index into them."""
+    return np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)
+
+
+def group_caps(names, caps: Optional[Dict[str, float]]) -> np.ndarray:
+    """Cap per group name, np.inf when uncapped."""
+    caps = caps or {}
+    return np.array([float(caps[name]) if name in caps else np.inf for name in names])
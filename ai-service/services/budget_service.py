@@ -1,23 +1,70 @@
 """
 Budget Optimization Service
 ===========================
-Cross-platform budget allocation using efficiency scoring.
+Cross-platform budget allocation by marginal return over per-campaign
+diminishing-returns curves, with budget floors/ceilings, platform caps and
+a budget step. What-if sessions keep a scored portfolio in a store shared by
+all service workers and answer deltas with only the recommendations that
+changed.
 """
 
+import os
 import numpy as np
-from typing import List
-from datetime import datetime
+from typing import Dict, List, Optional
+
+from services import budget_simulation
+from services.budget_allocator import curve_value
+from services.budget_session import BudgetSession
+from services.budget_session_store import BudgetSessionStore
+
+# Default ceiling as a multiple of a campaign's current budget (or spend):
+# the response curve is extrapolated from one observed point
+BUDGET_MAX_CHANGE_FACTOR = float(os.getenv("BUDGET_MAX_CHANGE_FACTOR", "3.0"))
+BUDGET_SESSION_DB_PATH = os.getenv("BUDGET_SESSION_DB_PATH", "/tmp/paramads-ai/budget_sessions.sqlite3")
+BUDGET_SESSION_MAX_ENTRIES = int(os.getenv("BUDGET_SESSION_MAX_ENTRIES", "256"))
+BUDGET_SESSION_TTL_SECONDS = float(os.getenv("BUDGET_SESSION_TTL_SECONDS", "3600"))
+BUDGET_SESSION_MAX_BYTES = int(os.getenv("BUDGET_SESSION_MAX_MB", "256")) * 1024 * 1024
+# Smallest move (percent of the last returned recommendation) a what-if delta reports
+BUDGET_DELTA_MIN_CHANGE_PERCENT = float(os.getenv("BUDGET_DELTA_MIN_CHANGE_PERCENT", "1.0"))
+# Simulation uncertainty: each curve is calibrated from one observed point, so its
+# scale (coefficient of variation) and the day-to-day noise around it are assumed
+BUDGET_SIM_CURVE_CV = float(os.getenv("BUDGET_SIM_CURVE_CV", "0.2"))
+BUDGET_SIM_NOISE_CV = float(os.getenv("BUDGET_SIM_NOISE_CV", "0.1"))
 
 
 class BudgetService:
+    def __init__(self, sessions: Optional[BudgetSessionStore] = None):
+        # What-if sessions: scored portfolios kept between delta requests
+        self.sessions = sessions if sessions is not None else BudgetSessionStore(
+            BUDGET_SESSION_DB_PATH,
+            max_entries=BUDGET_SESSION_MAX_ENTRIES,
+            ttl_seconds=BUDGET_SESSION_TTL_SECONDS,
+            max_bytes=BUDGET_SESSION_MAX_BYTES,
+        )
+
+    def close(self) -> None:
+        self.sessions.close()
+
     def optimize(
         self,
         organization_id: int,
         total_budget: float,
         campaigns: List,
         optimization_goal: str = "roas",
+        platform_caps: Optional[Dict[str, float]] = None,
+        budget_step: float = 0.01,
+        simulation_draws: int = 0,
+        seed: Optional[int] = None,
+        target_roas: Optional[float] = None,
     ) -> dict:
-        """Generate budget allocation recommendations based on campaign efficiency."""
+        """
+        Allocate total_budget where the next dollar earns the most. Campaigns
+        may set min_budget/max_budget; platform_caps bounds each platform's
+        total and every recommendation is a multiple of budget_step.
+        With simulation_draws, adds Monte Carlo bands for the current and
+        recommended allocations (see _simulate).
+        Raises ValueError when the floors cannot fit in the budget or caps.
+        """
         if not campaigns:
             return {
                 "organization_id": organization_id,
@@ -26,66 +73,109 @@ class BudgetService:
                 "expected_improvement": {},
                 "summary": "No campaigns provided for optimization.",
             }
+        session = BudgetSession(
+            organization_id, total_budget, self._columns(campaigns), optimization_goal,
+            platform_caps, budget_step, BUDGET_MAX_CHANGE_FACTOR,
+        )
+        response = self._portfolio_response(session)
+        if simulation_draws:
+            response["simulation"] = self._simulate(session, simulation_draws, seed, target_roas)
+        return response
+
+    def create_session(
+        self,
+        organization_id: int,
+        total_budget: float,
+        campaigns: List,
+        optimization_goal: str = "roas",
+        platform_caps: Optional[Dict[str, float]] = None,
+        budget_step: float = 0.01,
+        simulation_draws: int = 0,
+        seed: Optional[int] = None,
+        target_roas: Optional[float] = None,
+    ) -> dict:
+        """Optimize like optimize() and keep the scored portfolio for what-if deltas."""
+        if not campaigns:
+            raise ValueError("No campaigns provided for the what-if session")
+        session = BudgetSession(
+            organization_id, total_budget, self._columns(campaigns), optimization_goal,
+            platform_caps, budget_step, BUDGET_MAX_CHANGE_FACTOR,
+        )
+        self.sessions.put(session)
+        response = {"session_id": session.session_id, "version": session.version, **self._portfolio_response(session)}
+        if simulation_draws:
+            response["simulation"] = self._simulate(session, simulation_draws, seed, target_roas)
+        return response
 
-        # Calculate efficiency scores
-        scored_campaigns = []
-        for c in campaigns:
-            campaign = c if isinstance(c, dict) else c.dict()
-            score = self._calculate_efficiency_score(campaign, optimization_goal)
-            scored_campaigns.append({**campaign, "efficiency_score": score})
+    def get_session(self, session_id: str) -> Optional[dict]:
+        """Full recommendations of a session at its latest version, or None if unknown or expired."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        with session.lock:
+            return {"session_id": session_id, "version": session.version, **self._portfolio_response(session)}
 
-        # Sort by efficiency
-        scored_campaigns.sort(key=lambda x: x["efficiency_score"], reverse=True)
+    def apply_delta(
+        self,
+        session_id: str,
+        total_budget: Optional[float] = None,
+        campaigns: Optional[List[Dict]] = None,
+        platform_caps: Optional[Dict[str, Optional[float]]] = None,
+        min_change_percent: Optional[float] = None,
+    ) -> Optional[dict]:
+        """
+        Apply a what-if delta to a session and return only what changed.
+        None if the session is unknown or expired; ValueError (session left
+        unchanged) when the delta's floors cannot fit in the budget or caps.
+        """
+        if min_change_percent is None:
+            min_change_percent = BUDGET_DELTA_MIN_CHANGE_PERCENT
 
-        # Allocate budget proportionally to efficiency
-        total_score = sum(c["efficiency_score"] for c in scored_campaigns)
-        if total_score == 0:
-            total_score = 1
+        def apply(session: BudgetSession) -> dict:
+            with session.lock:
+                delta = session.apply(total_budget, campaigns, platform_caps, min_change_percent)
+                return self._delta_response(session, delta["rows"], delta["previous"])
 
-        recommendations = []
-        total_recommended = 0
+        return self.sessions.update(session_id, apply)
+
+    def close_session(self, session_id: str) -> bool:
+        return self.sessions.pop(session_id)
 
-        for c in scored_campaigns:
-            proportion = c["efficiency_score"] / total_score
-            recommended = round(total_budget * proportion, 2)
-            current = c["current_budget"]
-            change_pct = ((recommended - current) / current * 100) if current > 0 else 0
+    def session_stats(self) -> Dict:
+        return self.sessions.stats()
 
-            reason = self._generate_reason(c, optimization_goal, change_pct)
+    def _portfolio_response(self, session: BudgetSession) -> dict:
+        columns, goal = session.columns, session.optimization_goal
+        current, recommended = columns["current_budget"], session.allocation
+        change_pct = self._change_percent(current, recommended)
+        marginal = session.marginal()
+        # Most efficient campaigns first
+        order = np.argsort(-self._efficiency_scores(columns, goal), kind="stable")
 
+        recommendations = []
+        for i, campaign_id, budget, change, margin in zip(
+            order.tolist(),
+            session.campaign_ids[order].tolist(),
+            np.round(recommended[order], 2).tolist(),
+            change_pct[order].tolist(),
+            np.round(marginal[order], 4).tolist(),
+        ):
+            platform = session.platform(i)
             recommendations.append({
-                "campaign_id": c["campaign_id"],
-                "platform": c["platform"],
-                "current_budget": current,
-                "recommended_budget": recommended,
-                "change_percent": round(change_pct, 1),
-                "reason": reason,
+                "campaign_id": campaign_id,
+                "platform": platform,
+                "current_budget": float(current[i]),
+                "recommended_budget": budget,
+                "change_percent": round(change, 1),
+                "marginal_return": margin,
+                "reason": self._generate_reason(platform, goal, self._goal_metric(columns, goal, i), change),
             })
-            total_recommended += recommended
-
-        # Calculate expected improvement
-        current_weighted_roas = self._weighted_metric(scored_campaigns, "roas", "current_budget")
-        expected_weighted_roas = self._weighted_metric(
-            scored_campaigns, "roas", "efficiency_score"
-        )
-
-        expected_improvement = {
-            "metric": optimization_goal,
-            "current_weighted_value": round(current_weighted_roas, 2),
-            "expected_weighted_value": round(expected_weighted_roas, 2),
-            "improvement_percent": round(
-                ((expected_weighted_roas - current_weighted_roas) / current_weighted_roas * 100)
-                if current_weighted_roas > 0
-                else 0,
-                1,
-            ),
-        }
 
         # Generate summary
         increases = [r for r in recommendations if r["change_percent"] > 5]
         decreases = [r for r in recommendations if r["change_percent"] < -5]
         summary_parts = [
-            f"Budget optimization for {len(campaigns)} campaigns (${total_budget:,.2f} total)."
+            f"Budget optimization for {len(session)} campaigns (${session.total_budget:,.2f} total)."
         ]
         if increases:
             platforms = set(r["platform"] for r in increases)
@@ -95,44 +185,178 @@ class BudgetService:
             summary_parts.append(f"Decrease budget for {len(decreases)} campaign(s) on {', '.join(platforms)}.")
 
         return {
-            "organization_id": organization_id,
-            "total_budget": total_budget,
+            "organization_id": session.organization_id,
+            "total_budget": session.total_budget,
             "recommendations": recommendations,
-            "expected_improvement": expected_improvement,
+            "expected_improvement": self._expected_improvement(session),
+            "unallocated_budget": round(session.unallocated, 2),
             "summary": " ".join(summary_parts),
         }
 
-    def _calculate_efficiency_score(self, campaign: dict, goal: str) -> float:
-        """Calculate efficiency score based on optimization goal."""
+    def _delta_response(self, session: BudgetSession, rows: np.ndarray, previous: np.ndarray) -> dict:
+        """Only the campaigns a delta edited or moved materially, largest moves first."""
+        columns, goal = session.columns, session.optimization_goal
+        current, recommended = columns["current_budget"][rows], session.allocation[rows]
+        order = np.argsort(-np.abs(recommended - previous), kind="stable")
+        rows, current, recommended, previous = rows[order], current[order], recommended[order], previous[order]
+        change_pct = self._change_percent(current, recommended)
+
+        changes = []
+        for i, campaign_id, before, now, budget, change, margin in zip(
+            rows.tolist(),
+            session.campaign_ids[rows].tolist(),
+            np.round(previous, 2).tolist(),
+            current.tolist(),
+            np.round(recommended, 2).tolist(),
+            change_pct.tolist(),
+            np.round(session.marginal(rows), 4).tolist(),
+        ):
+            platform = session.platform(i)
+            changes.append({
+                "campaign_id": campaign_id,
+                "platform": platform,
+                "current_budget": now,
+                "previous_recommended_budget": before,
+                "recommended_budget": budget,
+                "change_percent": round(change, 1),
+                "marginal_return": margin,
+                "reason": self._generate_reason(platform, goal, self._goal_metric(columns, goal, i), change),
+            })
+
+        return {
+            "session_id": session.session_id,
+            "version": session.version,
+            "total_budget": session.total_budget,
+            "changes": changes,
+            "unchanged_count": len(session) - len(changes),
+            "expected_improvement": self._expected_improvement(session),
+            "unallocated_budget": round(session.unallocated, 2),
+        }
+
+    def _expected_improvement(self, session: BudgetSession) -> Dict:
+        """Expected improvement from the response curves at current vs recommended budgets."""
+        goal = session.optimization_goal
+        current, recommended = session.columns["current_budget"], session.allocation
+        current_return = float(curve_value(session.a, session.s0, current).sum())
+        expected_return = float(curve_value(session.a, session.s0, recommended).sum())
+        current_weighted = self._goal_value(goal, current_return, float(current.sum()))
+        expected_weighted = self._goal_value(goal, expected_return, float(recommended.sum()))
+        # Lower cost per conversion is the improvement for CPA
+        gain = current_weighted - expected_weighted if goal == "cpa" else expected_weighted - current_weighted
+        return {
+            "metric": goal,
+            "current_weighted_value": round(current_weighted, 2),
+            "expected_weighted_value": round(expected_weighted, 2),
+            "improvement_percent": round(gain / current_weighted * 100 if current_weighted > 0 else 0, 1),
+            "current_projected_return": round(current_return, 2),
+            "expected_projected_return": round(expected_return, 2),
+        }
+
+    def _simulate(self, session: BudgetSession, draws: int, seed: Optional[int], target_roas: Optional[float]) -> Dict:
+        """
+        Projected return of the current and the recommended allocation over
+        draws of each campaign's curve scale (BUDGET_SIM_CURVE_CV) and daily
+        noise (BUDGET_SIM_NOISE_CV), with the probability that the
+        recommendation beats the current allocation on the goal and, for
+        ROAS, of reaching target_roas.
+        """
+        goal = session.optimization_goal
+        budgets = np.column_stack([session.columns["current_budget"], session.allocation])
+        observed = session.curve_returns(session.columns)
+        form = {
+            "basis": np.log1p(np.maximum(budgets, 0) / session.s0[:, None]),
+            "slope": session.a,
+            "slope_se": session.a * BUDGET_SIM_CURVE_CV,
+            "intercept": np.zeros(len(session)),
+            "intercept_loading": np.zeros(len(session)),
+            "intercept_se": np.maximum(observed, 0) * BUDGET_SIM_NOISE_CV,
+        }
+        target = target_roas if goal == "roas" else None
+        sim = budget_simulation.simulate(form, budgets, draws, seed, target_roas=target)
+
+        # Goal value per draw: lower is better for CPA
+        spend = budgets.sum(axis=0)
+        totals = sim["totals"]
+        if goal == "cpa":
+            with np.errstate(divide="ignore"):
+                weighted = np.where(totals > 0, spend / totals, np.inf)
+            improved = weighted[:, 1] < weighted[:, 0]
+        else:
+            weighted = totals / np.maximum(spend, 1e-9) if goal == "roas" else totals
+            improved = weighted[:, 1] > weighted[:, 0]
+
+        percentiles = sim["percentiles"]
+        summary = {
+            "draws": sim["draws"],
+            "seed": sim["seed"],
+            "percentiles": percentiles,
+            "allocations": ["current", "recommended"],
+            "projected_return": budget_simulation.bands(sim["revenue"], percentiles),
+            "probability_improvement": round(float(improved.mean()), 4),
+        }
+        if goal == "roas":
+            summary["roas"] = budget_simulation.bands(sim["roas"], percentiles)
+        if "prob_target_roas" in sim:
+            summary["probability_target_roas"] = np.round(sim["prob_target_roas"], 4).tolist()
+        return summary
+
+    def _change_percent(self, current: np.ndarray, recommended: np.ndarray) -> np.ndarray:
+        return np.where(current > 0, (recommended - current) / np.where(current > 0, current, 1) * 100, 0.0)
+
+    def _goal_metric(self, columns: Dict, goal: str, row: int):
+        """The campaign's value of the goal metric as shown in reasons."""
+        if goal not in ("roas", "cpa", "conversions"):
+            return "N/A"
+        value = columns[goal][row].item()
+        return int(value) if goal == "conversions" else value
+
+    def _columns(self, campaigns: List) -> Dict:
+        """Campaign fields as arrays."""
+        records = [c if isinstance(c, dict) else c.dict() for c in campaigns]
+        columns = {
+            "campaign_id": np.array([r["campaign_id"] for r in records], dtype=np.int64),
+            "platform": [r["platform"] for r in records],
+        }
+        for field in ("current_budget", "spend", "revenue", "roas", "cpa", "conversions"):
+            columns[field] = np.array([r.get(field, 0) for r in records], dtype=np.float64)
+        for field in ("min_budget", "max_budget"):
+            columns[field] = np.array(
+                [np.nan if r.get(field) is None else r[field] for r in records], dtype=np.float64
+            )
+        return columns
+
+    def _efficiency_scores(self, columns: Dict, goal: str) -> np.ndarray:
+        """Efficiency score per campaign for the optimization goal."""
+        if goal == "roas":
+            return np.maximum(0, columns["roas"])
+        if goal == "cpa":
+            cpa = columns["cpa"]
+            return np.where(cpa > 0, 1 / np.where(cpa > 0, cpa, 1), 0.0)
+        if goal == "conversions":
+            spend = columns["spend"]
+            return np.where(spend > 0, columns["conversions"] / np.where(spend > 0, spend, 1), 0.0)
+        return np.zeros(len(columns["roas"]))
+
+    def _goal_value(self, goal: str, total_return: float, total_budget: float) -> float:
+        """Portfolio value of the goal: ROAS, cost per conversion, or conversions."""
         if goal == "roas":
-            return max(0, campaign.get("roas", 0))
-        elif goal == "cpa":
-            cpa = campaign.get("cpa", float("inf"))
-            return max(0, 1 / cpa) if cpa > 0 else 0
-        elif goal == "conversions":
-            spend = campaign.get("spend", 1)
-            conversions = campaign.get("conversions", 0)
-            return conversions / spend if spend > 0 else 0
-        return 0
-
-    def _generate_reason(self, campaign: dict, goal: str, change_pct: float) -> str:
+            return total_return / total_budget if total_budget > 0 else 0.0
+        if goal == "cpa":
+            return total_budget / total_return if total_return > 0 else 0.0
+        return total_return
+
+    def _generate_reason(self, platform: str, goal: str, metric, change_pct: float) -> str:
         if abs(change_pct) < 5:
-            return f"Maintain current budget. {goal.upper()} is at {campaign.get(goal, 'N/A')}."
+            return f"Maintain current budget. {goal.upper()} is at {metric}."
         elif change_pct > 0:
             return (
                 f"Increase budget by {abs(change_pct):.1f}%. "
-                f"Strong {goal.upper()} performance ({campaign.get(goal, 'N/A')}) "
-                f"on {campaign['platform']}."
+                f"Strong {goal.upper()} performance ({metric}) "
+                f"on {platform}."
             )
         else:
             return (
                 f"Decrease budget by {abs(change_pct):.1f}%. "
-                f"Below-average {goal.upper()} ({campaign.get(goal, 'N/A')}) "
-                f"on {campaign['platform']}."
+                f"Below-average {goal.upper()} ({metric}) "
+                f"on {platform}."
             )
-
-    def _weighted_metric(self, campaigns, metric_key, weight_key):
-        total_weight = sum(c.get(weight_key, 0) for c in campaigns)
-        if total_weight == 0:
-            return 0
-        return sum(c.get(metric_key, 0) * c.get(weight_key, 0) for c in campaigns) / total_weight
@@ -0,0 +1,214 @@
+"""
+Budget What-If Sessions
+=======================
+A scored portfolio kept between what-if requests: the campaign columns,
+their fitted response curves, bounds, platform caps and the current
+allocation. A delta (new total budget, a pinned or bounded campaign, a
+platform cap, refreshed performance) patches only the affected rows, refits
+only their curves and re-solves the allocation from the cached curves. The
+caller gets back just the campaigns whose recommendation moved.
+"""
+
+import io
+import json
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.budget_allocator import allocate, fit_response_curves, group_caps, group_index, marginal_return
+
+# Fields a delta may update per campaign; None clears a bound and leaves performance as is
+PERFORMANCE_FIELDS = ("current_budget", "spend", "revenue", "roas", "cpa", "conversions")
+BOUND_FIELDS = ("min_budget", "max_budget", "locked_budget")
+
+
+class BudgetSession:
+    """
+    Column arrays for one portfolio plus its allocation. Deltas are staged on
+    copies and committed only when the re-solve succeeds, so a rejected delta
+    (e.g. floors above the budget) leaves the session unchanged.
+    """
+
+    def __init__(
+        self,
+        organization_id: int,
+        total_budget: float,
+        columns: Dict,
+        optimization_goal: str = "roas",
+        platform_caps: Optional[Dict[str, float]] = None,
+        budget_step: float = 0.01,
+        max_change_factor: float = 3.0,
+    ):
+        self.session_id = uuid.uuid4().hex
+        self.organization_id = organization_id
+        self.total_budget = float(total_budget)
+        self.optimization_goal = optimization_goal
+        self.platform_caps = {name: float(cap) for name, cap in (platform_caps or {}).items()}
+        self.budget_step = budget_step
+        self.max_change_factor = max_change_factor
+        self.version = 0
+        self.lock = threading.Lock()
+
+        self.campaign_ids = columns["campaign_id"]
+        self._id_order = np.argsort(self.campaign_ids, kind="stable")
+        self.platform_names, self.groups = group_index(columns["platform"])
+        self.columns = {field: columns[field].copy() for field in PERFORMANCE_FIELDS + ("min_budget", "max_budget")}
+        self.columns["locked_budget"] = np.full(len(self.campaign_ids), np.nan)
+        self.a, self.s0 = fit_response_curves(self.columns["spend"], self.curve_returns(self.columns))
+
+        self.allocation, self.unallocated = self._solve(
+            self.columns, self.a, self.s0, self.total_budget, group_caps(self.platform_names, self.platform_caps)
+        )
+        # Recommendations as last returned to the caller; deltas are diffed against these
+        self.reported = self.allocation.copy()
+
+    def __len__(self) -> int:
+        return len(self.campaign_ids)
+
+    def to_bytes(self) -> bytes:
+        """Columns, curves and allocation as an .npz archive (no pickled objects)."""
+        meta = {
+            "session_id": self.session_id,
+            "organization_id": self.organization_id,
+            "total_budget": self.total_budget,
+            "optimization_goal": self.optimization_goal,
+            "platform_caps": self.platform_caps,
+            "budget_step": self.budget_step,
+            "max_change_factor": self.max_change_factor,
+            "version": self.version,
+            "unallocated": float(self.unallocated),
+        }
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            meta=np.array(json.dumps(meta)),
+            campaign_ids=self.campaign_ids,
+            platform_names=self.platform_names,
+            groups=self.groups,
+            a=self.a,
+            s0=self.s0,
+            allocation=self.allocation,
+            reported=self.reported,
+            **{f"column_{field}": values for field, values in self.columns.items()},
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BudgetSession":
+        """Rebuild a session from to_bytes() without refitting or re-solving."""
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        session = cls.__new__(cls)
+        for name, value in json.loads(str(arrays.pop("meta"))).items():
+            setattr(session, name, value)
+        session.lock = threading.Lock()
+        session.columns = {
+            name[len("column_"):]: arrays.pop(name) for name in list(arrays) if name.startswith("column_")
+        }
+        for name, value in arrays.items():
+            setattr(session, name, value)
+        session._id_order = np.argsort(session.campaign_ids, kind="stable")
+        return session
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.campaign_ids, self._id_order, self.groups, self.a, self.s0, self.allocation, self.reported]
+        return sum(arr.nbytes for arr in arrays + list(self.columns.values()))
+
+    def marginal(self, rows=slice(None)) -> np.ndarray:
+        return marginal_return(self.a[rows], self.s0[rows], self.allocation[rows])
+
+    def platform(self, row: int) -> str:
+        return str(self.platform_names[self.groups[row]])
+
+    def rows_for(self, campaign_ids: List[int]) -> np.ndarray:
+        """Row index of each campaign id; raises ValueError for ids not in the session."""
+        ids = np.asarray(campaign_ids, dtype=np.int64)
+        pos = np.searchsorted(self.campaign_ids, ids, sorter=self._id_order)
+        pos = np.minimum(pos, len(self._id_order) - 1)
+        rows = self._id_order[pos]
+        missing = ids[self.campaign_ids[rows] != ids]
+        if len(missing):
+            raise ValueError(f"Campaigns not in this session: {', '.join(map(str, missing[:10].tolist()))}")
+        return rows
+
+    def apply(
+        self,
+        total_budget: Optional[float] = None,
+        campaigns: Optional[List[Dict]] = None,
+        platform_caps: Optional[Dict[str, Optional[float]]] = None,
+        min_change_percent: float = 1.0,
+    ) -> Dict:
+        """
+        Apply a delta and re-solve. campaigns holds {campaign_id, field: value}
+        updates for PERFORMANCE_FIELDS and BOUND_FIELDS (locked_budget pins the
+        recommendation). platform_caps entries set a cap, or clear it with None.
+        Any change to the budget shifts the common marginal return, so most
+        campaigns move by cents; only rows edited by the delta or whose
+        recommendation moved at least min_change_percent (and one budget step)
+        from the value last returned are reported, with that value as previous.
+        """
+        campaigns = campaigns or []
+        columns = dict(self.columns)
+        a, s0 = self.a, self.s0
+        touched = np.zeros(len(self), dtype=bool)
+
+        if campaigns:
+            rows = self.rows_for([c["campaign_id"] for c in campaigns])
+            touched[rows] = True
+            for field in PERFORMANCE_FIELDS + BOUND_FIELDS:
+                updates = [
+                    (row, c[field]) for row, c in zip(rows.tolist(), campaigns)
+                    if field in c and (c[field] is not None or field in BOUND_FIELDS)
+                ]
+                if not updates:
+                    continue
+                columns[field] = columns[field].copy()  # copy-on-write, committed below
+                for row, value in updates:
+                    columns[field][row] = np.nan if value is None else value
+            # Refit only the curves whose inputs changed
+            refit = np.unique([
+                row for row, c in zip(rows.tolist(), campaigns)
+                if any(c.get(f) is not None for f in ("spend", "revenue", "conversions"))
+            ]).astype(np.int64)
+            if len(refit):
+                a, s0 = a.copy(), s0.copy()
+                a[refit], s0[refit] = fit_response_curves(columns["spend"][refit], self.curve_returns(columns, refit))
+
+        caps = dict(self.platform_caps)
+        for name, cap in (platform_caps or {}).items():
+            if cap is None:
+                caps.pop(name, None)
+            else:
+                caps[name] = float(cap)
+        budget = self.total_budget if total_budget is None else float(total_budget)
+
+        allocation, unallocated = self._solve(columns, a, s0, budget, group_caps(self.platform_names, caps))
+        threshold = np.maximum(self.reported * min_change_percent / 100, self.budget_step - 1e-9)
+        rows = np.flatnonzero(touched | (np.abs(allocation - self.reported) >= threshold))
+        previous = self.reported[rows]
+        reported = self.reported.copy()
+        reported[rows] = allocation[rows]
+
+        self.columns, self.a, self.s0 = columns, a, s0
+        self.platform_caps, self.total_budget = caps, budget
+        self.allocation, self.unallocated, self.reported = allocation, unallocated, reported
+        self.version += 1
+        return {"rows": rows, "previous": previous}
+
+    def curve_returns(self, columns: Dict, rows=slice(None)) -> np.ndarray:
+        """Return modelled by the response curves: revenue for ROAS, conversions otherwise."""
+        field = "revenue" if self.optimization_goal == "roas" else "conversions"
+        return columns[field][rows]
+
+    def _solve(self, columns: Dict, a, s0, total_budget: float, caps: np.ndarray):
+        current, spend = columns["current_budget"], columns["spend"]
+        reference = np.maximum(current, spend)
+        default_upper = np.where(reference > 0, reference * self.max_change_factor, total_budget)
+        locked = columns["locked_budget"]
+        lower = np.where(np.isnan(locked), np.nan_to_num(columns["min_budget"], nan=0.0), locked)
+        upper = np.where(np.isnan(columns["max_budget"]), default_upper, columns["max_budget"])
+        upper = np.where(np.isnan(locked), upper, locked)
+        return allocate(a, s0, total_budget, lower, upper, self.groups, caps, self.budget_step)
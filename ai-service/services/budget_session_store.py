@@ -0,0 +1,178 @@
+"""
+Budget Session Store
+====================
+What-if sessions in SQLite (WAL) shared by every service worker on the host,
+keyed by session_id, so a session created on one worker can be read, updated
+or closed from any other. A delta loads, applies and writes its session in
+one write transaction. Each worker also keeps decoded sessions in a local
+cache and only re-reads the stored copy when its version has moved on.
+Sessions expire after a TTL since their last change; the oldest are evicted
+beyond the entry and size caps.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Callable, Optional
+
+from services.budget_session import BudgetSession
+from services.cache import TTLCache
+
+
+class BudgetSessionStore:
+    def __init__(self, db_path: str, max_entries: int, ttl_seconds: float, max_bytes: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # Decoded sessions of this worker, checked against the stored version on use
+        self.local = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+        self._lock = threading.Lock()
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Autocommit; writes open their own transactions
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS budget_sessions ("
+                "session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, state BLOB NOT NULL, "
+                "nbytes INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS budget_sessions_updated ON budget_sessions (updated_at)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS budget_session_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+
+    def put(self, session: BudgetSession) -> None:
+        """Store a new session, then expire and evict to stay within the caps."""
+        state = session.to_bytes()
+        if len(state) > self.max_bytes:
+            raise ValueError(f"Session of {len(state)} bytes exceeds the {self.max_bytes}-byte session store")
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO budget_sessions (session_id, version, state, nbytes, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session.session_id, session.version, state, len(state), now),
+                )
+                self._purge(now)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self.local.put(session.session_id, session, size=session.nbytes)
+
+    def get(self, session_id: str) -> Optional[BudgetSession]:
+        """The session at its latest stored version, or None if unknown or expired."""
+        with self._lock:
+            return self._load(session_id, time.time())
+
+    def update(self, session_id: str, apply: Callable[[BudgetSession], Any]) -> Any:
+        """
+        Run apply(session) and store the changed session in one write
+        transaction, so deltas to a session from several workers apply one
+        after another. Returns apply's result, or None if the session is
+        unknown or expired. The stored session is unchanged if apply raises.
+        """
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock before reading the session
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                session = self._load(session_id, now)
+                if session is None:
+                    self._db.execute("ROLLBACK")
+                    return None
+                result = apply(session)
+                state = session.to_bytes()
+                self._db.execute(
+                    "UPDATE budget_sessions SET version = ?, state = ?, nbytes = ?, updated_at = ? WHERE session_id = ?",
+                    (session.version, state, len(state), now, session_id),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                # The local copy may be ahead of the stored one
+                self.local.pop(session_id)
+                raise
+        # Re-put to refresh the local TTL of an active session
+        self.local.put(session_id, session, size=session.nbytes)
+        return result
+
+    def pop(self, session_id: str) -> bool:
+        self.local.pop(session_id)
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM budget_sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).rowcount > 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, stored_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM budget_sessions WHERE updated_at >= ?",
+                (time.time() - self.ttl_seconds,),
+            ).fetchone()
+            counters = dict(self._db.execute("SELECT name, value FROM budget_session_counters").fetchall())
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "bytes": stored_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0),
+            "worker_cache": self.local.stats(),
+        }
+
+    def close(self) -> None:
+        """Sessions are already persistent; only release the connection."""
+        self.local.clear()
+        with self._lock:
+            self._db.close()
+
+    def _load(self, session_id: str, now: float) -> Optional[BudgetSession]:
+        row = self._db.execute(
+            "SELECT version FROM budget_sessions WHERE session_id = ? AND updated_at >= ?",
+            (session_id, now - self.ttl_seconds),
+        ).fetchone()
+        if row is None:
+            self.local.pop(session_id)
+            return None
+        session = self.local.get(session_id)
+        if session is not None and session.version == row[0]:
+            return session
+        # Changed by another worker (or not seen here yet)
+        (state,) = self._db.execute("SELECT state FROM budget_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        session = BudgetSession.from_bytes(state)
+        self.local.put(session_id, session, size=session.nbytes)
+        return session
+
+    def _purge(self, now: float) -> None:
+        """Drop expired sessions and the least recently changed ones beyond the caps."""
+        expired = self._db.execute(
+            "DELETE FROM budget_sessions WHERE updated_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        kept, kept_bytes, evict = 0, 0, []
+        for session_id, nbytes in self._db.execute(
+            "SELECT session_id, nbytes FROM budget_sessions ORDER BY updated_at DESC"
+        ).fetchall():
+            if kept < self.max_entries and kept_bytes + nbytes <= self.max_bytes:
+                kept += 1
+                kept_bytes += nbytes
+            else:
+                evict.append((session_id,))
+        self._db.executemany("DELETE FROM budget_sessions WHERE session_id = ?", evict)
+        for name, count in (("expirations", expired), ("evictions", len(evict))):
+            if count:
+                self._db.execute(
+                    "INSERT INTO budget_session_counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (name, count),
+                )
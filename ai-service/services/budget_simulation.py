@@ -0,0 +1,97 @@
+"""
+Budget Simulation
+=================
+Monte Carlo revenue outcomes for budget allocations under response-curve
+uncertainty. Every campaign's revenue is linear in its curve parameters,
+    revenue = slope * basis(budget) + intercept
+(see response_curves.linear_form), so a draw needs two standard normals per
+campaign. Draws x campaigns x allocations are evaluated as one array
+expression per block of draws, with a seeded Generator so results are
+reproducible and independent of the block size.
+"""
+
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+SIM_DEFAULT_DRAWS = int(os.getenv("BUDGET_SIM_DRAWS", "10000"))
+SIM_MAX_DRAWS = int(os.getenv("BUDGET_SIM_MAX_DRAWS", "100000"))
+# Elements (draws x campaigns x allocations) evaluated per block; bounds memory
+SIM_BLOCK_ELEMENTS = int(os.getenv("BUDGET_SIM_BLOCK_ELEMENTS", "1000000"))
+SIM_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def simulate(
+    form: Dict[str, np.ndarray],
+    budgets: np.ndarray,
+    draws: int = SIM_DEFAULT_DRAWS,
+    seed: Optional[int] = None,
+    target_roas: Optional[float] = None,
+    campaign_targets: Optional[np.ndarray] = None,
+    percentiles: Sequence[float] = SIM_PERCENTILES,
+) -> Dict:
+    """
+    Sample revenue for every campaign at every allocation (budgets is
+    campaigns x allocations; an allocation is one column). Returns portfolio
+    revenue and ROAS percentiles per allocation, P(portfolio ROAS >=
+    target_roas), the per-draw portfolio totals for comparing allocations and,
+    with campaign_targets, each campaign's P(ROAS >= its target).
+    Revenue is floored at zero. Raises ValueError for draws outside
+    [1, SIM_MAX_DRAWS].
+    """
+    if not 1 <= draws <= SIM_MAX_DRAWS:
+        raise ValueError(f"Simulation draws must be between 1 and {SIM_MAX_DRAWS}")
+    if seed is None:
+        seed = int(np.random.default_rng().integers(2 ** 31))
+    rng = np.random.default_rng(seed)
+
+    n_campaigns, n_allocations = budgets.shape
+    basis = form["basis"].astype(np.float32)
+    slope, slope_se = form["slope"].astype(np.float32), form["slope_se"].astype(np.float32)
+    intercept = form["intercept"].astype(np.float32)
+    loading, intercept_se = form["intercept_loading"].astype(np.float32), form["intercept_se"].astype(np.float32)
+    if campaign_targets is not None:
+        thresholds = (campaign_targets[:, None] * budgets).astype(np.float32)
+        hits = np.zeros((n_campaigns, n_allocations), dtype=np.int64)
+
+    block = max(1, SIM_BLOCK_ELEMENTS // max(1, n_campaigns * n_allocations))
+    revenue = np.empty((min(block, draws), n_campaigns, n_allocations), dtype=np.float32)
+    totals = np.empty((draws, n_allocations))
+    for start in range(0, draws, block):
+        size = min(block, draws - start)
+        # One call per block keeps the stream identical for any block size
+        z = rng.standard_normal((size, n_campaigns, 2), dtype=np.float32)
+        draw_slope = slope + slope_se * z[:, :, 0]
+        draw_intercept = intercept + loading * z[:, :, 0] + intercept_se * z[:, :, 1]
+        out = revenue[:size]
+        np.multiply(draw_slope[:, :, None], basis, out=out)
+        out += draw_intercept[:, :, None]
+        np.maximum(out, 0, out=out)
+        totals[start:start + size] = out.sum(axis=1, dtype=np.float64)
+        if campaign_targets is not None:
+            hits += (out >= thresholds).sum(axis=0)
+
+    spend = np.maximum(budgets.sum(axis=0), 1e-9)
+    roas = totals / spend
+    result = {
+        "draws": draws,
+        "seed": seed,
+        "percentiles": list(percentiles),
+        "revenue": np.percentile(totals, percentiles, axis=0),  # percentiles x allocations
+        "roas": np.percentile(roas, percentiles, axis=0),
+        "mean_revenue": totals.mean(axis=0),
+        "totals": totals,
+    }
+    if target_roas is not None:
+        result["prob_target_roas"] = (roas >= target_roas).mean(axis=0)
+    if campaign_targets is not None:
+        result["campaign_prob_target_roas"] = hits / draws
+    return result
+
+
+def bands(values: np.ndarray, percentiles: Sequence[float], decimals: int = 2) -> Dict[str, list]:
+    """Percentile rows as {"p5": [...per allocation], ...}."""
+    return {
+        f"p{p:g}": row for p, row in zip(percentiles, np.round(values, decimals).tolist())
+    }
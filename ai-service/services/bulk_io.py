@@ -0,0 +1,215 @@
+"""
+Bulk Streaming I/O
+==================
+Incremental readers and writers for portfolio-wide bulk endpoints. Request
+bodies are consumed chunk by chunk as newline-delimited JSON or Arrow IPC
+record batches, so only the records in flight are held in memory; results
+go back as NDJSON lines as soon as each one is ready.
+
+Arrow bodies carry one row per series: a "values" list<double> column (read
+as zero-copy NumPy slices), plus scalar columns named like the JSON fields
+(campaign_id, metric, start_date, ...).
+"""
+
+import io
+import json
+import queue
+import asyncio
+import logging
+from typing import AsyncIterator, Optional, Tuple
+
+import numpy as np
+from fastapi.responses import StreamingResponse
+
+from services import backends
+from services.series import ARROW_CONTENT_TYPES, resolve_series
+from services.fast_json import dumps
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+BULK_MAX_LINE_BYTES = 16 * 1024 * 1024
+# Body chunks buffered between the event loop and the Arrow parser thread
+ARROW_QUEUE_CHUNKS = 16
+
+
+async def iter_records(
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str] = None,
+) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Yield (index, record, error) for each record in an NDJSON or Arrow body."""
+    media_type = (content_type or NDJSON_MEDIA_TYPE).split(";")[0].strip().lower()
+    records = _iter_arrow(chunks) if media_type in ARROW_CONTENT_TYPES else _iter_ndjson(chunks)
+    index = 0
+    async for record, error in records:
+        yield index, record, error
+        index += 1
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body generator is still reading the request body.
+    The stock response listens for http.disconnect on receive() while
+    streaming (ASGI < 2.4), which would steal request body messages from the
+    generator; here a disconnect surfaces through the request stream instead.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def ndjson_line(obj: dict) -> bytes:
+    return dumps(obj) + b"\n"
+
+
+async def _iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Optional[dict], Optional[str]]]:
+    # Only the newly appended bytes are searched for a newline, so a long
+    # record arriving in many chunks is copied and scanned once, not per chunk
+    buffer = bytearray()
+    async for chunk in chunks:
+        scanned = len(buffer)
+        buffer += chunk
+        end = buffer.rfind(b"\n", scanned)
+        if end >= 0:
+            complete = buffer[:end]
+            del buffer[:end + 1]
+        if len(buffer) > BULK_MAX_LINE_BYTES:
+            yield None, f"Record exceeds {BULK_MAX_LINE_BYTES} bytes"
+            return
+        if end < 0:
+            continue
+        for line in complete.split(b"\n"):
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> Tuple[Optional[dict], Optional[str]]:
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+    if not isinstance(record, dict):
+        return None, "Each line must be a JSON object"
+    return record, None
+
+
+class _ChunkReader(io.RawIOBase):
+    """Blocking file-like view over body chunks pushed from the event loop."""
+
+    def __init__(self):
+        self.chunks = queue.Queue(maxsize=ARROW_QUEUE_CHUNKS)
+        self._buffer = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._eof:
+            chunk = self.chunks.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = chunk
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+async def _iter_arrow(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Optional[dict], Optional[str]]]:
+    """Parse an Arrow IPC stream in a worker thread, one record batch at a time."""
+    pa = backends.load("pyarrow")
+    loop = asyncio.get_running_loop()
+    reader = _ChunkReader()
+    batches: asyncio.Queue = asyncio.Queue(maxsize=2)
+    stopped = False
+
+    def parse():
+        def put(item):
+            if not stopped:
+                asyncio.run_coroutine_threadsafe(batches.put(item), loop).result()
+
+        try:
+            with pa.ipc.open_stream(io.BufferedReader(reader)) as stream:
+                for batch in stream:
+                    put(batch)
+        except Exception as e:
+            put(e)
+        finally:
+            put(None)
+
+    async def pump():
+        async for chunk in chunks:
+            await loop.run_in_executor(None, reader.chunks.put, chunk)
+        await loop.run_in_executor(None, reader.chunks.put, None)
+
+    parser = loop.run_in_executor(None, parse)
+    pumper = asyncio.ensure_future(pump())
+    try:
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                yield None, f"Invalid Arrow stream: {batch}"
+                break
+            for record in _batch_records(batch):
+                yield record, None
+    finally:
+        # Unblock the parser thread if the client went away mid-stream
+        stopped = True
+        pumper.cancel()
+        while not batches.empty():
+            batches.get_nowait()
+        try:
+            while True:
+                reader.chunks.get_nowait()
+        except queue.Empty:
+            pass
+        reader.chunks.put_nowait(None)
+        await asyncio.gather(pumper, parser, return_exceptions=True)
+
+
+def _batch_records(batch):
+    """Rows of one record batch; "values" become NumPy views into the Arrow buffer."""
+    columns = {}
+    offsets = flat = None
+    for name, column in zip(batch.schema.names, batch.columns):
+        if name == "values":
+            offsets = column.offsets.to_numpy()
+            flat = column.flatten().to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+        else:
+            columns[name] = column.to_pylist()
+
+    for row in range(batch.num_rows):
+        record = {name: values[row] for name, values in columns.items() if values[row] is not None}
+        if flat is not None:
+            start = offsets[row] - offsets[0]
+            record["values"] = flat[start:start + offsets[row + 1] - offsets[row]]
+        yield record
+
+
+def parse_series_record(record: dict, model, points_field: str):
+    """
+    Validate one bulk record against the endpoint's request model and resolve
+    its series. "values" bypasses pydantic so Arrow NumPy views stay uncopied.
+    Raises ValueError for invalid records.
+    """
+    values = record.pop("values", None)
+    request = model(**record)
+    return request, resolve_series(getattr(request, points_field), values, request.start_date, request.freq)
+
+
+def error_line(index: int, record: Optional[dict], error: str) -> bytes:
+    record = record or {}
+    return ndjson_line({
+        "index": index,
+        "campaign_id": record.get("campaign_id"),
+        "metric": record.get("metric"),
+        "error": error,
+    })
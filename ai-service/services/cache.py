@@ -0,0 +1,143 @@
+"""
+Cache Utilities
+===============
+Bounded in-memory caches shared by the AI services.
+LRU ordering with TTL expiry, an approximate memory cap, and hit/miss counters.
+"""
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+
+def estimate_size(obj: Any, _depth: int = 0) -> int:
+    """Approximate the in-memory footprint of a cached object in bytes."""
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if hasattr(obj, "memory_usage") and callable(obj.memory_usage):
+        try:
+            return int(np.sum(obj.memory_usage(deep=False)))
+        except Exception:
+            pass
+    if hasattr(obj, "get_booster"):
+        try:
+            return len(obj.get_booster().save_raw())
+        except Exception:
+            pass
+    size = sys.getsizeof(obj)
+    if _depth >= 3:
+        return size
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(estimate_size(v, _depth + 1) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), _depth + 1)
+    return size
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTL and a total size budget."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None, ttl_seconds: Optional[float] = None) -> None:
+        """ttl_seconds overrides the cache's TTL for this entry (e.g. the rest of a stored entry's lifetime)."""
+        if size is None:
+            size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if ttl_seconds is not None:
+            expires_at = time.monotonic() + ttl_seconds
+        else:
+            expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def items(self) -> list:
+        """Snapshot of live (key, value) pairs, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value)
+                for key, (value, _, expires_at) in self._entries.items()
+                if expires_at is None or expires_at >= now
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[2] is None or entry[2] >= time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,147 @@
+"""
+Exponential Smoothing
+=====================
+NumPy-only additive exponential smoothing: simple (SES), Holt's (damped)
+linear trend, and Holt-Winters with weekly seasonality. Many equal-length
+series are fitted at once: the smoothing recursion runs over time with every
+(series x parameter combination) state updated as one array operation, and
+each series keeps the combination with the lowest AICc.
+
+Prediction intervals use the analytical forecast variance of the equivalent
+ETS(A,Ad,A) state space model (Hyndman et al., 2008):
+    var_h = sigma^2 * (1 + sum_{j<h} c_j^2),  c_j = alpha + alpha*beta*phi_j + gamma*[j % m == 0]
+"""
+
+import os
+from typing import Dict
+
+import numpy as np
+
+SEASON_LENGTH = 7
+ETS_MIN_POINTS = 4
+ETS_MAX_SERIES_PER_PASS = int(os.getenv("FORECAST_ETS_SERIES_PER_PASS", "256"))
+
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+BETAS = (0.01, 0.05, 0.1, 0.2)
+GAMMAS = (0.05, 0.1, 0.2, 0.3)
+PHIS = (0.98, 1.0)
+
+FAMILIES = ("ses", "holt", "holt_winters")
+Z_95 = 1.959964
+
+
+def _parameter_grid():
+    rows = [(a, 0.0, 0.0, 1.0, 0) for a in ALPHAS]
+    rows += [(a, b, 0.0, p, 1) for a in ALPHAS for b in BETAS for p in PHIS]
+    rows += [(a, b, g, p, 2) for a in ALPHAS for b in BETAS for g in GAMMAS for p in PHIS]
+    grid = np.array(rows, dtype=np.float64)
+    return grid[:, 0], grid[:, 1], grid[:, 2], grid[:, 3], grid[:, 4].astype(np.int64)
+
+
+GRID_ALPHA, GRID_BETA, GRID_GAMMA, GRID_PHI, GRID_FAMILY = _parameter_grid()
+# Smoothing parameters + initial states estimated per family (for AICc)
+FAMILY_PARAMS = np.array([2, 5, 5 + SEASON_LENGTH])
+
+
+def fit(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Fit every family and parameter combination to a (series x points) array
+    (or one 1-D series) and keep the best per series. Returns per-series
+    parameters, final states and residual variance.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[None, :]
+    parts = [
+        _fit_block(values[start:start + ETS_MAX_SERIES_PER_PASS])
+        for start in range(0, len(values), ETS_MAX_SERIES_PER_PASS)
+    ]
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def forecast(fitted: Dict[str, np.ndarray], horizon: int, z: float = Z_95):
+    """Point forecasts and prediction interval bounds, each shaped (series x horizon)."""
+    mean, std = forecast_std(fitted, horizon)
+    return mean, mean - z * std, mean + z * std
+
+
+def forecast_std(fitted: Dict[str, np.ndarray], horizon: int):
+    """Point forecasts and forecast standard deviations, each shaped (series x horizon)."""
+    m = SEASON_LENGTH
+    steps = np.arange(1, horizon + 1)
+    phi = fitted["phi"][:, None]
+    # phi_h = phi + phi^2 + ... + phi^h
+    phi_h = np.cumsum(phi ** steps[None, :], axis=1)
+    season_index = (fitted["n"][:, None] + steps[None, :] - 1) % m
+    season = np.take_along_axis(fitted["season"], season_index, axis=1)
+    mean = fitted["level"][:, None] + phi_h * fitted["trend"][:, None] + season
+
+    alpha, beta, gamma = fitted["alpha"][:, None], fitted["beta"][:, None], fitted["gamma"][:, None]
+    c = alpha + alpha * beta * phi_h + gamma * (steps[None, :] % m == 0)
+    # var_h needs c_1..c_{h-1}: shift the cumulative sum by one step
+    c2 = np.concatenate([np.zeros((len(c), 1)), np.cumsum(c ** 2, axis=1)[:, :-1]], axis=1)
+    return mean, np.sqrt(fitted["sigma2"][:, None] * (1 + c2))
+
+
+def _fit_block(values: np.ndarray) -> Dict[str, np.ndarray]:
+    n_series, n = values.shape
+    m = SEASON_LENGTH
+    alpha, beta, gamma, phi = GRID_ALPHA, GRID_BETA, GRID_GAMMA, GRID_PHI
+    has_trend = GRID_FAMILY >= 1
+    has_season = GRID_FAMILY == 2
+
+    # Initial states: first-season mean level, season-over-season trend, first-season profile
+    if n >= 2 * m:
+        level0 = values[:, :m].mean(axis=1)
+        trend0 = (values[:, m:2 * m].mean(axis=1) - level0) / m
+        season0 = values[:, :m] - level0[:, None]
+    else:
+        level0 = values[:, 0]
+        trend0 = values[:, 1] - values[:, 0]
+        season0 = np.zeros((n_series, m))
+    level = np.repeat(level0[:, None], len(alpha), axis=1)
+    trend = np.where(has_trend, trend0[:, None], 0.0)
+    season = np.where(has_season[None, :, None], season0[:, None, :], 0.0)
+
+    sse = np.zeros_like(level)
+    for t in range(n):
+        y = values[:, t, None]
+        s_old = season[:, :, t % m]
+        damped_trend = phi * trend
+        error = y - (level + damped_trend + s_old)
+        sse += error * error
+        new_level = level + damped_trend + alpha * error
+        trend = damped_trend + alpha * beta * error
+        season[:, :, t % m] = s_old + gamma * error
+        level = new_level
+
+    # Families that need more history than the series has are excluded
+    k = FAMILY_PARAMS[GRID_FAMILY]
+    allowed = np.ones(len(alpha), dtype=bool)
+    allowed &= ~has_trend | (n >= ETS_MIN_POINTS)
+    allowed &= ~has_season | (n >= 2 * m)
+    allowed &= n - k - 1 > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aicc = n * np.log(np.maximum(sse, 1e-12) / n) + 2 * k + 2 * k * (k + 1) / np.maximum(n - k - 1, 1)
+    aicc = np.where(allowed[None, :], aicc, np.inf)
+    best = np.argmin(aicc, axis=1)
+    rows = np.arange(n_series)
+
+    dof = np.maximum(n - k[best], 1)
+    return {
+        "family": GRID_FAMILY[best],
+        "alpha": alpha[best],
+        "beta": beta[best],
+        "gamma": gamma[best],
+        "phi": phi[best],
+        "level": level[rows, best],
+        "trend": trend[rows, best],
+        "season": season[rows, best],
+        "sigma2": sse[rows, best] / dof,
+        "aicc": aicc[rows, best],
+        "n": np.full(n_series, n),
+    }
+
+
+def family_name(code: int) -> str:
+    return FAMILIES[int(code)]
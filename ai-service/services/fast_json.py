@@ -0,0 +1,86 @@
+"""
+Fast JSON Encoding
+==================
+orjson-based encoding for API responses, NDJSON lines and stored job
+results. NumPy arrays and scalars are encoded natively, so services can
+return them without converting element by element.
+
+FastJSONRoute makes a router's endpoints return encoded bytes directly,
+skipping FastAPI's jsonable_encoder walk over every element. Routes with a
+response_model are validated and serialized by pydantic in a single pass.
+"""
+
+import asyncio
+import functools
+from typing import Any
+
+import numpy as np
+import orjson
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+from starlette.responses import Response
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        # Non-contiguous or object arrays OPT_SERIALIZE_NUMPY does not take
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode to JSON bytes; NaN and infinity become null."""
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        response_model = kwargs.get("response_model")
+        if isinstance(response_model, DefaultPlaceholder):
+            response_model = response_model.value
+        super().__init__(path, _encoding_endpoint(endpoint, response_model, kwargs.get("status_code")), **kwargs)
+
+
+def _encoding_endpoint(endpoint, response_model, status_code):
+    """Wrap an endpoint so plain results are returned as already-encoded responses."""
+    # include_router re-creates routes from the already wrapped endpoint
+    if getattr(endpoint, "_fast_json", False):
+        return endpoint
+    adapter = TypeAdapter(response_model) if response_model is not None else None
+    status_code = status_code or 200
+
+    def encode(content):
+        if isinstance(content, Response):
+            return content
+        if adapter is not None:
+            body = adapter.dump_json(adapter.validate_python(content))
+            return Response(body, status_code=status_code, media_type="application/json")
+        return FastJSONResponse(content, status_code=status_code)
+
+    # FastAPI reads the signature through functools.wraps (__wrapped__) and
+    # runs sync endpoints in its threadpool, so keep the wrapper's kind
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return encode(await endpoint(*args, **kwargs))
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return encode(endpoint(*args, **kwargs))
+    wrapper._fast_json = True
+    return wrapper
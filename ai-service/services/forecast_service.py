@@ -6,77 +6,296 @@ Falls back gracefully between Prophet, XGBoost, and simple statistical methods.
 Includes budget optimization forecasting.
 """
 
+import os
+import time
+import hashlib
 import numpy as np
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from collections import deque
+from statistics import NormalDist
+from typing import List, Dict, Optional, Union
 import logging
 
+from services import backends
+from services.cache import TTLCache
+from services.rolling import rolling_mean
+from services.series import Series, as_series
+from services.model_selector import ModelSelector
+from services import budget_simulation, exp_smoothing, response_curves
+from services.global_xgboost import GlobalXGBoostForecaster, day_of_week
+
 logger = logging.getLogger(__name__)
 
+CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("FORECAST_CACHE_TTL_SECONDS", "86400"))
+CACHE_MAX_BYTES = int(os.getenv("FORECAST_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Incremental updates: series that grew by at most this many points are
+# warm-started from the previous fit instead of refitted from scratch.
+INCREMENTAL_MAX_NEW_POINTS = int(os.getenv("FORECAST_INCREMENTAL_MAX_POINTS", "14"))
+XGB_UPDATE_TREES = int(os.getenv("FORECAST_XGB_UPDATE_TREES", "10"))
+XGB_MAX_TREES = int(os.getenv("FORECAST_XGB_MAX_TREES", "300"))
+
+# z-score of the default lower_bound/upper_bound band (95%)
+DEFAULT_INTERVAL_Z = 1.96
+# Statistical model: one-step backtest errors needed before it reports a forecast std
+STAT_MIN_RESIDUALS = 5
+
+BUDGET_MIN_POINTS = 7
+BUDGET_SCENARIO_MULTIPLIERS = (0.5, 0.75, 1.0, 1.25, 1.5, 2.0)
+
 
 class ForecastService:
+    def __init__(
+        self,
+        model_cache: Optional[TTLCache] = None,
+        selector: Optional[ModelSelector] = None,
+        global_xgboost: Optional[GlobalXGBoostForecaster] = None,
+    ):
+        # Fitted models keyed by (campaign_id, metric, requested model, series fingerprint); the
+        # requested model is None for automatic selection. (campaign_id, metric, requested model)
+        # points at the latest fingerprint for incremental updates.
+        self.model_cache = model_cache if model_cache is not None else TTLCache(
+            max_entries=CACHE_MAX_ENTRIES,
+            ttl_seconds=CACHE_TTL_SECONDS,
+            max_bytes=CACHE_MAX_BYTES,
+        )
+        self.selector = selector if selector is not None else ModelSelector()
+        # Cross-series XGBoost models per metric, used in place of per-series fits once trained
+        self.global_xgboost = global_xgboost if global_xgboost is not None else GlobalXGBoostForecaster()
+
+    def close(self) -> None:
+        self.model_cache.clear()
+
     def predict(
         self,
         campaign_id: int,
         metric: str,
-        historical_data: List[dict],
+        historical_data: Union[List[dict], Series],
         forecast_days: int = 7,
+        max_latency_ms: Optional[float] = None,
+        model: Optional[str] = None,
+        interval_levels: Optional[List[float]] = None,
     ) -> dict:
-        """Generate forecast using best available model."""
+        """
+        Generate forecast using the best model that fits the series and the
+        optional fit latency budget (max_latency_ms), or the requested model.
+        interval_levels (e.g. [0.8, 0.95]) adds central prediction intervals
+        at those coverage levels for models with a forecast variance (ETS,
+        Prophet, statistical); XGBoost forecasts have none and omit them.
+        """
         if len(historical_data) < 3:
             return self._insufficient_data_response(campaign_id, metric, forecast_days)
 
-        values = [float(d["value"]) for d in historical_data]
-        dates = [d["date"] for d in historical_data]
+        series = as_series(historical_data)
+        values = series.values
+        dates = series.dates
 
-        try:
-            predictions = self._prophet_forecast(dates, values, forecast_days)
-            model_used = "prophet"
-        except Exception:
-            try:
-                predictions = self._xgboost_forecast(values, forecast_days)
-                model_used = "xgboost"
-            except Exception:
-                predictions = self._statistical_forecast(values, forecast_days)
-                model_used = "statistical"
-
-        last_date = datetime.strptime(dates[-1], "%Y-%m-%d")
-        result_predictions = []
-        for i, pred in enumerate(predictions):
-            pred_date = last_date + timedelta(days=i + 1)
-            std_dev = np.std(values) * 0.5
-            result_predictions.append({
-                "date": pred_date.strftime("%Y-%m-%d"),
-                "predicted_value": round(float(pred), 4),
-                "lower_bound": round(float(max(0, pred - 1.96 * std_dev)), 4),
-                "upper_bound": round(float(pred + 1.96 * std_dev), 4),
-            })
-
-        confidence = min(0.95, 0.5 + len(historical_data) * 0.01)
+        # Reuse the fitted model (and memoized forecasts) for an unchanged series and requested model
+        cache_key = (campaign_id, metric, model, self._series_fingerprint(dates, values))
+        fitted = self.model_cache.get(cache_key)
+        if fitted is not None and fitted["model_used"] == "global_xgboost":
+            fitted = self._current_global_fit(fitted)
+        fit_mode, fit_ms = "cached", 0.0
+        if fitted is None:
+            # Warm-start from the previous fit when the series only gained new points
+            fitted = self._update_previous_fit(campaign_id, metric, dates, values, max_latency_ms, model)
+            if fitted is None:
+                fitted = self._fit_best_model(metric, dates, values, max_latency_ms, model)
+            fit_mode, fit_ms = fitted["fit_mode"], fitted["fit_ms"]
+            self.model_cache.put((campaign_id, metric, model), cache_key[3], size=0)
+
+        forecast = fitted["forecasts"].get(forecast_days)
+        if forecast is None:
+            forecast = self._forecast_fitted(fitted, forecast_days)
+            fitted["forecasts"][forecast_days] = forecast
+            self.model_cache.put(cache_key, fitted)
+
+        return self._forecast_response(
+            campaign_id, metric, dates, values, fitted, forecast, fit_mode, fit_ms, interval_levels
+        )
+
+    def predict_batch_vectorized(self, requests: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Serve the requests that have an in-process vectorized path: model="ets"
+        and series covered by a trained global XGBoost model. Other entries are
+        None, left to the process pool.
+        """
+        results = [None] * len(requests)
+        ets, global_xgb = [], []
+        for i, req in enumerate(requests):
+            if req.get("model") == "ets":
+                ets.append(i)
+            elif len(req["historical_data"]) >= 3:
+                values = as_series(req["historical_data"]).values
+                if self._candidates(req["metric"], values, req.get("max_latency_ms"), req.get("model"))[0] == "global_xgboost":
+                    global_xgb.append(i)
+        for indices, run in ((ets, self.predict_batch_ets), (global_xgb, self.predict_batch_global)):
+            if indices:
+                for i, result in zip(indices, run([requests[i] for i in indices])):
+                    results[i] = result
+        return results
+
+    def predict_batch_global(self, requests: List[Dict]) -> List[Dict]:
+        """
+        Forecast series covered by a trained global XGBoost model with one
+        predict call per (metric, forecast_days) group.
+        """
+        results = [None] * len(requests)
+        groups = {}
+        for i, req in enumerate(requests):
+            series = as_series(req["historical_data"])
+            if self.global_xgboost.covers(req["metric"], len(series)):
+                groups.setdefault((req["metric"], req.get("forecast_days", 7)), []).append((i, series))
+            else:
+                results[i] = self.predict(**req)
+
+        for (metric, forecast_days), members in groups.items():
+            states = [self._global_xgboost_state(metric, series.dates, series.values) for _, series in members]
+            predictions = self.global_xgboost.predict(
+                metric,
+                np.stack([state["window"] for state in states]),
+                np.array([state["dow"] for state in states]),
+                forecast_days,
+            )
+            for row, (i, series) in enumerate(members):
+                req = requests[i]
+                fitted = self._fitted_entry("global_xgboost", states[row], series.dates, series.values, "global", 0.0)
+                forecast = (predictions[row], None)
+                fitted["forecasts"][forecast_days] = forecast
+                fingerprint = self._series_fingerprint(series.dates, series.values)
+                self.model_cache.put((req["campaign_id"], metric, req.get("model"), fingerprint), fitted)
+                self.model_cache.put((req["campaign_id"], metric, req.get("model")), fingerprint, size=0)
+                results[i] = self._forecast_response(
+                    req["campaign_id"], metric, series.dates, series.values, fitted, forecast, "global", 0.0,
+                    req.get("interval_levels"),
+                )
+        return results
+
+    def train_global_xgboost(self, requests: List[Dict]) -> Dict:
+        """Train one global XGBoost model per metric from the given series."""
+        by_metric = {}
+        for req in requests:
+            by_metric.setdefault(req["metric"], []).append(as_series(req["historical_data"]))
+        # Forecasts memoized from a previous model are dropped on their next use
+        # (see _current_global_fit), on this worker and the others
+        trained = {metric: self.global_xgboost.train(metric, series) for metric, series in by_metric.items()}
+        return {"models": trained}
+
+    def predict_batch_ets(self, requests: List[Dict]) -> List[Dict]:
+        """
+        Exponential smoothing forecasts for many series in one vectorized pass
+        per (length, forecast_days) group. Series ETS cannot handle (too short
+        or flat) go through predict().
+        """
+        results = [None] * len(requests)
+        groups = {}
+        for i, req in enumerate(requests):
+            series = as_series(req["historical_data"])
+            if self.selector.candidates(series.values, model="ets")[0] == "ets":
+                groups.setdefault((len(series), req.get("forecast_days", 7)), []).append((i, series))
+            else:
+                results[i] = self.predict(**{**req, "model": "ets"})
+
+        for (_, forecast_days), members in groups.items():
+            started = time.perf_counter()
+            state = exp_smoothing.fit(np.stack([series.values for _, series in members]))
+            mean, std = exp_smoothing.forecast_std(state, forecast_days)
+            fit_ms = (time.perf_counter() - started) * 1000 / len(members)
+            self.selector.record_fit("ets", fit_ms)
+
+            for row, (i, series) in enumerate(members):
+                req = requests[i]
+                model = {key: value[row:row + 1] for key, value in state.items()}
+                fitted = self._fitted_entry("ets", model, series.dates, series.values, "full", fit_ms)
+                forecast = (mean[row], std[row])
+                fitted["forecasts"][forecast_days] = forecast
+                fingerprint = self._series_fingerprint(series.dates, series.values)
+                self.model_cache.put((req["campaign_id"], req["metric"], "ets", fingerprint), fitted)
+                self.model_cache.put((req["campaign_id"], req["metric"], "ets"), fingerprint, size=0)
+                results[i] = self._forecast_response(
+                    req["campaign_id"], req["metric"], series.dates, series.values, fitted, forecast, "full", fit_ms,
+                    req.get("interval_levels"),
+                )
+        return results
+
+    def _forecast_response(
+        self, campaign_id, metric, dates, values, fitted, forecast, fit_mode, fit_ms, interval_levels=None
+    ) -> dict:
+        """Assemble the response from a (predictions, std) forecast with whole-array operations."""
+        z_scores = self._interval_z_scores(interval_levels)
+        predictions, std = forecast
+        predictions = np.asarray(predictions, dtype=np.float64)
+        # lower_bound/upper_bound keep their original band: ETS's own std, a flat
+        # band from the history's spread for the other models
+        if fitted["model_used"] == "ets":
+            band_std = std
+        else:
+            band_std = np.full(len(predictions), np.std(values) * 0.5)
+
+        pred_dates = np.datetime64(dates[-1], "D") + np.arange(1, len(predictions) + 1)
+        predicted = np.round(predictions, 4)
+        lower = np.round(np.maximum(0, predictions - DEFAULT_INTERVAL_Z * band_std), 4)
+        upper = np.round(predictions + DEFAULT_INTERVAL_Z * band_std, 4)
+        result_predictions = [
+            {"date": date, "predicted_value": pred, "lower_bound": low, "upper_bound": high}
+            for date, pred, low, high in zip(
+                np.datetime_as_string(pred_dates, unit="D").tolist(),
+                predicted.tolist(),
+                lower.tolist(),
+                upper.tolist(),
+            )
+        ]
+
+        confidence = min(0.95, 0.5 + len(values) * 0.01)
 
         # Trend analysis
         trend_direction = "stable"
         if len(values) >= 7:
-            recent_avg = np.mean(values[-7:])
-            older_avg = np.mean(values[-14:-7]) if len(values) >= 14 else np.mean(values[:len(values)//2])
+            weekly_avg = rolling_mean(values, 7)
+            recent_avg = weekly_avg[-1]
+            older_avg = weekly_avg[-8] if len(values) >= 14 else np.mean(values[:len(values)//2])
             if recent_avg > older_avg * 1.05:
                 trend_direction = "increasing"
             elif recent_avg < older_avg * 0.95:
                 trend_direction = "decreasing"
 
-        return {
+        response = {
             "campaign_id": campaign_id,
             "metric": metric,
             "predictions": result_predictions,
             "confidence": round(confidence, 2),
-            "model_used": model_used,
+            "model_used": fitted["model_used"],
+            "fit_mode": fit_mode,
+            "fit_time_ms": round(fit_ms, 2),
             "summary": {
                 "current_avg": round(float(np.mean(values[-7:])), 4),
-                "forecasted_avg": round(float(np.mean([p["predicted_value"] for p in result_predictions])), 4),
+                "forecasted_avg": round(float(predicted.mean()), 4),
                 "trend_direction": trend_direction,
                 "data_points": len(values),
             },
         }
+        if z_scores and std is not None:
+            # Columnar per level: one lower and one upper array aligned with predictions
+            response["intervals"] = [
+                {
+                    "level": level,
+                    "lower": np.round(np.maximum(0, predictions - z * std), 4).tolist(),
+                    "upper": np.round(predictions + z * std, 4).tolist(),
+                }
+                for level, z in z_scores
+            ]
+        return response
+
+    def _interval_z_scores(self, interval_levels):
+        """(level, z) pairs for central normal-quantile intervals; levels must be in (0, 1)."""
+        if not interval_levels:
+            return []
+        z_scores = []
+        for level in interval_levels:
+            if not 0 < level < 1:
+                raise ValueError(f"Interval level must be between 0 and 1, got {level}")
+            z_scores.append((level, NormalDist().inv_cdf((1 + level) / 2)))
+        return z_scores
 
     def forecast_budget(
         self,
@@ -84,12 +303,17 @@ class ForecastService:
         revenue_data: List[Dict],
         target_roas: float,
         budget_range: Dict,
+        simulation_draws: int = 0,
+        seed: Optional[int] = None,
     ) -> Dict:
         """
         Forecast optimal budget allocation using diminishing returns model.
+        With simulation_draws, also Monte Carlo revenue/ROAS bands and the
+        probability of reaching target_roas for each scenario, sampled from
+        the fitted curve's uncertainty.
         """
-        if len(spend_data) < 7:
-            return {"error": "Insufficient data for budget forecasting", "min_required": 7}
+        if len(spend_data) < BUDGET_MIN_POINTS:
+            return {"error": "Insufficient data for budget forecasting", "min_required": BUDGET_MIN_POINTS}
 
         spends = np.array([float(d["value"]) for d in spend_data])
         revenues = np.array([float(d["value"]) for d in revenue_data[:len(spends)]])
@@ -101,31 +325,30 @@ class ForecastService:
         min_budget = budget_range.get("min", avg_daily_spend * 0.5)
         max_budget = budget_range.get("max", avg_daily_spend * 2.0)
 
-        # Log-linear diminishing returns model
-        log_spends = np.log(np.maximum(spends, 1))
-        try:
-            coeffs = np.polyfit(log_spends, revenues, 1)
-            a, b = coeffs[0], coeffs[1]
-            # Marginal ROAS = a / spend; find where marginal ROAS = target_roas
-            optimal = a / target_roas if target_roas > 0 else avg_daily_spend
-        except Exception:
-            optimal = avg_daily_spend
-
-        optimal = max(min_budget, min(max_budget, optimal))
+        # Log-linear diminishing returns model; marginal ROAS = a / spend
+        n = min(len(spends), len(revenues))
+        fitted = response_curves.fit(spends[None, :n], revenues[None, :n], "log_linear")
+        if target_roas > 0:
+            optimal = float(response_curves.optimal_budget(
+                fitted, np.array([target_roas]), np.array([min_budget]), np.array([max_budget])
+            )[0])
+        else:
+            optimal = max(min_budget, min(max_budget, avg_daily_spend))
 
         # Project revenue at different spend levels
-        scenarios = []
-        for multiplier in [0.5, 0.75, 1.0, 1.25, 1.5, 2.0]:
-            test_spend = avg_daily_spend * multiplier
-            projected_revenue = a * np.log(max(1, test_spend)) + b if 'a' in dir() else test_spend * current_roas
-            scenarios.append({
-                "daily_budget": round(test_spend, 2),
-                "projected_revenue": round(float(max(0, projected_revenue)), 2),
-                "projected_roas": round(float(max(0, projected_revenue)) / max(1, test_spend), 2),
+        budgets = avg_daily_spend * np.array(BUDGET_SCENARIO_MULTIPLIERS)
+        revenue = np.maximum(response_curves.evaluate(fitted, budgets[None, :])[0], 0)
+        scenarios = [
+            {
+                "daily_budget": round(float(budget), 2),
+                "projected_revenue": round(float(projected), 2),
+                "projected_roas": round(float(projected) / max(1, float(budget)), 2),
                 "budget_change_percent": round((multiplier - 1) * 100, 1),
-            })
+            }
+            for budget, projected, multiplier in zip(budgets, revenue, BUDGET_SCENARIO_MULTIPLIERS)
+        ]
 
-        return {
+        result = {
             "current_daily_spend": round(avg_daily_spend, 2),
             "current_daily_revenue": round(avg_daily_revenue, 2),
             "current_roas": round(current_roas, 2),
@@ -136,22 +359,340 @@ class ForecastService:
             "scenarios": scenarios,
             "confidence": "medium" if len(spend_data) >= 30 else "low",
         }
+        if simulation_draws:
+            # Scenario budgets plus the recommendation as the last allocation
+            allocations = np.append(budgets, optimal)[None, :]
+            sim = budget_simulation.simulate(
+                response_curves.linear_form(fitted, allocations), allocations, simulation_draws, seed,
+                target_roas=target_roas if target_roas > 0 else None,
+            )
+            result["simulation"] = self._simulation_summary(sim, allocations[0])
+        return result
+
+    def forecast_budget_batch(
+        self,
+        campaigns: List[Dict],
+        target_roas: float,
+        scenario_multipliers: Optional[List[float]] = None,
+        curve: str = "auto",
+        simulation_draws: int = 0,
+        seed: Optional[int] = None,
+    ) -> Dict:
+        """
+        Fit spend response curves for many campaigns in one vectorized pass,
+        project revenue over a shared grid of budget multipliers and return
+        each campaign's budget where marginal ROAS meets its target.
+
+        campaigns: [{campaign_id, spend, revenue, budget_range?, target_roas?}]
+        with spend/revenue as daily value arrays paired by position.
+
+        With simulation_draws, every campaign's probability of reaching its
+        target per scenario and portfolio revenue/ROAS bands at each
+        multiplier come from one Monte Carlo pass over all campaigns.
+        """
+        multipliers = np.asarray(scenario_multipliers or BUDGET_SCENARIO_MULTIPLIERS, dtype=np.float64)
+        results = [None] * len(campaigns)
+        usable = []
+        for i, campaign in enumerate(campaigns):
+            if min(len(campaign["spend"]), len(campaign["revenue"])) < BUDGET_MIN_POINTS:
+                results[i] = {
+                    "campaign_id": campaign["campaign_id"],
+                    "error": "Insufficient data for budget forecasting",
+                    "min_required": BUDGET_MIN_POINTS,
+                }
+            else:
+                usable.append(i)
+        if not usable:
+            return {"scenario_multipliers": multipliers.tolist(), "results": results}
+
+        pairs = [self._paired_spend_revenue(campaigns[i]) for i in usable]
+        spend = response_curves.pack([pair[0] for pair in pairs])
+        revenue = response_curves.pack([pair[1] for pair in pairs])
+        fitted = response_curves.fit(spend, revenue, curve)
+
+        avg_spend = np.nanmean(spend[:, -7:], axis=1)
+        avg_revenue = np.nanmean(revenue[:, -7:], axis=1)
+        current_roas = np.nansum(revenue, axis=1) / np.maximum(1, np.nansum(spend, axis=1))
+        ranges = [campaigns[i].get("budget_range") or {} for i in usable]
+        lower = np.array([r.get("min", np.nan) for r in ranges], dtype=np.float64)
+        upper = np.array([r.get("max", np.nan) for r in ranges], dtype=np.float64)
+        lower = np.where(np.isnan(lower), avg_spend * 0.5, lower)
+        upper = np.where(np.isnan(upper), avg_spend * 2.0, upper)
+        targets = np.array([campaigns[i].get("target_roas") or target_roas for i in usable], dtype=np.float64)
+
+        optimal = response_curves.optimal_budget(fitted, targets, lower, upper)
+        optimal = np.where(targets > 0, optimal, np.clip(avg_spend, lower, upper))
+        projected = np.maximum(response_curves.evaluate(fitted, optimal[:, None])[:, 0], 0)
+
+        # Every campaign x scenario in one matrix
+        budgets = avg_spend[:, None] * multipliers[None, :]
+        scenario_revenue = np.maximum(response_curves.evaluate(fitted, budgets), 0)
+        scenario_roas = scenario_revenue / np.maximum(1, budgets)
+        counts = (~np.isnan(spend)).sum(axis=1)
+
+        columns = {
+            "optimal": np.round(optimal, 2).tolist(),
+            "projected": np.round(projected, 2).tolist(),
+            "projected_roas": np.round(projected / np.maximum(1, optimal), 2).tolist(),
+            "change": np.round((optimal - avg_spend) / np.maximum(1, avg_spend) * 100, 1).tolist(),
+            "avg_spend": np.round(avg_spend, 2).tolist(),
+            "avg_revenue": np.round(avg_revenue, 2).tolist(),
+            "current_roas": np.round(current_roas, 2).tolist(),
+            "budgets": np.round(budgets, 2).tolist(),
+            "scenario_revenue": np.round(scenario_revenue, 2).tolist(),
+            "scenario_roas": np.round(scenario_roas, 2).tolist(),
+        }
+        response = {"scenario_multipliers": multipliers.tolist(), "results": results}
+        if simulation_draws:
+            # Each campaign's scenario budgets plus its recommendation as the last allocation
+            allocations = np.column_stack([budgets, optimal])
+            sim = budget_simulation.simulate(
+                response_curves.linear_form(fitted, allocations), allocations, simulation_draws, seed,
+                target_roas=target_roas if target_roas > 0 else None,
+                campaign_targets=targets,
+            )
+            response["portfolio_simulation"] = self._simulation_summary(sim, allocations.sum(axis=0))
+            columns["probability"] = np.round(sim["campaign_prob_target_roas"], 4).tolist()
+        for row, i in enumerate(usable):
+            if fitted["is_hill"][row]:
+                curve_used = "hill"
+                params = {
+                    "rmax": float(fitted["rmax"][row]),
+                    "shape": float(fitted["k"][row]),
+                    "half_saturation": float(fitted["h"][row]),
+                }
+            else:
+                curve_used = "log_linear"
+                params = {"a": float(fitted["a"][row]), "b": float(fitted["b"][row])}
+            results[i] = {
+                "campaign_id": campaigns[i]["campaign_id"],
+                "curve": curve_used,
+                "curve_params": params,
+                "current_daily_spend": columns["avg_spend"][row],
+                "current_daily_revenue": columns["avg_revenue"][row],
+                "current_roas": columns["current_roas"][row],
+                "target_roas": float(targets[row]),
+                "recommended_daily_budget": columns["optimal"][row],
+                "projected_daily_revenue": columns["projected"][row],
+                "projected_roas": columns["projected_roas"][row],
+                "budget_change_percent": columns["change"][row],
+                "scenarios": {
+                    "daily_budget": columns["budgets"][row],
+                    "projected_revenue": columns["scenario_revenue"][row],
+                    "projected_roas": columns["scenario_roas"][row],
+                },
+                "confidence": "medium" if counts[row] >= 30 else "low",
+            }
+            if simulation_draws:
+                results[i]["probability_target_roas"] = {
+                    "scenarios": columns["probability"][row][:-1],
+                    "recommended": columns["probability"][row][-1],
+                }
+        return response
+
+    def _simulation_summary(self, sim: Dict, allocation_budgets: np.ndarray) -> Dict:
+        """Bands per scenario (all allocation columns but the last) and for the recommendation (the last)."""
+        percentiles = sim["percentiles"]
+        summary = {
+            "draws": sim["draws"],
+            "seed": sim["seed"],
+            "percentiles": percentiles,
+            "scenarios": {
+                "daily_budget": np.round(allocation_budgets[:-1], 2).tolist(),
+                "revenue": budget_simulation.bands(sim["revenue"][:, :-1], percentiles),
+                "roas": budget_simulation.bands(sim["roas"][:, :-1], percentiles),
+            },
+            "recommended": {
+                "daily_budget": round(float(allocation_budgets[-1]), 2),
+                "revenue": budget_simulation.bands(sim["revenue"][:, -1], percentiles),
+                "roas": budget_simulation.bands(sim["roas"][:, -1], percentiles),
+            },
+        }
+        if "prob_target_roas" in sim:
+            summary["scenarios"]["probability_target_roas"] = np.round(sim["prob_target_roas"][:-1], 4).tolist()
+            summary["recommended"]["probability_target_roas"] = round(float(sim["prob_target_roas"][-1]), 4)
+        return summary
+
+    def _paired_spend_revenue(self, campaign: Dict):
+        """Spend and revenue trimmed to the days both have, matched by position."""
+        spend = np.asarray(campaign["spend"], dtype=np.float64)
+        revenue = np.asarray(campaign["revenue"], dtype=np.float64)
+        n = min(len(spend), len(revenue))
+        return spend[:n], revenue[:n]
+
+    def cache_stats(self) -> Dict:
+        """Hit/miss counters and occupancy of the fitted-model cache."""
+        return self.model_cache.stats()
+
+    def _series_fingerprint(self, dates, values) -> str:
+        """Stable hash of a historical series used as the model cache key."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update("\x1f".join(str(d) for d in dates).encode())
+        digest.update(np.asarray(values, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def model_stats(self) -> Dict:
+        """Learned fit-time estimates and remembered backend failures."""
+        return self.selector.stats()
+
+    def _candidates(self, metric, values, max_latency_ms=None, requested_model=None) -> List[str]:
+        """Selector candidates, with XGBoost served by the metric's global model when one covers the series."""
+        if not self.global_xgboost.covers(metric, len(values)):
+            return self.selector.candidates(values, max_latency_ms, requested_model)
+        candidates = self.selector.candidates(values, max_latency_ms, requested_model, prefitted=("xgboost",))
+        return ["global_xgboost" if name == "xgboost" else name for name in candidates]
+
+    def _fit_best_model(self, metric, dates, values, max_latency_ms=None, requested_model=None) -> Dict:
+        """Fit the first model the selector allows, falling back down its candidate list."""
+        for model_used in self._candidates(metric, values, max_latency_ms, requested_model):
+            if model_used == "global_xgboost":
+                # Nothing to fit: the forecast is one row of the metric's shared model
+                model = self._global_xgboost_state(metric, dates, values)
+                return self._fitted_entry(model_used, model, dates, values, "global", 0.0)
+            started = time.perf_counter()
+            try:
+                if model_used == "prophet":
+                    model = self._prophet_fit(dates, values)
+                elif model_used == "xgboost":
+                    model = self._xgboost_fit(values)
+                elif model_used == "ets":
+                    model = self._ets_fit(values)
+                else:
+                    model = self._statistical_fit(values)
+            except Exception as e:
+                if model_used == "statistical":
+                    raise
+                self.selector.record_failure(model_used, values, e)
+                continue
+            fit_ms = (time.perf_counter() - started) * 1000
+            self.selector.record_fit(model_used, fit_ms)
+            return self._fitted_entry(model_used, model, dates, values, "full", fit_ms)
+
+    def _fitted_entry(self, model_used, model, dates, values, fit_mode, fit_ms) -> Dict:
+        return {
+            "model_used": model_used,
+            "model": model,
+            "fit_mode": fit_mode,
+            "fit_ms": fit_ms,
+            "dates": list(dates),
+            "values": np.asarray(values, dtype=np.float64),
+            "forecasts": {},
+        }
 
-    def _prophet_forecast(self, dates, values, forecast_days):
-        """Forecast using Facebook Prophet."""
-        from prophet import Prophet
-        import pandas as pd
+    def _update_previous_fit(self, campaign_id, metric, dates, values, max_latency_ms=None, requested_model=None) -> Optional[Dict]:
+        """
+        Incrementally update the last fit for this campaign/metric when the new
+        series is the previous one (or a shifted window of it) plus a few new points.
+        """
+        previous_fingerprint = self.model_cache.get((campaign_id, metric, requested_model))
+        if previous_fingerprint is None:
+            return None
+        previous_key = (campaign_id, metric, requested_model, previous_fingerprint)
+        previous = self.model_cache.get(previous_key)
+        if previous is None:
+            return None
+
+        new_points = self._count_appended_points(previous, dates, values)
+        if not new_points or new_points > INCREMENTAL_MAX_NEW_POINTS:
+            return None
+        if previous["model_used"] not in self._candidates(metric, values, max_latency_ms, requested_model):
+            return None
+
+        started = time.perf_counter()
+        try:
+            if previous["model_used"] == "prophet":
+                model = self._prophet_update(previous["model"], dates, values)
+            elif previous["model_used"] == "xgboost":
+                model = self._xgboost_update(previous["model"], values, new_points)
+            elif previous["model_used"] == "ets":
+                # A full refit is a few milliseconds; no warm start needed
+                model = self._ets_fit(values)
+            elif previous["model_used"] == "global_xgboost":
+                model = self._global_xgboost_state(metric, dates, values)
+            else:
+                model = self._statistical_update(previous["model"], values[-new_points:])
+        except Exception as e:
+            logger.warning(f"Incremental {previous['model_used']} update failed, refitting: {e}")
+            return None
+        if model is None:
+            return None
+
+        # The superseded fit will not be requested again by the daily refresh
+        self.model_cache.pop(previous_key)
+        fit_ms = (time.perf_counter() - started) * 1000
+        return self._fitted_entry(previous["model_used"], model, dates, values, "incremental", fit_ms)
+
+    def _count_appended_points(self, previous: Dict, dates, values) -> Optional[int]:
+        """Number of points appended to the previous series, or None if it does not extend it."""
+        previous_dates = previous["dates"]
+        try:
+            offset = previous_dates.index(dates[0])
+        except ValueError:
+            return None
+        overlap = len(previous_dates) - offset
+        if overlap >= len(dates) or list(dates[:overlap]) != previous_dates[offset:]:
+            return None
+        if not np.array_equal(np.asarray(values[:overlap], dtype=np.float64), previous["values"][offset:]):
+            return None
+        return len(dates) - overlap
+
+    def _forecast_fitted(self, fitted: Dict, forecast_days: int):
+        """
+        Run the predict step of a previously fitted model. Returns
+        (predictions, std); std is the per-step forecast standard deviation
+        for models with their own forecast variance, else None.
+        """
+        if fitted["model_used"] == "prophet":
+            return self._prophet_predict(fitted["model"], forecast_days)
+        if fitted["model_used"] == "xgboost":
+            return self._xgboost_predict(fitted["model"], forecast_days), None
+        if fitted["model_used"] == "ets":
+            return self._ets_predict(fitted["model"], forecast_days)
+        if fitted["model_used"] == "global_xgboost":
+            return self._global_xgboost_predict(fitted["model"], forecast_days), None
+        state = fitted["model"]
+        return self._statistical_predict(state, forecast_days), self._statistical_std(state, forecast_days)
+
+    def _prophet_fit(self, dates, values):
+        """Fit a Facebook Prophet model."""
+        Prophet = backends.load("prophet").Prophet
+        pd = backends.load("pandas")
 
         df = pd.DataFrame({"ds": pd.to_datetime(dates), "y": values})
         model = Prophet(daily_seasonality=True, yearly_seasonality=False)
         model.fit(df)
+        return model
+
+    def _prophet_update(self, previous_model, dates, values):
+        """Refit Prophet warm-started from the previous model's parameters."""
+        Prophet = backends.load("prophet").Prophet
+        pd = backends.load("pandas")
+
+        init = {name: previous_model.params[name][0][0] for name in ("k", "m", "sigma_obs")}
+        init.update({name: previous_model.params[name][0] for name in ("delta", "beta")})
+
+        df = pd.DataFrame({"ds": pd.to_datetime(dates), "y": values})
+        model = Prophet(daily_seasonality=True, yearly_seasonality=False)
+        model.fit(df, init=init)
+        return model
+
+    def _prophet_predict(self, model, forecast_days):
+        """
+        Forecast using a fitted Prophet model. The std per step is read back
+        from Prophet's own uncertainty interval (trend changes plus
+        observation noise) at its interval_width.
+        """
         future = model.make_future_dataframe(periods=forecast_days)
-        forecast = model.predict(future)
-        return forecast["yhat"].tail(forecast_days).values
+        forecast = model.predict(future).tail(forecast_days)
+        if "yhat_lower" not in forecast:
+            return forecast["yhat"].values, None
+        z = NormalDist().inv_cdf((1 + model.interval_width) / 2)
+        std = (forecast["yhat_upper"].values - forecast["yhat_lower"].values) / (2 * z)
+        return forecast["yhat"].values, std
 
-    def _xgboost_forecast(self, values, forecast_days):
-        """Forecast using XGBoost with lag features."""
-        from xgboost import XGBRegressor
+    def _xgboost_fit(self, values):
+        """Fit XGBoost on lag features."""
+        XGBRegressor = backends.load("xgboost").XGBRegressor
 
         lag = min(7, len(values) - 1)
         X, y = [], []
@@ -164,9 +705,34 @@ class ForecastService:
 
         model = XGBRegressor(n_estimators=100, max_depth=3, learning_rate=0.1)
         model.fit(X, y)
+        return {"regressor": model, "lag": lag, "n_trees": 100, "last_values": list(values[-lag:])}
+
+    def _xgboost_update(self, state, values, new_points):
+        """Continue boosting the previous model on the newly appended points only."""
+        XGBRegressor = backends.load("xgboost").XGBRegressor
+
+        lag = state["lag"]
+        if state["n_trees"] + XGB_UPDATE_TREES > XGB_MAX_TREES or len(values) - new_points < lag:
+            return None
+
+        X = np.array([values[i - lag:i] for i in range(len(values) - new_points, len(values))])
+        y = np.array(values[-new_points:])
+
+        model = XGBRegressor(n_estimators=XGB_UPDATE_TREES, max_depth=3, learning_rate=0.1)
+        model.fit(X, y, xgb_model=state["regressor"].get_booster())
+        return {
+            "regressor": model,
+            "lag": lag,
+            "n_trees": state["n_trees"] + XGB_UPDATE_TREES,
+            "last_values": list(values[-lag:]),
+        }
+
+    def _xgboost_predict(self, state, forecast_days):
+        """Recursive multi-step forecast from a fitted XGBoost model."""
+        model, lag = state["regressor"], state["lag"]
 
         predictions = []
-        current = list(values[-lag:])
+        current = list(state["last_values"])
         for _ in range(forecast_days):
             pred = model.predict(np.array([current[-lag:]]))[0]
             predictions.append(max(0, pred))
@@ -174,23 +740,111 @@ class ForecastService:
 
         return predictions
 
-    def _statistical_forecast(self, values, forecast_days):
-        """Simple moving average + trend forecast."""
-        window = min(7, len(values))
-        ma = np.mean(values[-window:])
+    def _global_xgboost_state(self, metric, dates, values):
+        """Inputs the metric's global model needs: the latest lag window and its last day of week."""
+        return {
+            "metric": metric,
+            "window": np.asarray(values[-self.global_xgboost.lags:], dtype=np.float64),
+            "dow": int(day_of_week(dates[-1:])[0]),
+            "version": self.global_xgboost.version(metric),
+        }
 
-        if len(values) >= 2:
-            trend = (values[-1] - values[-window]) / window
-        else:
-            trend = 0
+    def _current_global_fit(self, fitted: Dict) -> Optional[Dict]:
+        """
+        A cached global XGBoost fit with its memoized forecasts dropped if the
+        metric's model has been retrained since (possibly by another worker),
+        or None if the model is gone.
+        """
+        state = fitted["model"]
+        version = self.global_xgboost.version(state["metric"])
+        if version is None:
+            return None
+        if state["version"] != version:
+            fitted["forecasts"].clear()
+            state["version"] = version
+        return fitted
 
+    def _global_xgboost_predict(self, state, forecast_days):
+        """Direct multi-horizon forecast from the metric's global model."""
+        return self.global_xgboost.predict(
+            state["metric"], state["window"][None, :], np.array([state["dow"]]), forecast_days
+        )[0]
+
+    def _ets_fit(self, values):
+        """Exponential smoothing (SES, Holt or Holt-Winters), chosen by AICc."""
+        return exp_smoothing.fit(values)
+
+    def _ets_predict(self, state, forecast_days):
+        """Point forecast and its standard deviation per step from a fitted ETS state."""
+        mean, std = exp_smoothing.forecast_std(state, forecast_days)
+        return mean[0], std[0]
+
+    def _statistical_fit(self, values):
+        """
+        Moving average and trend of the most recent window, plus the squared
+        one-step errors of the same forecast over the history (see _statistical_std).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        window = deque(values[-7:], maxlen=7)
+        sse, residuals = 0.0, 0
+        if len(values) > 7:
+            windows = np.lib.stride_tricks.sliding_window_view(values[:-1], 7)
+            one_step = windows.mean(axis=1) + (windows[:, -1] - windows[:, 0]) / 7
+            sse, residuals = float(np.sum((values[7:] - one_step) ** 2)), len(one_step)
+        return self._statistical_state(window, float(np.sum(window)), sse, residuals)
+
+    def _statistical_update(self, state, new_values):
+        """O(1)-per-point rolling update of the moving average, trend and one-step errors."""
+        window = deque(state["window"], maxlen=7)
+        window_sum = state["window_sum"]
+        sse, residuals = state["sse"], state["residuals"]
+        for value in new_values:
+            if len(window) == window.maxlen:
+                one_step = window_sum / len(window) + (window[-1] - window[0]) / len(window)
+                sse += (value - one_step) ** 2
+                residuals += 1
+                window_sum -= window[0]
+            window.append(value)
+            window_sum += value
+        return self._statistical_state(window, window_sum, sse, residuals)
+
+    def _statistical_state(self, window, window_sum, sse=0.0, residuals=0):
+        size = len(window)
+        trend = (window[-1] - window[0]) / size if size >= 2 else 0
+        return {
+            "window": window,
+            "window_sum": window_sum,
+            "ma": window_sum / size,
+            "trend": trend,
+            "sse": sse,
+            "residuals": residuals,
+        }
+
+    def _statistical_predict(self, state, forecast_days):
+        """Simple moving average + trend forecast."""
         predictions = []
         for i in range(forecast_days):
-            pred = ma + trend * (i + 1)
+            pred = state["ma"] + state["trend"] * (i + 1)
             predictions.append(max(0, pred))
 
         return predictions
 
+    def _statistical_std(self, state, forecast_days):
+        """
+        Forecast std per step, or None with fewer than STAT_MIN_RESIDUALS
+        one-step errors. The h-step forecast is a weighted sum of the window
+        (1/n each, plus h/n on the last point and -h/n on the first), so around
+        a level with noise variance s2 its error variance is
+        s2 * (1 + (n + 2h^2) / n^2); s2 is backed out from the one-step errors.
+        """
+        size = len(state["window"])
+        if state["residuals"] < STAT_MIN_RESIDUALS or size < 2:
+            return None
+        steps = np.arange(1, forecast_days + 1)
+        growth = 1 + (size + 2 * steps ** 2) / size ** 2
+        noise_var = state["sse"] / state["residuals"] / (1 + (size + 2) / size ** 2)
+        return np.sqrt(noise_var * growth)
+
     def _insufficient_data_response(self, campaign_id, metric, forecast_days):
         return {
             "campaign_id": campaign_id,
@@ -0,0 +1,273 @@
+"""
+Global XGBoost Forecaster
+=========================
+One XGBoost model per metric, trained once on lag windows from every
+campaign instead of one model per series. Each model predicts the whole
+horizon at once (direct multi-horizon, one output per day), so forecasting
+all campaigns of a metric is a single predict call rather than one
+recursive call per campaign and day.
+
+Windows are divided by their own mean so campaigns of very different size
+share one model; forecasts are scaled back per campaign.
+
+Trained models are saved to GLOBAL_XGB_DIR (XGBoost's own format plus a
+metadata file per metric), and every service worker loads a metric's model
+from there when it has none or the file is newer than its copy, so training
+on one worker serves forecasts on all of them.
+"""
+
+import os
+import re
+import json
+import glob
+import time
+import threading
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services import backends
+from services.series import Series
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_XGB_LAGS = int(os.getenv("FORECAST_GLOBAL_XGB_LAGS", "14"))
+GLOBAL_XGB_HORIZON = int(os.getenv("FORECAST_GLOBAL_XGB_HORIZON", "14"))
+GLOBAL_XGB_TREES = int(os.getenv("FORECAST_GLOBAL_XGB_TREES", "200"))
+# Fewer training windows than this cannot support a cross-series model
+GLOBAL_XGB_MIN_ROWS = int(os.getenv("FORECAST_GLOBAL_XGB_MIN_ROWS", "50"))
+# Shared by every service worker; must be on a volume they all see
+GLOBAL_XGB_DIR = os.getenv("FORECAST_GLOBAL_XGB_DIR", "/tmp/paramads-ai/global_xgboost")
+# Superseded model files are removed once older than this, so a worker
+# still loading one is not cut short
+GLOBAL_XGB_STALE_FILE_SECONDS = 60.0
+
+
+def day_of_week(dates) -> np.ndarray:
+    """Monday=0 day of week for ISO date strings."""
+    # 1970-01-01 was a Thursday
+    return (np.asarray(dates, dtype="datetime64[D]").astype(np.int64) + 3) % 7
+
+
+def _features(windows: np.ndarray, dows: np.ndarray):
+    scale = np.abs(windows).mean(axis=1)
+    scale = np.where(scale > 0, scale, 1.0)
+    return np.column_stack([windows / scale[:, None], dows]), scale
+
+
+class GlobalXGBoostForecaster:
+    def __init__(
+        self,
+        lags: int = GLOBAL_XGB_LAGS,
+        horizon: int = GLOBAL_XGB_HORIZON,
+        n_estimators: int = GLOBAL_XGB_TREES,
+        model_dir: str = GLOBAL_XGB_DIR,
+    ):
+        self.lags = lags
+        self.horizon = horizon
+        self.n_estimators = n_estimators
+        self.model_dir = model_dir
+        self.models: Dict[str, Dict] = {}
+        # Metadata file mtime last seen per metric, loaded or not
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def covers(self, metric: str, n_points: int) -> bool:
+        """Whether a trained model can forecast a series of this metric and length."""
+        return self._refresh(metric) is not None and n_points >= self.lags
+
+    def version(self, metric: str) -> Optional[float]:
+        """trained_at of the metric's current model, None when there is none."""
+        entry = self._refresh(metric)
+        return entry["trained_at"] if entry is not None else None
+
+    def train(self, metric: str, series: List[Series]) -> Dict:
+        """
+        Fit the metric's model on every (lags + horizon) window of every series,
+        replacing any previous model for the metric on every worker.
+        """
+        if not re.fullmatch(r"\w+", metric):
+            raise ValueError(f"Invalid metric name for a global model: '{metric}'")
+        lags, horizon = self.lags, self.horizon
+        windows, targets, dows = [], [], []
+        used = 0
+        for s in series:
+            values = np.asarray(s.values, dtype=np.float64)
+            n = len(values)
+            if n < lags + horizon:
+                continue
+            view = np.lib.stride_tricks.sliding_window_view(values, lags + horizon)
+            windows.append(view[:, :lags])
+            targets.append(view[:, lags:])
+            # Day of week of each window's last observed point
+            dows.append(day_of_week(s.dates)[lags - 1:n - horizon])
+            used += 1
+
+        rows = sum(len(w) for w in windows)
+        if rows < GLOBAL_XGB_MIN_ROWS:
+            raise ValueError(
+                f"Need at least {GLOBAL_XGB_MIN_ROWS} training windows of {lags + horizon} points "
+                f"for metric '{metric}', got {rows}"
+            )
+
+        X, scale = _features(np.concatenate(windows), np.concatenate(dows))
+        y = np.concatenate(targets) / scale[:, None]
+
+        XGBRegressor = backends.load("xgboost").XGBRegressor
+        started = time.perf_counter()
+        # One tree per round predicts every horizon day (vector leaves)
+        regressor = XGBRegressor(
+            n_estimators=self.n_estimators,
+            max_depth=4,
+            learning_rate=0.1,
+            tree_method="hist",
+            multi_strategy="multi_output_tree",
+        )
+        regressor.fit(X, y)
+        train_ms = (time.perf_counter() - started) * 1000
+
+        entry = self._entry(regressor, {"series": used, "rows": rows, "train_ms": train_ms, "trained_at": time.time()})
+        mtime = self._save(metric, entry)
+        with self._lock:
+            self.models[metric] = entry
+            self._seen[metric] = mtime
+        logger.info(f"Global XGBoost for '{metric}': {used} series, {rows} windows, trained in {train_ms:.0f}ms")
+        return self._describe(metric, entry)
+
+    def predict(self, metric: str, windows: np.ndarray, dows: np.ndarray, days: int) -> np.ndarray:
+        """
+        Forecast `days` steps for every row of `windows` (series x >= lags most
+        recent values) in one predict call per horizon block. `dows` is the day
+        of week of each row's last value. Horizons beyond the trained one are
+        covered by feeding each block back in as the next window.
+        """
+        entry = self._refresh(metric)
+        if entry is None:
+            raise KeyError(metric)
+        windows = np.asarray(windows, dtype=np.float64)
+        dows = np.asarray(dows, dtype=np.int64)
+        started = time.perf_counter()
+
+        blocks = []
+        for _ in range(-(-days // self.horizon)):
+            X, scale = _features(windows[:, -self.lags:], dows)
+            block = entry["regressor"].predict(X).reshape(len(X), -1) * scale[:, None]
+            blocks.append(block)
+            windows = np.concatenate([windows[:, -self.lags:], block], axis=1)
+            dows = (dows + self.horizon) % 7
+
+        with self._lock:
+            entry["predict_calls"] += len(blocks)
+            entry["series_predicted"] += len(windows)
+            entry["predict_ms"] += (time.perf_counter() - started) * 1000
+        return np.maximum(np.concatenate(blocks, axis=1)[:, :days], 0)
+
+    def stats(self) -> Dict:
+        """Models on disk and in this worker; predict counters are this worker's only."""
+        for path in glob.glob(os.path.join(self.model_dir, "*.json")):
+            self._refresh(os.path.basename(path)[:-len(".json")])
+        with self._lock:
+            models = dict(self.models)
+        return {
+            "lags": self.lags,
+            "horizon": self.horizon,
+            "model_dir": self.model_dir,
+            "worker_pid": os.getpid(),
+            "models": {metric: self._describe(metric, entry) for metric, entry in models.items()},
+        }
+
+    def _entry(self, regressor, meta: Dict) -> Dict:
+        return {
+            "regressor": regressor,
+            "series": meta["series"],
+            "rows": meta["rows"],
+            "train_ms": meta["train_ms"],
+            "trained_at": meta["trained_at"],
+            "predict_calls": 0,
+            "series_predicted": 0,
+            "predict_ms": 0.0,
+        }
+
+    def _meta_path(self, metric: str) -> str:
+        return os.path.join(self.model_dir, f"{metric}.json")
+
+    def _save(self, metric: str, entry: Dict) -> int:
+        """
+        Write the model under a new name, then atomically replace the metric's
+        metadata file pointing at it. Returns the metadata file's mtime.
+        """
+        os.makedirs(self.model_dir, exist_ok=True)
+        model_file = f"{metric}-{int(entry['trained_at'] * 1000)}-{os.getpid()}.ubj"
+        entry["regressor"].save_model(os.path.join(self.model_dir, model_file))
+        meta = {
+            "model_file": model_file,
+            "lags": self.lags,
+            "horizon": self.horizon,
+            "series": entry["series"],
+            "rows": entry["rows"],
+            "train_ms": entry["train_ms"],
+            "trained_at": entry["trained_at"],
+        }
+        meta_path = self._meta_path(metric)
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+        cutoff = time.time() - GLOBAL_XGB_STALE_FILE_SECONDS
+        for path in glob.glob(os.path.join(self.model_dir, f"{metric}-*.ubj")):
+            try:
+                if os.path.basename(path) != model_file and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        return os.stat(meta_path).st_mtime_ns
+
+    def _refresh(self, metric: str) -> Optional[Dict]:
+        """
+        The metric's model, loading it from the model directory first when
+        another worker has saved a newer one (or this worker has none).
+        """
+        try:
+            mtime = os.stat(self._meta_path(metric)).st_mtime_ns
+        except OSError:
+            return self.models.get(metric)
+        if self._seen.get(metric) == mtime:
+            return self.models.get(metric)
+
+        try:
+            with open(self._meta_path(metric)) as f:
+                meta = json.load(f)
+            current = self.models.get(metric)
+            if meta["lags"] != self.lags or meta["horizon"] != self.horizon:
+                logger.warning(
+                    f"Global XGBoost for '{metric}' was trained with lags={meta['lags']}, "
+                    f"horizon={meta['horizon']}; this worker uses {self.lags}/{self.horizon}, not loading it"
+                )
+            elif current is None or meta["trained_at"] > current["trained_at"]:
+                regressor = backends.load("xgboost").XGBRegressor()
+                regressor.load_model(os.path.join(self.model_dir, meta["model_file"]))
+                with self._lock:
+                    current = self.models.get(metric)
+                    if current is None or meta["trained_at"] > current["trained_at"]:
+                        self.models[metric] = self._entry(regressor, meta)
+                logger.info(f"Loaded global XGBoost for '{metric}' trained at {meta['trained_at']:.0f}")
+        except Exception as e:
+            # Not retried until the metric is trained again
+            logger.warning(f"Could not load global XGBoost for '{metric}': {e}")
+        self._seen[metric] = mtime
+        return self.models.get(metric)
+
+    def _describe(self, metric: str, entry: Dict) -> Dict:
+        predicted = entry["series_predicted"]
+        return {
+            "metric": metric,
+            "series": entry["series"],
+            "training_windows": entry["rows"],
+            "train_ms": round(entry["train_ms"], 1),
+            "trained_at": entry["trained_at"],
+            "predict_calls": entry["predict_calls"],
+            "series_predicted": predicted,
+            "predict_us_per_series": round(entry["predict_ms"] * 1000 / predicted, 2) if predicted else None,
+        }
@@ -0,0 +1,101 @@
+"""
+Insight Feature Frames
+======================
+Columnar per-organization features for insight rules. Campaign data is read
+once into NumPy columns (from records, or directly from columnar input);
+period-over-period deltas, per-platform aggregates (campaign counts, spend
+and conversion totals, mean ROAS) and portfolio totals are derived from the
+columns when the frame is built, so rules and summaries only read arrays.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+NUMERIC_FIELDS = ("roas", "prev_roas", "cpc", "prev_cpc", "ctr", "spend", "conversions")
+# prev_* fall back to the current value when missing
+PREVIOUS_OF = {"prev_roas": "roas", "prev_cpc": "cpc"}
+
+
+class OrgFeatureFrame:
+    def __init__(self, organization_id: Optional[int], columns: Dict):
+        """
+        columns: campaign_id plus any of name, platform and NUMERIC_FIELDS as
+        equal-length sequences. Raises ValueError when campaign_id is missing
+        or lengths differ.
+        """
+        if "campaign_id" not in columns:
+            raise ValueError("Campaign columns need a campaign_id column")
+        n = len(columns["campaign_id"])
+        ragged = [field for field, values in columns.items() if len(values) != n]
+        if ragged:
+            raise ValueError(f"Campaign columns must all have {n} values: {', '.join(ragged)}")
+
+        self.organization_id = organization_id
+        self.count = n
+        self.campaign_ids = list(columns["campaign_id"])
+        self.names = list(columns["name"]) if "name" in columns else [None] * n
+        platforms = columns["platform"] if "platform" in columns else [None] * n
+        self.platform_names, self.platform_index = np.unique(
+            np.asarray(platforms, dtype=object).astype(str), return_inverse=True
+        )
+        for field in NUMERIC_FIELDS:
+            if field in columns:
+                values = np.asarray(columns[field], dtype=np.float64)
+            else:
+                values = np.full(n, np.nan if field in PREVIOUS_OF else 0.0)
+            setattr(self, field, values)
+        for field, current in PREVIOUS_OF.items():
+            previous = getattr(self, field)
+            setattr(self, field, np.where(np.isnan(previous), getattr(self, current), previous))
+
+        # Period-over-period changes (fraction of the previous value), NaN where undefined
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.roas_change = np.where(self.prev_roas > 0, (self.roas - self.prev_roas) / self.prev_roas, np.nan)
+            self.cpc_change = np.where(
+                (self.prev_cpc > 0) & (self.cpc > 0), (self.cpc - self.prev_cpc) / self.prev_cpc, np.nan
+            )
+
+        self.total_spend = float(self.spend.sum())
+        self.total_conversions = float(self.conversions.sum())
+        self.avg_roas = float(self.roas.mean()) if n else 0.0
+        self.avg_prev_roas = float(self.prev_roas.mean()) if n else 0.0
+
+        n_platforms = len(self.platform_names)
+        self.platform_counts = np.bincount(self.platform_index, minlength=n_platforms)
+        self.platform_spend = np.bincount(self.platform_index, self.spend, n_platforms)
+        self.platform_conversions = np.bincount(self.platform_index, self.conversions, n_platforms)
+        counts = np.maximum(self.platform_counts, 1)
+        self.platform_roas = np.bincount(self.platform_index, self.roas, n_platforms) / counts
+        self.platform_prev_roas = np.bincount(self.platform_index, self.prev_roas, n_platforms) / counts
+
+    @classmethod
+    def from_records(cls, organization_id: Optional[int], campaigns: List[dict]) -> "OrgFeatureFrame":
+        """Build from campaign dicts, one C-level pass per field."""
+        n = len(campaigns)
+        columns = {
+            "campaign_id": [c.get("campaign_id", 0) for c in campaigns],
+            "name": [c.get("name") for c in campaigns],
+            "platform": [c.get("platform") for c in campaigns],
+        }
+        for field in NUMERIC_FIELDS:
+            default = np.nan if field in PREVIOUS_OF else 0
+            columns[field] = np.fromiter((c.get(field, default) for c in campaigns), dtype=np.float64, count=n)
+        return cls(organization_id, columns)
+
+    def name(self, row: int) -> str:
+        name = self.names[row]
+        return f"Campaign {self.campaign_ids[row]}" if name is None else name
+
+    def labels(self, rows: np.ndarray):
+        """Campaign ids and display names for the given rows."""
+        rows = rows.tolist()
+        return [self.campaign_ids[r] for r in rows], [self.name(r) for r in rows]
+
+    def platform_avg_roas(self, platform: str) -> Optional[float]:
+        """Mean ROAS of a platform's campaigns, None if it has none."""
+        pos = np.searchsorted(self.platform_names, platform)
+        if pos < len(self.platform_names) and self.platform_names[pos] == platform:
+            # Same (pairwise) summation as np.mean over the platform's campaigns
+            return float(self.roas[self.platform_index == pos].mean())
+        return None
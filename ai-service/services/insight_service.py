@@ -3,55 +3,99 @@ Natural Language Insight Service
 ================================
 Generate human-readable performance insights and action suggestions.
 Supports AI-powered summaries via OpenAI-compatible API and natural language Q&A.
+Campaign data is read once into an organization feature frame; rules are
+evaluated as masks across all campaigns and summaries read its aggregates.
+The frame is built per request and not kept across requests.
 """
 
 import os
 import json
+import time
 import numpy as np
 from typing import List, Dict, Optional
 from datetime import datetime
 import logging
 
+from services.insight_features import OrgFeatureFrame
+from services.llm_client import AsyncLLMClient, LLMTimeout
+from services.response_cache import ResponseCache
+from services.llm_batching import SingleFlight, SummaryBatcher
+
 logger = logging.getLogger(__name__)
 
+SEVERITY_ORDER = {"critical": 0, "warning": 1, "info": 2}
+# Per-campaign rules in the order their insights are listed for a campaign
+CAMPAIGN_RULES = (
+    ("low_roas", "critical"),
+    ("roas_decline", "warning"),
+    ("cpc_spike", "warning"),
+    ("low_ctr", "warning"),
+    ("no_conversions", "critical"),
+)
+
 
 class InsightService:
-    def __init__(self):
+    def __init__(
+        self,
+        llm: Optional[AsyncLLMClient] = None,
+        response_cache: Optional[ResponseCache] = None,
+    ):
         self.api_key = os.getenv("OPENAI_API_KEY")
+        self.llm = llm if llm is not None else AsyncLLMClient(api_key=self.api_key)
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.inflight = SingleFlight()
+        self.summary_batcher = SummaryBatcher(self.llm)
+
+    async def close(self) -> None:
+        await self.llm.aclose()
+        self.response_cache.close()
+
+    def cache_stats(self) -> dict:
+        return self.response_cache.stats()
 
-    def generate(
+    def llm_stats(self) -> dict:
+        return {
+            "llm_calls": self.llm.calls,
+            "coalesced_requests": self.inflight.coalesced,
+            "summary_batching": self.summary_batcher.stats(),
+        }
+
+    async def generate(
         self,
         organization_id: int,
-        campaign_data: List[dict],
+        campaign_data: Optional[List[dict]] = None,
         time_range: str = "7d",
         include_recommendations: bool = True,
+        use_cache: bool = True,
+        campaign_columns: Optional[Dict[str, list]] = None,
     ) -> dict:
-        """Generate NL insights from campaign performance data."""
-        insights = []
-
-        for campaign in campaign_data:
-            campaign_insights = self._analyze_campaign(campaign, time_range)
-            insights.extend(campaign_insights)
+        """
+        Generate NL insights from campaign performance data, given as records
+        (campaign_data) or columns (campaign_columns: one list per field).
+        Raises ValueError for ragged columns.
+        """
+        if campaign_columns is not None:
+            frame = OrgFeatureFrame(organization_id, campaign_columns)
+        else:
+            frame = OrgFeatureFrame.from_records(organization_id, campaign_data or [])
+
+        insights, severity_counts = self._campaign_insights(frame)
 
         # Add cross-campaign insights
-        if len(campaign_data) > 1:
-            cross_insights = self._cross_campaign_analysis(campaign_data, time_range)
-            insights.extend(cross_insights)
+        if frame.count > 1:
+            insights.extend(self._cross_campaign_analysis(frame, time_range))
 
         if include_recommendations:
-            recs = self._generate_recommendations(campaign_data, insights)
-            insights.extend(recs)
+            insights.extend(self._generate_recommendations(frame))
 
-        # Sort by severity
-        severity_order = {"critical": 0, "warning": 1, "info": 2}
-        insights.sort(key=lambda x: severity_order.get(x.get("severity", "info"), 3))
-
-        summary = self._generate_summary(insights, campaign_data)
+        # Campaign insights come severity-ordered; cross-campaign and recommendations are info, so
+        # the list is already sorted by severity
+        summary = self._generate_summary(frame, severity_counts)
 
         # AI-powered executive summary
         ai_summary = None
         if self.api_key:
-            ai_summary = self._generate_ai_summary(campaign_data, insights)
+            ai_summary = await self._generate_ai_summary(frame, insights, severity_counts, use_cache)
 
         return {
             "organization_id": organization_id,
@@ -61,15 +105,28 @@ class InsightService:
             "ai_summary": ai_summary,
         }
 
-    def ask_question(self, question: str, context_data: Dict) -> Dict:
+    async def ask_question(self, question: str, context_data: Dict, use_cache: bool = True) -> Dict:
         """Answer a natural language question about ad performance."""
-        if self.api_key:
-            return self._ask_with_llm(question, context_data)
-        return self._ask_rule_based(question, context_data)
+        if not self.api_key:
+            return self._ask_rule_based(question, context_data)
+
+        key = self.response_cache.key("ask", question, context_data)
+        if use_cache:
+            answer = await self.response_cache.get(key)
+            if answer is not None:
+                return {"question": question, "answer": answer, "source": "ai", "cached": True}
+
+        started = time.perf_counter()
+        result = await self.inflight.do(key, lambda: self._ask_with_llm(question, context_data))
+        if result["source"] == "ai":
+            # Rule-based fallbacks are cheap and should not mask a recovered LLM
+            await self.response_cache.put(key, result["answer"], time.perf_counter() - started)
+        return {**result, "cached": False}
 
     def generate_campaign_deep_dive(self, campaign: dict, metrics_history: List[dict]) -> Dict:
         """Generate deep-dive analysis for a single campaign."""
-        insights = self._analyze_campaign(campaign, "7d")
+        frame = OrgFeatureFrame.from_records(None, [campaign])
+        insights, _ = self._campaign_insights(frame, by_severity=False)
 
         # Trend analysis
         if len(metrics_history) >= 7:
@@ -82,7 +139,7 @@ class InsightService:
         if budget_insight:
             insights.append(budget_insight)
 
-        recommendations = self._generate_recommendations([campaign], insights)
+        recommendations = self._generate_recommendations(frame)
 
         return {
             "campaign_id": campaign.get("campaign_id"),
@@ -92,85 +149,116 @@ class InsightService:
             "generated_at": datetime.utcnow().isoformat(),
         }
 
-    def _analyze_campaign(self, campaign: dict, time_range: str) -> List[dict]:
-        """Analyze individual campaign performance."""
-        insights = []
-        cid = campaign.get("campaign_id", 0)
-        name = campaign.get("name", f"Campaign {cid}")
-
-        # ROAS analysis
-        roas = campaign.get("roas", 0)
-        prev_roas = campaign.get("prev_roas", roas)
-        if roas < 1.0:
-            insights.append({
+    def _rule_masks(self, frame: OrgFeatureFrame) -> Dict[str, np.ndarray]:
+        """Every per-campaign rule as a boolean mask over the frame's campaigns."""
+        low_roas = frame.roas < 1.0
+        return {
+            "low_roas": low_roas,
+            "roas_decline": ~low_roas & (frame.roas_change < -0.2),
+            "cpc_spike": frame.cpc_change > 0.3,
+            "low_ctr": frame.ctr < 0.5,
+            "no_conversions": (frame.spend > 0) & (frame.conversions == 0),
+        }
+
+    def _campaign_insights(self, frame: OrgFeatureFrame, by_severity: bool = True):
+        """
+        Insights for every rule hit, ordered by severity, campaign and rule
+        (or by campaign and rule), plus the number of hits per severity.
+        Each rule renders its hits in one pass over plain Python values.
+        """
+        masks = self._rule_masks(frame)
+        rows = [np.flatnonzero(masks[key]) for key, _ in CAMPAIGN_RULES]
+        rendered = []
+        for (key, _), hits in zip(CAMPAIGN_RULES, rows):
+            rendered.extend(getattr(self, f"_{key}_insights")(frame, hits))
+
+        rules = np.repeat(np.arange(len(CAMPAIGN_RULES)), [len(r) for r in rows])
+        rows = np.concatenate(rows)
+        severity = np.array([SEVERITY_ORDER[s] for _, s in CAMPAIGN_RULES])[rules]
+        order = np.lexsort((rules, rows, severity) if by_severity else (rules, rows))
+
+        severity_counts = {name: 0 for name in SEVERITY_ORDER}
+        for (_, name), hits in zip(CAMPAIGN_RULES, np.bincount(rules, minlength=len(CAMPAIGN_RULES)).tolist()):
+            severity_counts[name] += hits
+        return [rendered[i] for i in order.tolist()], severity_counts
+
+    def _low_roas_insights(self, frame: OrgFeatureFrame, rows: np.ndarray) -> List[dict]:
+        return [
+            {
                 "type": "alert",
                 "severity": "critical",
                 "title": f"Low ROAS on {name}",
                 "description": f"{name} has a ROAS of {roas:.2f}x, meaning you're losing money on ad spend. Immediate action recommended.",
                 "affected_campaigns": [cid],
                 "suggested_action": "Consider pausing this campaign or significantly reducing budget until creative/targeting is optimized.",
-            })
-        elif prev_roas > 0 and (roas - prev_roas) / prev_roas < -0.2:
-            insights.append({
+            }
+            for cid, name, roas in zip(*frame.labels(rows), frame.roas[rows].tolist())
+        ]
+
+    def _roas_decline_insights(self, frame: OrgFeatureFrame, rows: np.ndarray) -> List[dict]:
+        return [
+            {
                 "type": "trend",
                 "severity": "warning",
                 "title": f"ROAS declining on {name}",
                 "description": f"{name} ROAS dropped from {prev_roas:.2f}x to {roas:.2f}x ({((roas-prev_roas)/prev_roas*100):.1f}% change).",
                 "affected_campaigns": [cid],
                 "suggested_action": "Review recent creative changes and audience targeting. Consider A/B testing new creatives.",
-            })
+            }
+            for cid, name, roas, prev_roas in zip(
+                *frame.labels(rows), frame.roas[rows].tolist(), frame.prev_roas[rows].tolist()
+            )
+        ]
 
-        # CPC analysis
-        cpc = campaign.get("cpc", 0)
-        prev_cpc = campaign.get("prev_cpc", cpc)
-        if prev_cpc > 0 and cpc > 0 and (cpc - prev_cpc) / prev_cpc > 0.3:
-            insights.append({
+    def _cpc_spike_insights(self, frame: OrgFeatureFrame, rows: np.ndarray) -> List[dict]:
+        return [
+            {
                 "type": "alert",
                 "severity": "warning",
                 "title": f"CPC spike on {name}",
                 "description": f"Cost per click increased by {((cpc-prev_cpc)/prev_cpc*100):.1f}% from ${prev_cpc:.2f} to ${cpc:.2f}.",
                 "affected_campaigns": [cid],
                 "suggested_action": "Check for audience saturation or increased competition. Refresh creatives and expand targeting.",
-            })
+            }
+            for cid, name, cpc, prev_cpc in zip(
+                *frame.labels(rows), frame.cpc[rows].tolist(), frame.prev_cpc[rows].tolist()
+            )
+        ]
 
-        # CTR analysis
-        ctr = campaign.get("ctr", 0)
-        if ctr < 0.5:
-            insights.append({
+    def _low_ctr_insights(self, frame: OrgFeatureFrame, rows: np.ndarray) -> List[dict]:
+        return [
+            {
                 "type": "alert",
                 "severity": "warning",
                 "title": f"Low CTR on {name}",
                 "description": f"{name} has a CTR of {ctr:.2f}%, which is below industry average. Creative or targeting may need improvement.",
                 "affected_campaigns": [cid],
                 "suggested_action": "Test new ad creatives, headlines, and CTAs. Consider narrowing audience targeting.",
-            })
+            }
+            for cid, name, ctr in zip(*frame.labels(rows), frame.ctr[rows].tolist())
+        ]
 
-        # Spend efficiency
-        spend = campaign.get("spend", 0)
-        conversions = campaign.get("conversions", 0)
-        if spend > 0 and conversions == 0:
-            insights.append({
+    def _no_conversions_insights(self, frame: OrgFeatureFrame, rows: np.ndarray) -> List[dict]:
+        return [
+            {
                 "type": "alert",
                 "severity": "critical",
                 "title": f"No conversions on {name}",
                 "description": f"{name} has spent ${spend:.2f} with zero conversions. This campaign needs immediate attention.",
                 "affected_campaigns": [cid],
                 "suggested_action": "Pause campaign and review conversion tracking, landing page, and targeting setup.",
-            })
-
-        return insights
+            }
+            for cid, name, spend in zip(*frame.labels(rows), frame.spend[rows].tolist())
+        ]
 
-    def _cross_campaign_analysis(self, campaigns: List[dict], time_range: str) -> List[dict]:
+    def _cross_campaign_analysis(self, frame: OrgFeatureFrame, time_range: str) -> List[dict]:
         """Analyze performance across campaigns."""
         insights = []
 
-        meta_campaigns = [c for c in campaigns if c.get("platform") == "meta"]
-        google_campaigns = [c for c in campaigns if c.get("platform") == "google"]
-
-        if meta_campaigns and google_campaigns:
-            meta_roas = np.mean([c.get("roas", 0) for c in meta_campaigns])
-            google_roas = np.mean([c.get("roas", 0) for c in google_campaigns])
+        meta_roas = frame.platform_avg_roas("meta")
+        google_roas = frame.platform_avg_roas("google")
 
+        if meta_roas is not None and google_roas is not None:
             if abs(meta_roas - google_roas) > 0.5:
                 better = "Meta" if meta_roas > google_roas else "Google"
                 worse = "Google" if meta_roas > google_roas else "Meta"
@@ -181,7 +269,7 @@ class InsightService:
                     "severity": "info",
                     "title": f"{better} outperforming {worse}",
                     "description": f"{better} campaigns average {max(meta_roas, google_roas):.2f}x ROAS vs {min(meta_roas, google_roas):.2f}x on {worse} (difference: {diff:.2f}x).",
-                    "affected_campaigns": [c.get("campaign_id", 0) for c in campaigns],
+                    "affected_campaigns": list(frame.campaign_ids),
                     "suggested_action": f"Consider shifting budget from {worse} to {better} to improve overall ROAS.",
                 })
 
@@ -237,33 +325,31 @@ class InsightService:
             }
         return None
 
-    def _generate_recommendations(self, campaigns: List[dict], existing_insights: List[dict]) -> List[dict]:
+    def _generate_recommendations(self, frame: OrgFeatureFrame) -> List[dict]:
         """Generate actionable recommendations."""
         recommendations = []
 
-        if campaigns:
-            top = max(campaigns, key=lambda c: c.get("roas", 0))
-            if top.get("roas", 0) > 2.0:
+        if frame.count:
+            top = int(np.argmax(np.where(np.isnan(frame.roas), -np.inf, frame.roas)))
+            if frame.roas[top] > 2.0:
                 recommendations.append({
                     "type": "recommendation",
                     "severity": "info",
-                    "title": f"Scale top performer: {top.get('name', 'Campaign ' + str(top.get('campaign_id', 0)))}",
-                    "description": f"This campaign has a strong ROAS of {top.get('roas', 0):.2f}x. Consider increasing its budget by 20-30% to capture more conversions.",
-                    "affected_campaigns": [top.get("campaign_id", 0)],
+                    "title": f"Scale top performer: {frame.name(top)}",
+                    "description": f"This campaign has a strong ROAS of {frame.roas[top]:.2f}x. Consider increasing its budget by 20-30% to capture more conversions.",
+                    "affected_campaigns": [frame.campaign_ids[top]],
                     "suggested_action": "Increase daily budget by 20% and monitor for 3-5 days.",
                 })
 
         return recommendations
 
-    def _generate_summary(self, insights: List[dict], campaigns: List[dict]) -> str:
+    def _generate_summary(self, frame: OrgFeatureFrame, severity_counts: Dict[str, int]) -> str:
         """Generate overall summary."""
-        critical = len([i for i in insights if i.get("severity") == "critical"])
-        warnings = len([i for i in insights if i.get("severity") == "warning"])
-        total_spend = sum(c.get("spend", 0) for c in campaigns)
-        avg_roas = np.mean([c.get("roas", 0) for c in campaigns]) if campaigns else 0
+        critical = severity_counts["critical"]
+        warnings = severity_counts["warning"]
 
-        parts = [f"Analysis of {len(campaigns)} campaign(s) with ${total_spend:,.2f} total spend."]
-        parts.append(f"Average ROAS: {avg_roas:.2f}x.")
+        parts = [f"Analysis of {frame.count} campaign(s) with ${frame.total_spend:,.2f} total spend."]
+        parts.append(f"Average ROAS: {frame.avg_roas:.2f}x.")
 
         if critical:
             parts.append(f"{critical} critical issue(s) require immediate attention.")
@@ -274,45 +360,43 @@ class InsightService:
 
         return " ".join(parts)
 
-    def _generate_ai_summary(self, campaigns: List[dict], insights: List[dict]) -> Optional[str]:
+    async def _generate_ai_summary(
+        self,
+        frame: OrgFeatureFrame,
+        insights: List[dict],
+        severity_counts: Dict[str, int],
+        use_cache: bool = True,
+    ) -> Optional[str]:
         """Generate AI-powered executive summary."""
-        try:
-            from openai import OpenAI
-            client = OpenAI()
-
-            context = json.dumps({
-                "campaign_count": len(campaigns),
-                "total_spend": sum(c.get("spend", 0) for c in campaigns),
-                "avg_roas": float(np.mean([c.get("roas", 0) for c in campaigns])) if campaigns else 0,
-                "critical_issues": len([i for i in insights if i.get("severity") == "critical"]),
-                "top_insights": [{"title": i["title"], "severity": i["severity"]} for i in insights[:5]],
-            })
-
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": "You are an expert digital marketing analyst. Provide a concise 2-3 sentence executive summary. Be specific and actionable."},
-                    {"role": "user", "content": f"Summarize this ad portfolio performance:\n{context}"},
-                ],
-                max_tokens=200,
-                temperature=0.3,
-            )
+        portfolio = {
+            "campaign_count": frame.count,
+            "total_spend": frame.total_spend,
+            "avg_roas": frame.avg_roas,
+            "critical_issues": severity_counts["critical"],
+            "top_insights": [{"title": i["title"], "severity": i["severity"]} for i in insights[:5]],
+        }
+        key = self.response_cache.key("summary", "", portfolio)
+        if use_cache:
+            summary = await self.response_cache.get(key)
+            if summary is not None:
+                return summary
 
-            return response.choices[0].message.content.strip()
+        try:
+            context = json.dumps(portfolio)
+            started = time.perf_counter()
+            summary = await self.inflight.do(key, lambda: self.summary_batcher.summarize(context))
+            await self.response_cache.put(key, summary, time.perf_counter() - started)
+            return summary
         except Exception as e:
             logger.warning(f"AI summary generation failed: {e}")
             return None
 
-    def _ask_with_llm(self, question: str, context_data: Dict) -> Dict:
-        """Answer question using LLM."""
+    async def _ask_with_llm(self, question: str, context_data: Dict) -> Dict:
+        """Answer question using LLM, falling back to rules on timeout or error."""
         try:
-            from openai import OpenAI
-            client = OpenAI()
-
             context = json.dumps(context_data, indent=2, default=str)
 
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
+            answer = await self.llm.chat(
                 messages=[
                     {"role": "system", "content": "You are an expert digital marketing analyst. Answer questions about ad performance data concisely and accurately. Use specific numbers."},
                     {"role": "user", "content": f"Data:\n{context}\n\nQuestion: {question}"},
@@ -323,9 +407,12 @@ class InsightService:
 
             return {
                 "question": question,
-                "answer": response.choices[0].message.content.strip(),
+                "answer": answer,
                 "source": "ai",
             }
+        except LLMTimeout as e:
+            logger.warning(f"LLM answer timed out, using rule-based fallback: {e}")
+            return self._ask_rule_based(question, context_data)
         except Exception as e:
             return self._ask_rule_based(question, context_data)
 
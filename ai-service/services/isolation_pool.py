@@ -0,0 +1,206 @@
+"""
+Isolation Forest Pool
+=====================
+Shared Isolation Forests fitted once per metric (and optionally platform) on
+pooled, per-series normalized values, instead of one forest per request.
+
+Because the forest sees a single feature, its decision function is a step
+function of the value: constant between consecutive split thresholds. After
+each fit that step function is tabulated once, so scoring a series is a
+binary search per point rather than a traversal of every tree. Forests are
+refit on a schedule or when the flagged-point rate drifts. Fits run on a
+background thread (one per key at a time) and are swapped in when done;
+requests meanwhile score with the current forest, or get None before the
+first fit.
+"""
+
+import os
+import time
+import threading
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from services import backends
+
+logger = logging.getLogger(__name__)
+
+POOL_N_ESTIMATORS = int(os.getenv("ANOMALY_POOL_N_ESTIMATORS", "100"))
+POOL_N_JOBS = int(os.getenv("ANOMALY_POOL_N_JOBS", "1"))
+POOL_CONTAMINATION = float(os.getenv("ANOMALY_POOL_CONTAMINATION", "0.02"))
+POOL_MIN_SAMPLES = int(os.getenv("ANOMALY_POOL_MIN_SAMPLES", "500"))
+POOL_MAX_SAMPLES = int(os.getenv("ANOMALY_POOL_MAX_SAMPLES", "50000"))
+POOL_REFIT_SECONDS = float(os.getenv("ANOMALY_POOL_REFIT_SECONDS", "86400"))
+# Refit when the observed anomaly rate exceeds this multiple of the contamination
+POOL_DRIFT_FACTOR = float(os.getenv("ANOMALY_POOL_DRIFT_FACTOR", "3.0"))
+POOL_DRIFT_WINDOW = 5000
+
+
+class PooledForest:
+    """A fitted forest plus its tabulated decision function."""
+
+    def __init__(self, model, n_samples: int):
+        self.model = model
+        self.n_samples = n_samples
+        self.fitted_at = time.time()
+        self.scored_points = 0
+        self.flagged_points = 0
+
+        thresholds = np.unique(np.concatenate([
+            tree.tree_.threshold[tree.tree_.feature >= 0] for tree in model.estimators_
+        ]))
+        # Trees compare float32 inputs with "x <= threshold"; take the largest
+        # float32 inside each interval as its representative point.
+        upper = thresholds.astype(np.float32)
+        upper = np.where(upper.astype(np.float64) > thresholds, np.nextafter(upper, np.float32(-np.inf)), upper)
+        last = np.nextafter(np.float32(thresholds[-1] if len(thresholds) else 0.0), np.float32(np.inf))
+        points = np.append(upper, last).astype(np.float64)
+        self.thresholds = thresholds
+        self.table = model.decision_function(points.reshape(-1, 1))
+
+    def decision_function(self, values: np.ndarray) -> np.ndarray:
+        x = np.asarray(values, dtype=np.float32).astype(np.float64)
+        return self.table[np.searchsorted(self.thresholds, x, side="left")]
+
+
+class IsolationForestPool:
+    def __init__(
+        self,
+        n_estimators: int = POOL_N_ESTIMATORS,
+        n_jobs: int = POOL_N_JOBS,
+        contamination: float = POOL_CONTAMINATION,
+        min_samples: int = POOL_MIN_SAMPLES,
+        max_samples: int = POOL_MAX_SAMPLES,
+        refit_seconds: float = POOL_REFIT_SECONDS,
+    ):
+        self.n_estimators = n_estimators
+        self.n_jobs = n_jobs
+        self.contamination = contamination
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.refit_seconds = refit_seconds
+        self.forests: Dict[Tuple, PooledForest] = {}
+        self._samples: Dict[Tuple, np.ndarray] = {}
+        self._seen: Dict[Tuple, int] = {}
+        self._rng = np.random.default_rng(42)
+        self._lock = threading.Lock()
+        self._refitting: Dict[Tuple, threading.Thread] = {}
+
+    def observe(self, key: Tuple, normalized: np.ndarray) -> None:
+        """Add normalized values to the pooled training sample (reservoir-sampled)."""
+        normalized = np.asarray(normalized, dtype=np.float64).ravel()
+        with self._lock:
+            pool = self._samples.get(key, np.empty(0))
+            seen = self._seen.get(key, 0)
+            room = self.max_samples - len(pool)
+            if room > 0:
+                pool = np.concatenate([pool, normalized[:room]])
+            rest = normalized[max(room, 0):]
+            if len(rest):
+                # Algorithm R, vectorized: item number t replaces a random slot with probability max/t
+                t = seen + max(room, 0) + np.arange(1, len(rest) + 1)
+                slots = (self._rng.random(len(rest)) * t).astype(np.int64)
+                keep = slots < self.max_samples
+                pool[slots[keep]] = rest[keep]
+            self._samples[key] = pool
+            self._seen[key] = seen + len(normalized)
+
+    def score(self, key: Tuple, normalized: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Decision scores (negative = anomalous), or None while no forest is
+        available. Never fits inline: a due refit is started in the background.
+        """
+        forest = self._forest_for(key)
+        if forest is None:
+            return None
+        scores = forest.decision_function(normalized)
+        forest.scored_points += scores.size
+        forest.flagged_points += int(np.count_nonzero(scores < 0))
+        return scores
+
+    def refit(self, key: Tuple) -> Optional[PooledForest]:
+        """Fit a forest on the pooled sample for this key."""
+        IsolationForest = backends.load("sklearn").IsolationForest
+
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None or len(sample) < self.min_samples:
+                return None
+            sample = sample.copy()
+
+        started = time.perf_counter()
+        model = IsolationForest(
+            n_estimators=self.n_estimators,
+            contamination=self.contamination,
+            n_jobs=self.n_jobs,
+            random_state=42,
+        )
+        model.fit(sample.reshape(-1, 1))
+        forest = PooledForest(model, len(sample))
+        with self._lock:
+            self.forests[key] = forest
+        logger.info(f"Fitted pooled Isolation Forest for {key} on {len(sample)} points in {time.perf_counter() - started:.2f}s")
+        return forest
+
+    def wait_for_refits(self, timeout: Optional[float] = None) -> None:
+        """Block until in-flight background refits finish."""
+        with self._lock:
+            threads = list(self._refitting.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            forests = dict(self.forests)
+            samples = {key: len(pool) for key, pool in self._samples.items()}
+            refitting = len(self._refitting)
+        return {
+            "n_estimators": self.n_estimators,
+            "contamination": self.contamination,
+            "refits_in_progress": refitting,
+            "forests": [
+                {
+                    "key": list(key),
+                    "training_points": forest.n_samples,
+                    "fitted_at": forest.fitted_at,
+                    "scored_points": forest.scored_points,
+                    "anomaly_rate": round(forest.flagged_points / forest.scored_points, 4) if forest.scored_points else 0.0,
+                }
+                for key, forest in forests.items()
+            ],
+            "pooled_samples": {"/".join(str(k) for k in key): n for key, n in samples.items()},
+        }
+
+    def _forest_for(self, key: Tuple) -> Optional[PooledForest]:
+        forest = self.forests.get(key)
+        if forest is None or self._needs_refit(forest):
+            self._refit_in_background(key)
+        return forest
+
+    def _refit_in_background(self, key: Tuple) -> None:
+        """Start a refit for this key unless one is running or the sample is too small."""
+        with self._lock:
+            sample = self._samples.get(key)
+            if key in self._refitting or sample is None or len(sample) < self.min_samples:
+                return
+            thread = threading.Thread(target=self._run_refit, args=(key,), name=f"isolation-refit-{key}", daemon=True)
+            self._refitting[key] = thread
+        thread.start()
+
+    def _run_refit(self, key: Tuple) -> None:
+        try:
+            self.refit(key)
+        except Exception as e:
+            logger.warning(f"Pooled Isolation Forest refit for {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._refitting.pop(key, None)
+
+    def _needs_refit(self, forest: PooledForest) -> bool:
+        if time.time() - forest.fitted_at > self.refit_seconds:
+            return True
+        if forest.scored_points >= POOL_DRIFT_WINDOW:
+            rate = forest.flagged_points / forest.scored_points
+            return rate > self.contamination * POOL_DRIFT_FACTOR
+        return False
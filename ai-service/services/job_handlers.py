@@ -0,0 +1,65 @@
+"""
+Job Handlers
+============
+Background job kinds and the service calls behind them. Batch handlers work
+through their requests in slices, reporting progress and checking for
+cancellation between slices.
+"""
+
+import os
+from typing import Dict, List
+
+from services.job_queue import JobContext, JobQueue
+
+# Anomaly series per detect_batch call inside a job
+JOB_DETECT_SLICE = int(os.getenv("AI_JOB_DETECT_SLICE", "256"))
+
+
+def register_job_handlers(queue: JobQueue, forecast_service, batch_engine, anomaly_service, budget_service) -> None:
+    def predict_slice(requests: List[Dict]) -> List[Dict]:
+        # Vectorized in-process paths first, the process pool for the rest
+        results = forecast_service.predict_batch_vectorized(requests)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            for i, result in zip(pending, batch_engine.predict_batch([requests[i] for i in pending])):
+                results[i] = result
+        return results
+
+    def batch_predict(payload: Dict, job: JobContext) -> Dict:
+        # One slice holds a full chunk per pool worker on average (campaigns are routed by id)
+        size = batch_engine.max_workers * batch_engine.chunk_size
+        predictions = _run_sliced(payload["requests"], size, predict_slice, job)
+        return {"predictions": predictions}
+
+    def train_global(payload: Dict, job: JobContext) -> Dict:
+        return forecast_service.train_global_xgboost(payload["requests"])
+
+    def batch_detect(payload: Dict, job: JobContext) -> Dict:
+        results = _run_sliced(payload["requests"], JOB_DETECT_SLICE, anomaly_service.detect_batch, job)
+        return {"results": results}
+
+    def forecast_budget(payload: Dict, job: JobContext) -> Dict:
+        return forecast_service.forecast_budget(**payload)
+
+    def forecast_budget_batch(payload: Dict, job: JobContext) -> Dict:
+        return forecast_service.forecast_budget_batch(**payload)
+
+    def optimize_budget(payload: Dict, job: JobContext) -> Dict:
+        return budget_service.optimize(**payload)
+
+    queue.register("forecast.batch_predict", batch_predict)
+    queue.register("anomaly.batch_detect", batch_detect)
+    queue.register("forecast.train_global", train_global)
+    queue.register("forecast.budget", forecast_budget)
+    queue.register("forecast.budget_batch", forecast_budget_batch)
+    queue.register("budget.optimize", optimize_budget)
+
+
+def _run_sliced(requests: List[Dict], size: int, run, job: JobContext) -> List[Dict]:
+    results = []
+    job.progress(0, len(requests))
+    for start in range(0, len(requests), size):
+        job.check_cancelled()
+        results.extend(run(requests[start:start + size]))
+        job.progress(len(results), len(requests))
+    return results
@@ -0,0 +1,261 @@
+"""
+Job Queue
+=========
+Background jobs for runs that outlast a synchronous HTTP call (large batch
+forecasts, portfolio-wide detection, budget runs). Jobs are queued in
+process by priority and executed by a bounded set of workers. Status,
+progress and results live in SQLite, so any service worker on the host can
+answer a poll. Finished jobs expire after a TTL.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import itertools
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from services.fast_json import dumps
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("AI_JOB_DB_PATH", "/tmp/paramads-ai/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("AI_JOB_MAX_QUEUED", "1000"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("AI_JOB_RESULT_TTL_SECONDS", "86400"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+STATUS_COLUMNS = (
+    "id", "kind", "status", "priority", "progress_done", "progress_total",
+    "error", "created_at", "started_at", "finished_at", "expires_at",
+)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """Handed to job handlers to report progress and honour cancellation."""
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self.queue = queue
+        self.job_id = job_id
+
+    def progress(self, done: int, total: int) -> None:
+        self.queue._execute(
+            "UPDATE jobs SET progress_done = ?, progress_total = ? WHERE id = ?",
+            (done, total, self.job_id),
+        )
+
+    def check_cancelled(self) -> None:
+        job = self.queue.get(self.job_id)
+        if job is None or job["status"] == CANCELLED:
+            raise JobCancelled()
+
+
+class JobQueue:
+    def __init__(
+        self,
+        db_path: str = JOB_DB_PATH,
+        workers: int = JOB_WORKERS,
+        max_queued: int = JOB_MAX_QUEUED,
+        result_ttl: float = JOB_RESULT_TTL_SECONDS,
+    ):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.handlers: Dict[str, Callable[[Any, JobContext], Any]] = {}
+        self._payloads: Dict[str, Any] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, priority INTEGER NOT NULL, "
+                "progress_done INTEGER NOT NULL DEFAULT 0, progress_total INTEGER NOT NULL DEFAULT 0, "
+                "result TEXT, error TEXT, owner_pid INTEGER NOT NULL, created_at REAL NOT NULL, "
+                "started_at REAL, finished_at REAL, expires_at REAL)"
+            )
+            self._db.commit()
+        self._fail_orphaned_jobs()
+
+    def register(self, kind: str, handler: Callable[[Any, JobContext], Any]) -> None:
+        """Handlers run in a thread: handler(payload, context) -> JSON-serializable result."""
+        self.handlers[kind] = handler
+
+    async def submit(self, kind: str, payload: Any, priority: int = 0) -> dict:
+        """Queue a job; higher priority runs first, FIFO within a priority."""
+        if kind not in self.handlers:
+            raise KeyError(f"Unknown job kind '{kind}'")
+        self._start_workers()
+        if self._queue.qsize() >= self.max_queued:
+            raise QueueFull(f"Job queue is full ({self.max_queued} jobs waiting)")
+
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, priority, owner_pid, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, QUEUED, priority, os.getpid(), time.time()),
+        )
+        self._payloads[job_id] = payload
+        await self._queue.put((-priority, next(self._seq), job_id))
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Status and progress, or None for unknown or expired jobs."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(STATUS_COLUMNS)} FROM jobs WHERE id = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                (job_id, time.time()),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def result(self, job_id: str) -> Optional[dict]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        job["result"] = json.loads(row["result"]) if row is not None and row["result"] is not None else None
+        return job
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued or running job; running handlers stop at their next check."""
+        now = time.time()
+        self._execute(
+            f"UPDATE jobs SET status = ?, finished_at = ?, expires_at = ? "
+            f"WHERE id = ? AND status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+            (CANCELLED, now, now + self.result_ttl, job_id, *ACTIVE_STATUSES),
+        )
+        self._payloads.pop(job_id, None)
+        return self.get(job_id)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),)).rowcount
+            self._db.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs WHERE expires_at IS NULL OR expires_at >= ? GROUP BY status",
+                (time.time(),),
+            ).fetchall()
+        return {
+            "workers": self.workers,
+            "queued_in_this_process": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.max_queued,
+            "result_ttl_seconds": self.result_ttl,
+            "jobs": {row["status"]: row["n"] for row in rows},
+            "kinds": sorted(self.handlers),
+        }
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs this process accepted but never finished cannot resume
+        self._execute(
+            f"UPDATE jobs SET status = ?, error = ?, finished_at = ?, expires_at = ? "
+            f"WHERE owner_pid = ? AND status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+            (FAILED, "Interrupted by service shutdown", time.time(), time.time() + self.result_ttl,
+             os.getpid(), *ACTIVE_STATUSES),
+        )
+        with self._lock:
+            self._db.close()
+
+    def _start_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job_id = await self._queue.get()
+            payload = self._payloads.pop(job_id, None)
+            job = self.get(job_id)
+            if payload is None or job is None or job["status"] != QUEUED:
+                continue
+
+            self._execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED),
+            )
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(None, self.handlers[job["kind"]], payload, JobContext(self, job_id))
+            except JobCancelled:
+                logger.info(f"Job {job_id} cancelled after {time.perf_counter() - started:.1f}s")
+                continue
+            except Exception as e:
+                logger.warning(f"Job {job_id} ({job['kind']}) failed: {e}")
+                self._finish(job_id, FAILED, error=f"{type(e).__name__}: {e}")
+                continue
+            self._finish(job_id, SUCCEEDED, result=dumps(result).decode())
+            logger.info(f"Job {job_id} ({job['kind']}) finished in {time.perf_counter() - started:.1f}s")
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        now = time.time()
+        # A job cancelled while its handler was finishing stays cancelled
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, expires_at = ? WHERE id = ? AND status = ?",
+            (status, result, error, now, now + self.result_ttl, job_id, RUNNING),
+        )
+
+    def _fail_orphaned_jobs(self) -> None:
+        """Mark active jobs whose owning process is gone (crash or restart) as failed."""
+        with self._lock:
+            owners = [row["owner_pid"] for row in self._db.execute(
+                f"SELECT DISTINCT owner_pid FROM jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+                ACTIVE_STATUSES,
+            )]
+        for pid in owners:
+            if pid == os.getpid() or not _process_alive(pid):
+                now = time.time()
+                self._execute(
+                    f"UPDATE jobs SET status = ?, error = ?, finished_at = ?, expires_at = ? "
+                    f"WHERE owner_pid = ? AND status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+                    (FAILED, "Interrupted by service restart", now, now + self.result_ttl, pid, *ACTIVE_STATUSES),
+                )
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,192 @@
+"""
+LLM Request Coalescing
+======================
+Single-flight deduplication of identical in-flight LLM requests, and a
+micro-batcher that folds distinct executive-summary prompts arriving within
+a short window into one completion. A scheduled job generating summaries
+for hundreds of organizations then costs roughly N / batch_size provider
+calls instead of N.
+"""
+
+import os
+import re
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from services.llm_client import AsyncLLMClient
+
+logger = logging.getLogger(__name__)
+
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "50"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+
+SUMMARY_SYSTEM_PROMPT = "You are an expert digital marketing analyst. Provide a concise 2-3 sentence executive summary. Be specific and actionable."
+BATCH_SYSTEM_PROMPT = (
+    "You are an expert digital marketing analyst. For each ad portfolio below, write a concise "
+    "2-3 sentence executive summary. Be specific and actionable. Respond with only a JSON object "
+    "mapping each portfolio id to its summary string."
+)
+SUMMARY_MAX_TOKENS = 200
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when there are no followers
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+
+class SummaryBatcher:
+    """Collects summary prompts for up to window_ms and sends them as one completion."""
+
+    def __init__(
+        self,
+        llm: AsyncLLMClient,
+        window_ms: float = LLM_BATCH_WINDOW_MS,
+        max_batch: int = LLM_BATCH_MAX_SIZE,
+    ):
+        self.llm = llm
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.prompts = 0
+        self.batches = 0
+        self.fallbacks = 0
+
+    async def summarize(self, context: str) -> str:
+        """Executive summary for one portfolio context (a JSON string)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((context, future))
+        self.prompts += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "prompts": self.prompts,
+            "llm_calls": self.batches + self.fallbacks,
+            "batches": self.batches,
+            "fallback_calls": self.fallbacks,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+        }
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        self.batches += 1
+        try:
+            if len(batch) == 1:
+                summaries = {0: await self._summarize_one(batch[0][0])}
+            else:
+                summaries = await self._summarize_many([context for context, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        missing = [i for i in range(len(batch)) if i not in summaries]
+        if missing:
+            # The model dropped or garbled some entries; ask for those one by one
+            logger.warning(f"Batched summary response missing {len(missing)}/{len(batch)} entries, retrying individually")
+            self.fallbacks += len(missing)
+            results = await asyncio.gather(
+                *(self._summarize_one(batch[i][0]) for i in missing),
+                return_exceptions=True,
+            )
+            summaries.update(zip(missing, results))
+
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            result = summaries[i]
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _summarize_one(self, context: str) -> str:
+        return await self.llm.chat(
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Summarize this ad portfolio performance:\n{context}"},
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0.3,
+        )
+
+    async def _summarize_many(self, contexts: List[str]) -> Dict[int, str]:
+        portfolios = "\n".join(f"[{i}] {context}" for i, context in enumerate(contexts))
+        content = await self.llm.chat(
+            messages=[
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Portfolios:\n{portfolios}"},
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS * len(contexts),
+            temperature=0.3,
+        )
+        return parse_batch_response(content, len(contexts))
+
+
+def parse_batch_response(content: str, n: int) -> Dict[int, str]:
+    """Extract {index: summary} from a batched reply, ignoring anything malformed."""
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    summaries = {}
+    for key, value in data.items():
+        try:
+            index = int(str(key).strip("[] "))
+        except ValueError:
+            continue
+        if 0 <= index < n and isinstance(value, str) and value.strip():
+            summaries[index] = value.strip()
+    return summaries
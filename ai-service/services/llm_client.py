@@ -0,0 +1,150 @@
+"""
+Async LLM Client
+================
+Non-blocking client for OpenAI-compatible chat completion APIs.
+One pooled httpx.AsyncClient per service, a global concurrency limit,
+an optional requests-per-minute limit, per-call timeouts, and retry with
+exponential backoff on rate limits, server errors and transport failures.
+Point OPENAI_BASE_URL at a local stub server (scripts/fake_llm.py) to
+exercise it without the real provider.
+"""
+
+import os
+import asyncio
+import random
+import logging
+from typing import List, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1-nano")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "15"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # 0 = unlimited
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class RateLimiter:
+    """Spaces calls evenly so at most per_minute start in any minute."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncLLMClient:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = LLM_BASE_URL,
+        model: str = LLM_MODEL,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff: float = LLM_BACKOFF_SECONDS,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._transport = transport
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = RateLimiter(requests_per_minute)
+        self.calls = 0
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def chat(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 200,
+        temperature: float = 0.3,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Run one chat completion and return the stripped message content."""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        timeout = timeout or self.timeout
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self._rate_limiter.acquire()
+                self.calls += 1
+                try:
+                    response = await asyncio.wait_for(
+                        self._http().post("/chat/completions", json=payload),
+                        timeout=timeout,
+                    )
+                except asyncio.TimeoutError:
+                    error = LLMTimeout(f"LLM call timed out after {timeout:g}s")
+                    retry_after = None
+                except httpx.TransportError as e:
+                    error = LLMError(f"LLM transport error: {e}")
+                    retry_after = None
+                else:
+                    if response.status_code == 200:
+                        return response.json()["choices"][0]["message"]["content"].strip()
+                    error = LLMError(f"LLM returned HTTP {response.status_code}")
+                    if response.status_code not in RETRYABLE_STATUS:
+                        raise error
+                    retry_after = response.headers.get("retry-after")
+
+                if attempt == self.max_retries:
+                    raise error
+                await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=None,  # enforced per call with asyncio.wait_for
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                transport=self._transport,
+            )
+        return self._client
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
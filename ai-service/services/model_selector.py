@@ -0,0 +1,109 @@
+"""
+Forecast Model Selection
+========================
+Chooses which forecasting models to try for a series instead of always
+walking Prophet -> XGBoost -> statistical. Candidates are filtered by series
+length, variance, backend availability, recent failures for the same series
+shape, and an optional latency budget compared against learned fit times.
+"""
+
+import os
+import threading
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from services import backends
+from services.cache import TTLCache
+from services.exp_smoothing import ETS_MIN_POINTS
+
+logger = logging.getLogger(__name__)
+
+PROPHET_MIN_POINTS = int(os.getenv("FORECAST_PROPHET_MIN_POINTS", "30"))
+XGBOOST_MIN_POINTS = int(os.getenv("FORECAST_XGBOOST_MIN_POINTS", "14"))
+# Coefficient of variation below which a series is treated as flat
+FLAT_CV = float(os.getenv("FORECAST_FLAT_CV", "0.01"))
+FAILURE_TTL_SECONDS = float(os.getenv("FORECAST_FAILURE_TTL_SECONDS", "3600"))
+
+# Model -> backend it needs (None = pure NumPy)
+MODEL_BACKENDS = {"prophet": "prophet", "xgboost": "xgboost", "ets": None, "statistical": None}
+MODEL_MIN_POINTS = {"prophet": PROPHET_MIN_POINTS, "xgboost": XGBOOST_MIN_POINTS, "ets": ETS_MIN_POINTS}
+# Initial fit-time estimates in ms, refined by an EWMA of observed fits
+DEFAULT_FIT_MS = {"prophet": 2000.0, "xgboost": 200.0, "ets": 10.0, "statistical": 1.0}
+FIT_MS_SMOOTHING = 0.2
+
+
+class ModelSelector:
+    def __init__(self, failure_ttl: float = FAILURE_TTL_SECONDS):
+        self.fit_ms = dict(DEFAULT_FIT_MS)
+        self.failures = TTLCache(max_entries=4096, ttl_seconds=failure_ttl, max_bytes=1024 * 1024)
+        self._lock = threading.Lock()
+
+    def shape(self, values: np.ndarray) -> Tuple[int, str]:
+        """Coarse series shape used to remember failures: (log2 length bucket, variance class)."""
+        values = np.asarray(values, dtype=np.float64)
+        mean, std = abs(values.mean()), values.std()
+        cv = std / mean if mean > 0 else (0.0 if std == 0 else np.inf)
+        if cv < FLAT_CV:
+            variability = "flat"
+        elif cv < 0.5:
+            variability = "normal"
+        else:
+            variability = "volatile"
+        return int(np.log2(max(1, len(values)))), variability
+
+    def candidates(
+        self,
+        values: np.ndarray,
+        max_latency_ms: Optional[float] = None,
+        model: Optional[str] = None,
+        prefitted: Tuple[str, ...] = (),
+    ) -> List[str]:
+        """
+        Models worth trying, most capable first; "statistical" is always last.
+        A requested model is tried first if the series supports it. Models in
+        `prefitted` need no per-series fit and are exempt from the latency budget.
+        """
+        n = len(values)
+        shape = self.shape(values)
+        if shape[1] == "flat":
+            return ["statistical"]
+
+        if model is not None and model in MODEL_BACKENDS:
+            if model == "statistical":
+                return ["statistical"]
+            usable = n >= MODEL_MIN_POINTS[model] and (
+                MODEL_BACKENDS[model] is None or backends.is_available(MODEL_BACKENDS[model])
+            )
+            return [model, "statistical"] if usable else ["statistical"]
+
+        models = []
+        for name, min_points in MODEL_MIN_POINTS.items():
+            if n < min_points or (name, shape) in self.failures:
+                continue
+            if max_latency_ms is not None and name not in prefitted and self.fit_ms[name] > max_latency_ms:
+                continue
+            if MODEL_BACKENDS[name] is not None and not backends.is_available(MODEL_BACKENDS[name]):
+                continue
+            models.append(name)
+        models.append("statistical")
+        return models
+
+    def record_fit(self, model: str, fit_ms: float) -> None:
+        with self._lock:
+            self.fit_ms[model] += FIT_MS_SMOOTHING * (fit_ms - self.fit_ms[model])
+
+    def record_failure(self, model: str, values: np.ndarray, error: Exception) -> None:
+        shape = self.shape(values)
+        logger.info(f"{model} failed for series shape {shape}, skipping it for similar series: {error}")
+        self.failures.put((model, shape), repr(error), size=0)
+
+    def stats(self) -> dict:
+        return {
+            "estimated_fit_ms": {model: round(ms, 2) for model, ms in self.fit_ms.items()},
+            "remembered_failures": [
+                {"model": model, "length_bucket": shape[0], "variability": shape[1], "error": error}
+                for (model, shape), error in self.failures.items()
+            ],
+        }
@@ -0,0 +1,170 @@
+"""
+LLM Response Cache
+==================
+Caches LLM answers and summaries keyed by a normalized question plus a
+canonical hash of the context data. Entries live in a TTL/LRU TTLCache and
+can optionally be persisted to SQLite (WAL) so they survive restarts and are
+shared by all workers on the host. SQLite reads and writes run in the
+default executor, never on the event loop, and a failed one counts as a
+miss. Tracks hit ratio and the LLM latency saved by hits.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import logging
+from typing import Any, Optional
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "900"))
+RESPONSE_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # SQLite file; unset = memory only
+
+CONTRACTIONS = {"what's": "what is", "how's": "how is", "where's": "where is", "who's": "who is", "it's": "it is"}
+SYNONYMS = {
+    "return on ad spend": "roas",
+    "return on adspend": "roas",
+    "cost per acquisition": "cpa",
+    "cost per click": "cpc",
+    "click through rate": "ctr",
+    "click-through rate": "ctr",
+}
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "my", "our", "me", "us", "i", "we", "you",
+    "please", "can", "could", "would", "tell", "show", "give", "what", "whats", "how", "much",
+    "do", "does", "did", "of", "for", "to", "in", "on", "right", "now", "currently", "current",
+}
+
+
+def normalize_question(question: str) -> str:
+    """Collapse trivially different phrasings of the same question to one form."""
+    q = question.lower().strip()
+    for short, full in CONTRACTIONS.items():
+        q = q.replace(short, full)
+    for phrase, canonical in SYNONYMS.items():
+        q = q.replace(phrase, canonical)
+    tokens = re.findall(r"[a-z0-9_.%$]+", q)
+    tokens = [t.rstrip(".") for t in tokens if t not in STOPWORDS]
+    return " ".join(t for t in tokens if t)
+
+
+def canonical_hash(data: Any) -> str:
+    """Order-independent hash of JSON-like data."""
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        path: Optional[str] = RESPONSE_CACHE_PATH,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=256 * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._lock = threading.Lock()
+        # Separate from the counters' lock: a write waiting on busy_timeout in
+        # the executor must not hold up lookups on the event loop
+        self._db_lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Autocommit; each statement is its own transaction
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            with self._db_lock:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA busy_timeout=5000")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, latency REAL NOT NULL, expires_at REAL NOT NULL)"
+                )
+
+    def key(self, kind: str, question: str, context: Any) -> str:
+        return f"{kind}:{canonical_hash(normalize_question(question))}:{canonical_hash(context)}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self.memory.get(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.get_running_loop().run_in_executor(None, self._load, key)
+            if entry is not None:
+                # Only for the rest of the stored entry's lifetime
+                self.memory.put(key, entry, ttl_seconds=entry.pop("expires_at") - time.time())
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.latency_saved += entry["latency"]
+        return entry["value"]
+
+    async def put(self, key: str, value: Any, latency: float) -> None:
+        self.memory.put(key, {"value": value, "latency": latency})
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._store, key, value, latency)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.memory),
+                "persistent": self._db is not None,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            except sqlite3.Error as e:
+                logger.warning(f"Could not purge expired LLM responses: {e}")
+            self._db.close()
+            self._db = None
+
+    def _load(self, key: str) -> Optional[dict]:
+        """Stored entry with its expires_at, or None if missing, expired or unreadable."""
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return None
+                row = self._db.execute(
+                    "SELECT value, latency, expires_at FROM responses WHERE key = ? AND expires_at >= ?",
+                    (key, time.time()),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache read failed, treating as a miss: {e}")
+            return None
+        if row is None:
+            return None
+        return {"value": json.loads(row[0]), "latency": row[1], "expires_at": row[2]}
+
+    def _store(self, key: str, value: Any, latency: float) -> None:
+        """Persist an entry; a failure is logged and the entry stays in memory only."""
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, latency, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), latency, time.time() + self.ttl_seconds),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache write failed, keeping the entry in memory only: {e}")
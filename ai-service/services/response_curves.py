@@ -0,0 +1,217 @@
+"""
+Spend Response Curves
+=====================
+Vectorized spend -> revenue response curves for many campaigns at once.
+Campaign histories are packed into a (campaigns x days) matrix, right-aligned
+and NaN-padded, and every campaign is fitted in the same array pass:
+
+- log_linear: revenue = a * ln(max(spend, 1)) + b, closed-form least squares
+- hill: revenue = rmax * s^k / (s^k + h^k), a saturating curve fitted over a
+  grid of shape k and half-saturation h (relative to the campaign's median
+  spend); rmax has a closed form for each grid point
+- auto: whichever of the two has the lower AIC per campaign
+
+Scenario grids are evaluated as one (campaigns x scenarios) matrix and
+optimal budgets solve marginal ROAS = target ROAS per campaign. Both curves
+are linear in their fitted scale given the budget (a and b, or rmax), so
+linear_form exposes them as slope * basis(budget) + intercept with the
+fit's standard errors for simulation.
+"""
+
+import os
+from typing import Dict, List
+
+import numpy as np
+
+CURVES = ("log_linear", "hill", "auto")
+HILL_SHAPES = (0.5, 1.0, 1.5, 2.0, 3.0)
+HILL_HALF_SATURATION = np.geomspace(0.25, 8.0, 12)  # x median spend
+CURVE_CAMPAIGNS_PER_PASS = int(os.getenv("FORECAST_CURVE_CAMPAIGNS_PER_PASS", "512"))
+BISECTION_ITERATIONS = 60
+
+
+def pack(series: List[np.ndarray]) -> np.ndarray:
+    """Right-align 1-D arrays into a NaN-padded (len(series) x longest) matrix."""
+    width = max((len(s) for s in series), default=0)
+    packed = np.full((len(series), width), np.nan)
+    for row, s in enumerate(series):
+        if len(s):
+            packed[row, width - len(s):] = s
+    return packed
+
+
+def fit(spend: np.ndarray, revenue: np.ndarray, curve: str = "auto") -> Dict[str, np.ndarray]:
+    """Fit the requested curve family to every row; returns per-campaign parameters."""
+    if curve not in CURVES:
+        raise ValueError(f"Unknown curve '{curve}', expected one of {', '.join(CURVES)}")
+    mask = ~(np.isnan(spend) | np.isnan(revenue))
+    n = mask.sum(axis=1)
+    spend = np.where(mask, spend, 0.0)
+    revenue = np.where(mask, revenue, 0.0)
+
+    fitted = _fit_log_linear(spend, revenue, mask, n)
+    if curve != "log_linear":
+        hill = {}
+        for start in range(0, len(spend), CURVE_CAMPAIGNS_PER_PASS):
+            block = slice(start, start + CURVE_CAMPAIGNS_PER_PASS)
+            for key, value in _fit_hill(spend[block], revenue[block], mask[block]).items():
+                hill.setdefault(key, []).append(value)
+        fitted.update({key: np.concatenate(parts) for key, parts in hill.items()})
+
+    if curve == "log_linear":
+        fitted["is_hill"] = np.zeros(len(spend), dtype=bool)
+    elif curve == "hill":
+        fitted["is_hill"] = np.ones(len(spend), dtype=bool)
+    else:
+        with np.errstate(divide="ignore"):
+            nn = np.maximum(n, 1)
+            aic_log = nn * np.log(np.maximum(fitted["sse_log"], 1e-12) / nn) + 4
+            aic_hill = nn * np.log(np.maximum(fitted["sse_hill"], 1e-12) / nn) + 6
+        fitted["is_hill"] = aic_hill < aic_log
+    return fitted
+
+
+def evaluate(fitted: Dict[str, np.ndarray], budgets: np.ndarray) -> np.ndarray:
+    """Revenue at each budget; budgets is (campaigns x scenarios)."""
+    log_value = fitted["a"][:, None] * np.log(np.maximum(budgets, 1)) + fitted["b"][:, None]
+    if "rmax" not in fitted:
+        return log_value
+    return np.where(fitted["is_hill"][:, None], _hill(fitted, budgets), log_value)
+
+
+def optimal_budget(fitted: Dict[str, np.ndarray], target_roas: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """
+    Budget where marginal ROAS falls to target_roas, clipped to [lower, upper].
+    Log-linear: a / s = target. Hill: bisection on the falling side of its
+    marginal curve; campaigns that never reach the target get `lower`.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_optimal = np.where(target_roas > 0, fitted["a"] / target_roas, np.nan)
+    optimal = np.clip(np.nan_to_num(log_optimal, nan=0.0), lower, upper)
+    if "rmax" not in fitted or not fitted["is_hill"].any():
+        return optimal
+
+    k, h = fitted["k"], fitted["h"]
+    # Hill marginal ROAS peaks at h * ((k-1)/(k+1))^(1/k) for k > 1 and falls after it
+    peak = np.where(k > 1, h * (np.maximum(k - 1, 0) / (k + 1)) ** (1 / k), 0.0)
+    lo = np.maximum(lower, peak)
+    hi = np.maximum(upper, lo)
+    reaches = _hill_marginal(fitted, lo) >= target_roas
+    for _ in range(BISECTION_ITERATIONS):
+        mid = (lo + hi) / 2
+        above = _hill_marginal(fitted, mid) >= target_roas
+        lo = np.where(above, mid, lo)
+        hi = np.where(above, hi, mid)
+    hill_optimal = np.where(reaches, lo, lower)
+    return np.where(fitted["is_hill"], np.clip(hill_optimal, lower, upper), optimal)
+
+
+def linear_form(fitted: Dict[str, np.ndarray], budgets: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Revenue at budgets (campaigns x allocations) as slope * basis + intercept.
+    slope ~ N(slope, slope_se); the intercept's error is intercept_loading
+    times the slope's standard normal plus an independent intercept_se term
+    that also carries the daily residual noise.
+    """
+    log_basis = np.log(np.maximum(budgets, 1))
+    loading = np.where(fitted["se_a"] > 0, fitted["cov_ab"] / np.where(fitted["se_a"] > 0, fitted["se_a"], 1), 0.0)
+    form = {
+        "basis": log_basis,
+        "slope": fitted["a"],
+        "slope_se": fitted["se_a"],
+        "intercept": fitted["b"],
+        "intercept_loading": loading,
+        "intercept_se": np.sqrt(np.maximum(fitted["se_b"] ** 2 - loading ** 2, 0) + fitted["sigma_log"] ** 2),
+    }
+    if "rmax" not in fitted or not fitted["is_hill"].any():
+        return form
+    is_hill = fitted["is_hill"]
+    unit = dict(fitted, rmax=np.ones(len(is_hill)))
+    return {
+        "basis": np.where(is_hill[:, None], _hill(unit, budgets), log_basis),
+        "slope": np.where(is_hill, fitted["rmax"], fitted["a"]),
+        "slope_se": np.where(is_hill, fitted["rmax_se"], fitted["se_a"]),
+        "intercept": np.where(is_hill, 0.0, fitted["b"]),
+        "intercept_loading": np.where(is_hill, 0.0, loading),
+        "intercept_se": np.where(is_hill, fitted["sigma_hill"], form["intercept_se"]),
+    }
+
+
+def _fit_log_linear(spend, revenue, mask, n) -> Dict[str, np.ndarray]:
+    x = np.where(mask, np.log(np.maximum(spend, 1)), 0.0)
+    nn = np.maximum(n, 1)
+    x_mean = x.sum(axis=1) / nn
+    y_mean = revenue.sum(axis=1) / nn
+    dx = np.where(mask, x - x_mean[:, None], 0.0)
+    dy = np.where(mask, revenue - y_mean[:, None], 0.0)
+    sxx = (dx * dx).sum(axis=1)
+    a = np.where(sxx > 0, (dx * dy).sum(axis=1) / np.where(sxx > 0, sxx, 1), 0.0)
+    b = y_mean - a * x_mean
+    residual = np.where(mask, revenue - (a[:, None] * x + b[:, None]), 0.0)
+    sse = (residual * residual).sum(axis=1)
+    # OLS parameter covariance: sigma^2 / sxx * [[1, -x_mean], [-x_mean, sxx / n + x_mean^2]]
+    sigma2 = sse / np.maximum(n - 2, 1)
+    scale = np.where(sxx > 0, sigma2 / np.where(sxx > 0, sxx, 1), 0.0)
+    return {
+        "a": a,
+        "b": b,
+        "sse_log": sse,
+        "se_a": np.sqrt(scale),
+        "se_b": np.sqrt(sigma2 / nn + scale * x_mean * x_mean),
+        "cov_ab": -scale * x_mean,
+        "sigma_log": np.sqrt(sigma2),
+    }
+
+
+def _fit_hill(spend, revenue, mask) -> Dict[str, np.ndarray]:
+    median = np.nanmedian(np.where(mask & (spend > 0), spend, np.nan), axis=1)
+    median = np.where(np.isnan(median), 1.0, median)
+    k = np.repeat(HILL_SHAPES, len(HILL_HALF_SATURATION))
+    h = median[:, None] * np.tile(HILL_HALF_SATURATION, len(HILL_SHAPES))[None, :]  # (c x grid)
+
+    # g = s^k / (s^k + h^k) = 1 / (1 + (h/s)^k), for every campaign x grid point x day.
+    # With h = m * median, (h/s)^k = m^k * (median/s)^k: one power per shape, not per grid point.
+    valid = mask & (spend > 0)
+    base = np.where(valid, median[:, None] / np.where(valid, spend, 1.0), 0.0)
+    g = np.empty((len(spend), len(k), spend.shape[1]))
+    with np.errstate(over="ignore"):
+        for j, shape in enumerate(HILL_SHAPES):
+            powered = base ** shape
+            cols = slice(j * len(HILL_HALF_SATURATION), (j + 1) * len(HILL_HALF_SATURATION))
+            g[:, cols, :] = 1 / (1 + (HILL_HALF_SATURATION ** shape)[None, :, None] * powered[:, None, :])
+    g *= valid[:, None, :]
+    y = revenue[:, None, :]
+    sgy = (g * y).sum(axis=2)
+    sgg = (g * g).sum(axis=2)
+    rmax = np.maximum(np.where(sgg > 0, sgy / np.where(sgg > 0, sgg, 1), 0.0), 0)
+    syy = (revenue * revenue).sum(axis=1)[:, None]
+    sse = syy - 2 * rmax * sgy + rmax * rmax * sgg
+
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(len(spend))
+    sse_best, sgg_best = np.maximum(sse[rows, best], 0), sgg[rows, best]
+    # rmax is least squares given (k, h): its standard error is sigma / sqrt(sum g^2)
+    sigma = np.sqrt(sse_best / np.maximum(mask.sum(axis=1) - 3, 1))
+    return {
+        "rmax": rmax[rows, best],
+        "k": k[best],
+        "h": h[rows, best],
+        "sse_hill": sse[rows, best],
+        "rmax_se": np.where(sgg_best > 0, sigma / np.sqrt(np.where(sgg_best > 0, sgg_best, 1)), 0.0),
+        "sigma_hill": sigma,
+    }
+
+
+def _hill(fitted, budgets):
+    k, h = fitted["k"][:, None], fitted["h"][:, None]
+    s = np.maximum(budgets, 0)
+    with np.errstate(divide="ignore", over="ignore"):
+        return fitted["rmax"][:, None] * np.where(s > 0, 1 / (1 + (h / np.where(s > 0, s, 1)) ** k), 0.0)
+
+
+def _hill_marginal(fitted, s):
+    rmax, k, h = fitted["rmax"], fitted["k"], fitted["h"]
+    s = np.maximum(s, 1e-9)
+    ratio = (h / s) ** k
+    # d/ds [rmax / (1 + (h/s)^k)] = rmax * k * (h/s)^k / (s * (1 + (h/s)^k)^2)
+    return rmax * k * ratio / (s * (1 + ratio) ** 2)
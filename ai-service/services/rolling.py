@@ -0,0 +1,187 @@
+"""
+Rolling Statistics
+==================
+Trailing-window statistics shared by anomaly detection and forecasting.
+Mean/std are O(n) from cumulative sums over the last axis (so whole batches
+of series run at once). The robust median/MAD variant partitions every
+window in blocks for small windows; larger ones keep a sorted window, which
+costs O(log w) comparisons plus an O(w) memmove per step, O(n * w) in total
+but with a small enough constant that per-step cost stays near flat up to
+windows of ~50k (see scripts/bench_rolling.py). RollingStats is the
+streaming form for one point at a time.
+"""
+
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Scale factor making the MAD a consistent estimator of the standard deviation
+MAD_SCALE = 1.4826
+# Windows up to this size are partitioned directly; measured crossover with the sorted window
+MEDIAN_VECTORIZED_MAX_WINDOW = 200
+# Window elements materialised per block by the vectorized median path
+MEDIAN_BLOCK_ELEMENTS = 4_000_000
+
+
+def rolling_mean(values, window: int) -> np.ndarray:
+    """Mean of every trailing window along the last axis (length n - window + 1)."""
+    values = np.asarray(values, dtype=np.float64)
+    csum = np.cumsum(values, axis=-1)
+    csum = np.concatenate([np.zeros(values.shape[:-1] + (1,)), csum], axis=-1)
+    return (csum[..., window:] - csum[..., :-window]) / window
+
+
+def rolling_mean_std(values, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean and population std of every trailing window along the last axis.
+    Values are centred per series before the cumulative sums to keep the
+    sum-of-squares cancellation error small; windows whose variance is within
+    rounding error of zero are reported as exactly zero.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    shift = values.mean(axis=-1, keepdims=True)
+    centred = values - shift
+    pad = np.zeros(values.shape[:-1] + (1,))
+    s1 = np.concatenate([pad, np.cumsum(centred, axis=-1)], axis=-1)
+    s2 = np.concatenate([pad, np.cumsum(centred * centred, axis=-1)], axis=-1)
+
+    window_sum = s1[..., window:] - s1[..., :-window]
+    window_sq = s2[..., window:] - s2[..., :-window]
+    mean = window_sum / window
+    var = window_sq / window - mean * mean
+
+    tolerance = 64 * np.finfo(np.float64).eps * n * s2[..., -1:] / max(1, window)
+    var = np.where(var <= tolerance, 0.0, var)
+    return mean + shift, np.sqrt(var)
+
+
+def rolling_median_mad(values, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Median and (unscaled) median absolute deviation of every trailing window
+    along the last axis.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if window <= MEDIAN_VECTORIZED_MAX_WINDOW:
+        return _median_mad_windows(values, window)
+    if values.ndim > 1:
+        pairs = [rolling_median_mad(row, window) for row in values.reshape(-1, values.shape[-1])]
+        shape = values.shape[:-1] + (values.shape[-1] - window + 1,)
+        return (
+            np.array([p[0] for p in pairs]).reshape(shape),
+            np.array([p[1] for p in pairs]).reshape(shape),
+        )
+
+    x = values.tolist()
+    medians = np.empty(len(x) - window + 1)
+    mads = np.empty(len(x) - window + 1)
+    ordered = sorted(x[:window])
+    for out, i in enumerate(range(window - 1, len(x))):
+        if i >= window:
+            del ordered[bisect_left(ordered, x[i - window])]
+            insort(ordered, x[i])
+        medians[out], mads[out] = _median_mad_sorted(ordered)
+    return medians, mads
+
+
+def _median_mad_windows(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Median/MAD of every window by partitioning, in blocks of rows and windows."""
+    rows = values.reshape(-1, values.shape[-1])
+    out_len = rows.shape[-1] - window + 1
+    medians = np.empty((len(rows), out_len))
+    mads = np.empty((len(rows), out_len))
+    row_step = max(1, MEDIAN_BLOCK_ELEMENTS // (window * out_len))
+    time_step = max(1, MEDIAN_BLOCK_ELEMENTS // (window * row_step))
+    for r in range(0, len(rows), row_step):
+        windows = sliding_window_view(rows[r:r + row_step], window, axis=-1)
+        for t in range(0, out_len, time_step):
+            block = windows[:, t:t + time_step]
+            median = np.median(block, axis=-1)
+            medians[r:r + row_step, t:t + time_step] = median
+            mads[r:r + row_step, t:t + time_step] = np.median(np.abs(block - median[..., None]), axis=-1)
+    shape = values.shape[:-1] + (out_len,)
+    return medians.reshape(shape), mads.reshape(shape)
+
+
+def _median_mad_sorted(ordered: list) -> Tuple[float, float]:
+    """Median and MAD of a sorted list in O(log n) without materialising deviations."""
+    n = len(ordered)
+    half = n // 2
+    median = ordered[half] if n % 2 else (ordered[half - 1] + ordered[half]) / 2
+
+    # Absolute deviations form two ascending sequences: left of the median
+    # (read backwards) and right of it. The MAD is the median of their merge.
+    split = bisect_left(ordered, median)
+
+    def left(j):
+        return median - ordered[split - 1 - j]
+
+    def right(j):
+        return ordered[split + j] - median
+
+    n_left, n_right = split, n - split
+    mad = _kth_of_two(left, n_left, right, n_right, half)
+    if n % 2 == 0:
+        mad = (mad + _kth_of_two(left, n_left, right, n_right, half - 1)) / 2
+    return median, mad
+
+
+def _kth_of_two(a, n_a: int, b, n_b: int, k: int) -> float:
+    """k-th smallest (0-based) element of two ascending sequences given as accessors."""
+    lo, hi = max(0, k + 1 - n_b), min(k + 1, n_a)
+    while lo < hi:
+        i = (lo + hi) // 2
+        j = k + 1 - i
+        if j > 0 and i < n_a and b(j - 1) > a(i):
+            lo = i + 1
+        else:
+            hi = i
+    i, j = lo, k + 1 - lo
+    if i == 0:
+        return b(j - 1)
+    if j == 0:
+        return a(i - 1)
+    return max(a(i - 1), b(j - 1))
+
+
+class RollingStats:
+    """Streaming trailing-window mean/variance with O(1) Welford add/remove updates."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.buffer = deque(maxlen=window)
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, value: float) -> None:
+        if len(self.buffer) == self.window:
+            self._remove(self.buffer[0])
+        self.buffer.append(value)
+        count = len(self.buffer)
+        delta = value - self.mean
+        self.mean += delta / count
+        self._m2 += delta * (value - self.mean)
+
+    def _remove(self, value: float) -> None:
+        count = len(self.buffer) - 1
+        if count == 0:
+            self.mean, self._m2 = 0.0, 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / count
+        self._m2 -= delta * (value - self.mean)
+
+    @property
+    def count(self) -> int:
+        return len(self.buffer)
+
+    @property
+    def variance(self) -> float:
+        return max(0.0, self._m2 / len(self.buffer)) if self.buffer else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
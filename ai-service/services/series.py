@@ -0,0 +1,103 @@
+"""
+Columnar Series
+===============
+Dense time series as a float64 array plus a start date and frequency, the
+compact alternative to lists of {date, value} dicts. Values can come from a
+JSON array, raw little-endian float64 bytes, or an Arrow IPC stream; binary
+bodies are wrapped with np.frombuffer without copying. Date strings are only
+materialized when a result needs them.
+"""
+
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from services import backends
+
+# Supported frequencies -> step in days
+FREQUENCIES = {"D": 1, "W": 7}
+
+RAW_CONTENT_TYPES = ("application/octet-stream", "application/x-float64")
+ARROW_CONTENT_TYPES = ("application/vnd.apache.arrow.stream", "application/vnd.apache.arrow.file")
+
+
+class Series:
+    def __init__(self, values: np.ndarray, dates: Optional[Sequence[str]] = None, start_date: Optional[str] = None, freq: str = "D"):
+        self.values = values
+        self.start_date = start_date
+        self.freq = freq
+        self._dates = dates
+
+    @classmethod
+    def from_points(cls, points: List[dict]) -> "Series":
+        """The classic [{date, value}, ...] format."""
+        values = np.fromiter((float(d["value"]) for d in points), dtype=np.float64, count=len(points))
+        return cls(values, dates=[d["date"] for d in points])
+
+    @classmethod
+    def from_values(cls, values, start_date: str, freq: str = "D") -> "Series":
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unsupported freq '{freq}', expected one of {sorted(FREQUENCIES)}")
+        if not start_date:
+            raise ValueError("start_date is required with columnar values")
+        try:
+            np.datetime64(start_date, "D")
+        except ValueError:
+            raise ValueError(f"Invalid start_date '{start_date}', expected YYYY-MM-DD")
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim != 1:
+            raise ValueError("values must be a one-dimensional array")
+        return cls(values, start_date=start_date, freq=freq)
+
+    @classmethod
+    def from_bytes(cls, body: bytes, start_date: str, freq: str = "D", content_type: Optional[str] = None) -> "Series":
+        """Raw little-endian float64 (zero-copy) or an Arrow IPC stream/file."""
+        media_type = (content_type or RAW_CONTENT_TYPES[0]).split(";")[0].strip().lower()
+        if media_type in ARROW_CONTENT_TYPES:
+            return cls.from_values(_arrow_values(body, media_type), start_date, freq)
+        if media_type not in RAW_CONTENT_TYPES:
+            raise ValueError(f"Unsupported content type '{media_type}'")
+        if len(body) % 8:
+            raise ValueError(f"Body of {len(body)} bytes is not a whole number of float64 values")
+        return cls.from_values(np.frombuffer(body, dtype="<f8"), start_date, freq)
+
+    @property
+    def dates(self) -> List[str]:
+        if self._dates is None:
+            start = np.datetime64(self.start_date, "D")
+            offsets = np.arange(len(self.values)) * FREQUENCIES[self.freq]
+            self._dates = np.datetime_as_string(start + offsets, unit="D").tolist()
+        return self._dates
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def as_series(data: Union[Series, List[dict]]) -> Series:
+    return data if isinstance(data, Series) else Series.from_points(data)
+
+
+def resolve_series(
+    points: Optional[List[dict]],
+    values: Optional[List[float]] = None,
+    start_date: Optional[str] = None,
+    freq: str = "D",
+) -> Union[Series, List[dict]]:
+    """Pick the request's encoding: columnar values + start_date, or the dict points."""
+    if values is not None:
+        return Series.from_values(values, start_date, freq)
+    if points is None:
+        raise ValueError("Provide either the {date, value} points or values + start_date")
+    return points
+
+
+def _arrow_values(body: bytes, media_type: str) -> np.ndarray:
+    pa = backends.load("pyarrow")
+    buffer = pa.py_buffer(body)
+    if media_type.endswith(".file"):
+        table = pa.ipc.open_file(buffer).read_all()
+    else:
+        table = pa.ipc.open_stream(buffer).read_all()
+    column = table.column("value") if "value" in table.column_names else table.column(0)
+    # Zero-copy for a single null-free float64 chunk, otherwise converted once
+    return column.combine_chunks().to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
@@ -0,0 +1,314 @@
+"""
+Streaming Anomaly Detection
+===========================
+Stateful, per-(campaign_id, metric) anomaly detection for pushed points.
+Each series keeps running mean/variance, an EWMA and a rolling-window ring
+buffer, so every new point is scored in O(1) without resending history.
+State lives in SQLite (WAL) shared by every service worker on the host: a
+push reads, scores and writes its series in one write transaction, so
+points for one series may land on any worker. Idle series expire and the
+oldest are evicted beyond the series cap.
+"""
+
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+import logging
+from typing import List, Optional
+
+from services.fast_json import dumps
+from services.rolling import RollingStats
+
+logger = logging.getLogger(__name__)
+
+STREAM_MAX_SERIES = int(os.getenv("ANOMALY_STREAM_MAX_SERIES", "100000"))
+STREAM_IDLE_TTL_SECONDS = float(os.getenv("ANOMALY_STREAM_IDLE_TTL_SECONDS", str(14 * 86400)))
+STREAM_STATE_DIR = os.getenv("ANOMALY_STREAM_STATE_DIR", "/tmp/paramads-ai")
+STREAM_DB_PATH = os.getenv("ANOMALY_STREAM_DB_PATH", os.path.join(STREAM_STATE_DIR, "anomaly_stream.sqlite3"))
+STREAM_WINDOW = int(os.getenv("ANOMALY_STREAM_WINDOW", "7"))
+STREAM_EWMA_ALPHA = float(os.getenv("ANOMALY_STREAM_EWMA_ALPHA", "0.3"))
+# Points required before a series starts producing verdicts (matches detect())
+STREAM_MIN_POINTS = 5
+# How often each worker expires idle series and enforces the series cap
+STREAM_PURGE_INTERVAL_SECONDS = 60.0
+
+
+class SeriesState:
+    """Online statistics for one metric stream."""
+
+    def __init__(self, window: int = STREAM_WINDOW, alpha: float = STREAM_EWMA_ALPHA):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = 0.0
+        self.ewm_var = 0.0
+        self.rolling = RollingStats(window)
+        self.last_date = None
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def score(self, date: str, value: float, sensitivity: float) -> dict:
+        """Score a point against the state built from the points before it."""
+        checks = []
+        if self.count >= STREAM_MIN_POINTS:
+            if self.std > 0:
+                checks.append(("zscore", self.mean, abs(value - self.mean) / self.std))
+            if self.rolling.std > 0:
+                checks.append(("rolling_window", self.rolling.mean, abs(value - self.rolling.mean) / self.rolling.std))
+            if self.ewm_var > 0:
+                checks.append(("ewma", self.ewma, abs(value - self.ewma) / math.sqrt(self.ewm_var)))
+
+        flagged = [c for c in checks if c[2] > sensitivity]
+        method, expected, deviation = max(flagged or checks or [("none", value, 0.0)], key=lambda c: c[2])
+
+        verdict = {
+            "date": date,
+            "value": round(float(value), 4),
+            "is_anomaly": bool(flagged),
+            "expected_value": round(float(expected), 4),
+            "deviation": round(float(deviation), 2),
+            "deviation_percent": round(float((value - expected) / max(1, abs(expected)) * 100), 1),
+        }
+        if flagged:
+            verdict.update({
+                "severity": "critical" if deviation > sensitivity * 1.5 else "warning",
+                "direction": "spike" if value > expected else "drop",
+                "method": method,
+                "detected_by": [c[0] for c in flagged],
+            })
+        return verdict
+
+    def update(self, date: str, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.count == 1:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            self.ewma += self.alpha * diff
+            self.ewm_var = (1 - self.alpha) * (self.ewm_var + self.alpha * diff * diff)
+
+        self.rolling.push(value)
+        self.last_date = date
+
+    def to_dict(self) -> dict:
+        return {
+            "alpha": self.alpha,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "ewma": self.ewma,
+            "ewm_var": self.ewm_var,
+            "window": self.rolling.window,
+            "window_values": list(self.rolling.buffer),
+            "last_date": self.last_date,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SeriesState":
+        state = cls(window=data["window"], alpha=data["alpha"])
+        state.count = data["count"]
+        state.mean = data["mean"]
+        state.m2 = data["m2"]
+        state.ewma = data["ewma"]
+        state.ewm_var = data["ewm_var"]
+        for value in data["window_values"]:
+            state.rolling.push(value)
+        state.last_date = data["last_date"]
+        return state
+
+
+class StreamingAnomalyDetector:
+    def __init__(
+        self,
+        db_path: str = STREAM_DB_PATH,
+        state_dir: Optional[str] = STREAM_STATE_DIR,
+        max_series: int = STREAM_MAX_SERIES,
+        idle_ttl: float = STREAM_IDLE_TTL_SECONDS,
+    ):
+        self.state_dir = state_dir
+        self.max_series = max_series
+        self.idle_ttl = idle_ttl
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Autocommit; push() opens its own write transaction
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS stream_states ("
+                "campaign_id INTEGER NOT NULL, metric TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (campaign_id, metric))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS stream_states_updated ON stream_states (updated_at)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS stream_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def push(self, campaign_id: int, metric: str, points: List[dict], sensitivity: float = 2.0) -> dict:
+        """Score and absorb new points; points at or before the last seen date are skipped."""
+        verdicts = []
+        skipped = 0
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so concurrent pushes for a
+            # series from other workers apply one after another
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT state FROM stream_states WHERE campaign_id = ? AND metric = ? AND updated_at >= ?",
+                    (campaign_id, metric, now - self.idle_ttl),
+                ).fetchone()
+                state = SeriesState.from_dict(json.loads(row[0])) if row is not None else SeriesState()
+                for point in points:
+                    date, value = point["date"], float(point["value"])
+                    if state.last_date is not None and date <= state.last_date:
+                        skipped += 1
+                        continue
+                    verdicts.append(state.score(date, value, sensitivity))
+                    state.update(date, value)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO stream_states (campaign_id, metric, state, updated_at) VALUES (?, ?, ?, ?)",
+                    (campaign_id, metric, dumps(state.to_dict()).decode(), now),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self._maybe_purge()
+
+        anomalies = [v for v in verdicts if v["is_anomaly"]]
+        return {
+            "campaign_id": campaign_id,
+            "metric": metric,
+            "verdicts": verdicts,
+            "is_anomalous": bool(anomalies),
+            "anomaly_count": len(anomalies),
+            "skipped_points": skipped,
+            "state": {
+                "points_seen": state.count,
+                "mean": round(state.mean, 4),
+                "std": round(state.std, 4),
+                "ewma": round(state.ewma, 4),
+                "last_date": state.last_date,
+            },
+        }
+
+    def close(self) -> None:
+        """State is already persistent; only release the connection."""
+        with self._lock:
+            self._db.close()
+
+    def evict(self, campaign_id: int, metric: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM stream_states WHERE campaign_id = ? AND metric = ?", (campaign_id, metric)
+            ).rowcount > 0
+
+    def snapshot(self, path: Optional[str] = None) -> dict:
+        """Export all live series state to a JSON file atomically."""
+        path = path or self._snapshot_path()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT campaign_id, metric, state FROM stream_states WHERE updated_at >= ?",
+                (time.time() - self.idle_ttl,),
+            ).fetchall()
+        entries = [
+            {"campaign_id": campaign_id, "metric": metric, "state": json.loads(state)}
+            for campaign_id, metric, state in rows
+        ]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"series": entries}, f)
+        os.replace(tmp_path, path)
+        return {"path": path, "series": len(entries)}
+
+    def restore(self, path: Optional[str] = None) -> int:
+        """
+        Import a JSON snapshot into an empty store (e.g. after moving hosts);
+        returns the number of series restored. Workers starting together may
+        all call this: existing series are never overwritten.
+        """
+        path = path or self._snapshot_path()
+        if not os.path.exists(path):
+            return 0
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM stream_states LIMIT 1").fetchone() is not None:
+                return 0
+        try:
+            with open(path) as f:
+                entries = json.load(f)["series"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not restore streaming anomaly state from {path}: {e}")
+            return 0
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO stream_states (campaign_id, metric, state, updated_at) VALUES (?, ?, ?, ?)",
+                [(e["campaign_id"], e["metric"], dumps(e["state"]).decode(), now) for e in entries],
+            )
+            self._db.execute("COMMIT")
+        return len(entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            series = self._db.execute(
+                "SELECT COUNT(*) FROM stream_states WHERE updated_at >= ?", (time.time() - self.idle_ttl,)
+            ).fetchone()[0]
+            counters = dict(self._db.execute("SELECT name, value FROM stream_counters").fetchall())
+        return {
+            "series": series,
+            "max_series": self.max_series,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0),
+        }
+
+    def _maybe_purge(self) -> None:
+        """Drop idle series and the least recently pushed ones beyond max_series."""
+        now = time.time()
+        if now - self._purged_at < STREAM_PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = now
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._db.execute(
+                    "DELETE FROM stream_states WHERE updated_at < ?", (now - self.idle_ttl,)
+                ).rowcount
+                excess = self._db.execute("SELECT COUNT(*) FROM stream_states").fetchone()[0] - self.max_series
+                evicted = 0
+                if excess > 0:
+                    evicted = self._db.execute(
+                        "DELETE FROM stream_states WHERE rowid IN "
+                        "(SELECT rowid FROM stream_states ORDER BY updated_at LIMIT ?)",
+                        (excess,),
+                    ).rowcount
+                for name, count in (("expirations", expired), ("evictions", evicted)):
+                    if count:
+                        self._db.execute(
+                            "INSERT INTO stream_counters (name, value) VALUES (?, ?) "
+                            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                            (name, count),
+                        )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.state_dir, "anomaly_stream_state.json")